@@ -1,11 +1,58 @@
 from flask import Flask
+from config import Config
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
 
 def create_app():
     """Application factory pattern"""
+    logging.basicConfig(level=Config.LOG_LEVEL, format=Config.LOG_FORMAT)
     app = Flask(__name__)
 
     # Register blueprints
     from .routes import bp
     app.register_blueprint(bp)
 
+    # Start the feature worker processes once per server
+    from .alignment import start_feature_pool
+    start_feature_pool()
+
+    # Probe the Pis in the background so /status and /health answer from a cache
+    from .health import get_health_monitor
+    get_health_monitor().start()
+
+    # Index of stored panoramas, evicted in the background
+    from .store import get_store
+    get_store().start()
+
+    # Load the person detector once, /detect reuses it
+    from .detection import load_detector
+    try:
+        load_detector()
+    except Exception as e:
+        logger.error(f"✗ Person detector unavailable: {e}")
+
+    # Reuse the persisted rig calibration, or solve one in the background
+    from .calibration import load_calibration
+    if load_calibration() is None and Config.CALIBRATE_ON_STARTUP:
+        threading.Thread(target=_calibrate_on_startup, name="calibration", daemon=True).start()
+
+    # Continuous capture/stitch loop for /stream and /latest
+    if Config.STREAM_ENABLED:
+        from .streaming import get_stream
+        get_stream().start()
+
     return app
+
+
+def _calibrate_on_startup():
+    """Capture one frame set and calibrate the rig"""
+    from .calibration import calibrate
+    from .pi_client import fetch_images, validate_images
+
+    images = fetch_images()
+    if not validate_images(images):
+        logger.warning("✗ Startup calibration skipped: not all cameras responded")
+        return
+    calibrate(images)
@@ -0,0 +1,450 @@
+import atexit
+import cv2
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from math import fsum
+from numpy import *
+from config import Config
+from .utils import ImageStitching
+from .encoding import decode_image
+from .features import record_detection, record_matching
+from .metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Worker pools for per-camera detection and per-pair matching, created once per server
+_executor = None
+_process_pool = None
+_executor_lock = threading.Lock()
+
+# Timing of the most recent registration, see last_registration_stats
+_last_stats = {}
+
+
+def _get_executor():
+    """Return the shared alignment thread pool"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=Config.ALIGNMENT_WORKERS,
+                thread_name_prefix="alignment"
+            )
+        return _executor
+
+
+def _init_feature_worker():
+    """Keep each worker process single-threaded so the pool owns the cores"""
+    cv2.setNumThreads(1)
+
+
+def _get_pool():
+    """
+    Return the executor that runs detection and matching tasks
+
+    A process pool of Config.FEATURE_PROCESSES workers (None = one per core),
+    or the alignment thread pool when FEATURE_PROCESSES is 0.
+    """
+    global _process_pool
+    processes = Config.FEATURE_PROCESSES
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes == 0:
+        return _get_executor()
+
+    with _executor_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context(Config.FEATURE_POOL_START_METHOD),
+                initializer=_init_feature_worker
+            )
+            atexit.register(_process_pool.shutdown, wait=False, cancel_futures=True)
+            logger.info(f"Started feature pool with {processes} worker processes")
+        return _process_pool
+
+
+def start_feature_pool():
+    """Create the feature pool up front so the first stitch does not pay for it"""
+    _get_pool()
+
+
+def _detect_task(gray, scale=1.0):
+    """
+    Worker task: detect features on one grayscale frame with the configured backend
+
+    Args:
+        gray (numpy array): Grayscale frame
+        scale (float): Factor the frame was resized by, tunes the detector
+
+    Returns:
+        tuple: (points Nx2 float32, descriptors, CPU seconds), compact and cheap to pickle
+    """
+    start = time.thread_time()
+    keypoints, features = ImageStitching._sift_detector(gray, scale)
+    points = cv2.KeyPoint_convert(keypoints) if keypoints else None
+    return points, features, time.thread_time() - start
+
+
+def _detect_encoded_task(data, scale):
+    """
+    Worker task: decode one JPEG straight to grayscale at the working scale, then detect
+
+    Only the compressed bytes cross the process boundary, and the decoder
+    skips colour conversion and most of the full-resolution IDCT work.
+    """
+    start = time.thread_time()
+    points, features, _ = _detect_task(decode_image(data, scale, gray=True), scale)
+    return points, features, time.thread_time() - start
+
+
+def _detect_frame_task(frames, index, scale):
+    """
+    Worker task: detect on one frame of a shared memory FrameSet
+
+    The worker reads the pixels in place, so only the small handle is pickled.
+    Features of a slot that was recycled before or while it was read belong to
+    another capture and count as a failed detection.
+    """
+    start = time.thread_time()
+    if not frames.valid:
+        return None, None, time.thread_time() - start
+    points, features, _ = _detect_task(_prepare_gray(frames.view(index), scale), scale)
+    if not frames.valid:
+        return None, None, time.thread_time() - start
+    return points, features, time.thread_time() - start
+
+
+def _match_task(query_features, train_features, scale):
+    """
+    Worker task: match one adjacent pair and estimate the train -> query homography
+
+    Returns:
+        tuple: (match_pair result or None, CPU seconds)
+    """
+    start = time.thread_time()
+    return match_pair(query_features, train_features, scale), time.thread_time() - start
+
+
+def _prepare_gray(image, scale):
+    """Grayscale, optionally downscaled copy of a BGR frame for detection"""
+    if len(image.shape) == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if scale != 1.0:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return image
+
+
+def reads_frame_buffers():
+    """
+    True when detect_features hands shared memory frames to worker processes
+
+    With Config.REGISTRATION_DECODE "reduced" the workers decode the JPEG
+    bytes instead, and feature threads (FEATURE_PROCESSES = 0) use the
+    decoded frames directly, so a shared copy would never be read.
+    """
+    return Config.REGISTRATION_DECODE != "reduced" and Config.FEATURE_PROCESSES != 0
+
+
+def detect_features(images, scale=1.0, encoded=None, frames=None):
+    """
+    Detect features once on every original frame, in parallel
+
+    Args:
+        images (list): BGR frames in rig order
+        scale (float): Detect on frames resized by this factor
+        encoded (list): JPEG bytes of the frames; with Config.REGISTRATION_DECODE
+            "reduced" the workers decode these to grayscale at scale instead
+        frames (FrameSet): Shared memory handle of images; worker processes
+            then read the frames in place instead of receiving pickled copies
+
+    Returns:
+        list: (points, features, elapsed) per frame, points/features None where detection failed
+    """
+    pool = _get_pool()
+    if encoded is not None and Config.REGISTRATION_DECODE == "reduced":
+        return list(pool.map(_detect_encoded_task, encoded, [scale] * len(encoded)))
+    if frames is not None and isinstance(pool, ProcessPoolExecutor):
+        return list(pool.map(_detect_frame_task, [frames] * len(frames), range(len(frames)), [scale] * len(frames)))
+    return list(pool.map(_detect_task, [_prepare_gray(image, scale) for image in images], [scale] * len(images)))
+
+
+def match_pair(query_features, train_features, scale=1.0):
+    """
+    Match one adjacent pair and estimate the train -> query homography
+
+    Args:
+        query_features (tuple): (points, features) of the left/query frame
+        train_features (tuple): (points, features) of the right/train frame
+        scale (float): Scale the features were detected at
+
+    Returns:
+        tuple: (homography, points_train, points_query, inlier_mask) at full resolution, or None
+    """
+    points_query_image, features_query_image = query_features[:2]
+    points_train_image, features_train_image = train_features[:2]
+    if features_train_image is None or features_query_image is None:
+        return None
+
+    matches = ImageStitching.create_and_match_keypoints(features_train_image, features_query_image)
+    M = ImageStitching.compute_homography(
+        points_train_image, points_query_image, matches,
+        reprojThresh=Config.REPROJ_THRESHOLD
+    )
+    if M is None:
+        return None
+
+    (matches, H, status) = M
+    points_train = points_train_image[matches[:, 0]] / scale
+    points_query = points_query_image[matches[:, 1]] / scale
+    S = diag([scale, scale, 1.0])
+    H = linalg.inv(S) @ H @ S
+    return H, points_train, points_query, status.ravel().astype(bool)
+
+
+def _subpixel_peak(response, x, y):
+    """Refine an integer correlation peak with a parabola fit along each axis"""
+    dx = dy = 0.0
+    if 0 < x < response.shape[1] - 1:
+        left, centre, right = response[y, x - 1], response[y, x], response[y, x + 1]
+        denominator = left - 2 * centre + right
+        if denominator != 0:
+            dx = 0.5 * (left - right) / denominator
+    if 0 < y < response.shape[0] - 1:
+        top, centre, bottom = response[y - 1, x], response[y, x], response[y + 1, x]
+        denominator = top - 2 * centre + bottom
+        if denominator != 0:
+            dy = 0.5 * (top - bottom) / denominator
+    return x + dx, y + dy
+
+
+def refine_homography(H, query_gray, train_gray, points_train, scale):
+    """
+    Refine a homography estimated at working resolution against full-resolution frames
+
+    Each inlier train point is re-located in the query frame by correlating a
+    small full-resolution patch around the position predicted by H, and the
+    homography is re-fitted on the refined correspondences.
+
+    Args:
+        H (numpy array): Full-resolution train -> query homography
+        query_gray (numpy array): Full-resolution grayscale query frame
+        train_gray (numpy array): Full-resolution grayscale train frame
+        points_train (numpy array): Inlier train points at full resolution
+        scale (float): Working resolution the homography was estimated at
+
+    Returns:
+        numpy array: Refined homography, or H when too few points could be refined
+    """
+    half = Config.REFINE_PATCH_SIZE // 2
+    search = int(ceil(2 / scale)) + 2
+    height_query, width_query = query_gray.shape[:2]
+    height_train, width_train = train_gray.shape[:2]
+
+    # Spread the refined points over the whole overlap instead of the strongest cluster
+    step = maximum(1, len(points_train) // Config.REFINE_MAX_POINTS)
+    points_train = points_train[::step][:Config.REFINE_MAX_POINTS]
+    predicted = cv2.perspectiveTransform(points_train.reshape(-1, 1, 2), H).reshape(-1, 2)
+
+    sources, targets = [], []
+    for (xt, yt), (xq, yq) in zip(points_train, predicted):
+        xt, yt, xq, yq = int(round(xt)), int(round(yt)), int(round(xq)), int(round(yq))
+        if not (half <= xt < width_train - half and half <= yt < height_train - half):
+            continue
+        if not (half + search <= xq < width_query - half - search and
+                half + search <= yq < height_query - half - search):
+            continue
+
+        patch = train_gray[yt - half:yt + half + 1, xt - half:xt + half + 1]
+        window = query_gray[yq - half - search:yq + half + search + 1,
+                            xq - half - search:xq + half + search + 1]
+        response = cv2.matchTemplate(window, patch, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (x, y) = cv2.minMaxLoc(response)
+        if score < Config.REFINE_MIN_SCORE:
+            continue
+
+        x, y = _subpixel_peak(response, x, y)
+        sources.append((xt, yt))
+        targets.append((xq - search + x, yq - search + y))
+
+    if len(sources) < 2 * Config.MIN_MATCH_COUNT:
+        logger.debug(f"Refinement kept {len(sources)} points, using working-resolution homography")
+        return H
+
+    refined, _ = cv2.findHomography(
+        float32(sources), float32(targets), cv2.RANSAC, Config.REFINE_REPROJ_THRESHOLD
+    )
+    return H if refined is None else refined
+
+
+def estimate_pairwise(images, scale=None, refine=None, encoded=None, frames=None):
+    """
+    Estimate the homography of every adjacent pair from the original frames
+
+    Features are extracted once per frame and the N-1 pairs are matched in
+    parallel on the feature pool, so the cost grows linearly with the number
+    of cameras and spreads across cores. Detection and matching run at the
+    working resolution; the homographies are scaled back to full resolution
+    and optionally refined there.
+
+    Args:
+        images (list): BGR frames in rig order, left to right
+        scale (float): Working resolution factor, defaults to Config.REGISTRATION_SCALE
+        refine (bool): Refine at full resolution, defaults to Config.REGISTRATION_REFINE
+        encoded (list): JPEG bytes of the frames, see detect_features
+        frames (FrameSet): Shared memory handle of images, see detect_features
+
+    Returns:
+        list: match_pair result per pair, None for pairs that failed
+    """
+    global _last_stats
+
+    scale = Config.REGISTRATION_SCALE if scale is None else scale
+    refine = Config.REGISTRATION_REFINE if refine is None else refine
+
+    start = time.perf_counter()
+    pool = _get_pool()
+    features = detect_features(images, scale, encoded, frames)
+    detect_wall = time.perf_counter() - start
+
+    futures = [
+        pool.submit(_match_task, features[i][:2], features[i + 1][:2], scale)
+        for i in range(len(images) - 1)
+    ]
+    results = [future.result() for future in futures]
+    match_wall = time.perf_counter() - start - detect_wall
+
+    for points, _, seconds in features:
+        record_detection(seconds, 0 if points is None else len(points))
+    for result, seconds in results:
+        if result is not None:
+            record_matching(seconds, len(result[3]), int(result[3].sum()))
+    pairs = [r[0] for r in results]
+
+    if refine and scale != 1.0:
+        grays = [_prepare_gray(image, 1.0) for image in images]
+
+        def _refine(i):
+            H, points_train, points_query, status = pairs[i]
+            H = refine_homography(H, grays[i], grays[i + 1], points_train[status], scale)
+            return H, points_train, points_query, status
+
+        executor = _get_executor()
+        pairs = list(executor.map(
+            lambda i: _refine(i) if pairs[i] is not None else None,
+            range(len(pairs))
+        ))
+
+    wall = time.perf_counter() - start
+
+    # Summed task CPU time is what the serial path would have spent
+    serial = fsum([f[2] for f in features] + [r[1] for r in results])
+    _last_stats = {
+        "cameras": len(images),
+        "scale": scale,
+        "detect_wall": detect_wall,
+        "match_wall": match_wall,
+        "refine_wall": wall - detect_wall - match_wall,
+        "wall": wall,
+        "serial": serial,
+    }
+    parallel_wall = detect_wall + match_wall
+    observe_stage("registration", wall)
+    _last_stats["speedup"] = serial / parallel_wall if parallel_wall > 0 else 1.0
+    logger.info(f"Registration of {len(images)} frames at scale {scale}: {wall:.2f}s wall, "
+                f"{serial:.2f}s serial, {_last_stats['speedup']:.1f}x speedup")
+
+    return pairs
+
+
+def last_registration_stats():
+    """Timing of the most recent estimate_pairwise call, reported by /health"""
+    return dict(_last_stats)
+
+
+def reference_camera(camera_count):
+    """Camera every other camera is aligned to, the middle one by default"""
+    if Config.REFERENCE_CAMERA is not None:
+        return Config.REFERENCE_CAMERA
+    return camera_count // 2
+
+
+def global_transforms(homographies, frame_shapes, reference=None):
+    """
+    Chain pairwise homographies to one reference camera and size the canvas
+
+    Args:
+        homographies (list): Entry i maps camera i+1 onto camera i
+        frame_shapes (list): Shapes of the camera frames
+        reference (int): Reference camera index, see reference_camera
+
+    Returns:
+        tuple: (camera -> panorama homographies, (width, height) of the canvas)
+    """
+    camera_count = len(frame_shapes)
+    reference = reference_camera(camera_count) if reference is None else reference
+
+    transforms = [None] * camera_count
+    transforms[reference] = eye(3)
+    for k in range(reference + 1, camera_count):
+        transforms[k] = transforms[k - 1] @ homographies[k - 1]
+    for k in range(reference - 1, -1, -1):
+        transforms[k] = transforms[k + 1] @ linalg.inv(homographies[k])
+
+    # Bounding box of every warped frame
+    projected = []
+    for H, shape in zip(transforms, frame_shapes):
+        height, width = shape[:2]
+        corners = float32([[0, 0], [width, 0], [width, height], [0, height]]).reshape(-1, 1, 2)
+        projected.append(cv2.perspectiveTransform(corners, H).reshape(-1, 2))
+    projected = concatenate(projected)
+
+    x_min, y_min = floor(projected.min(axis=0))
+    x_max, y_max = ceil(projected.max(axis=0))
+    width_panorama, height_panorama = int(x_max - x_min), int(y_max - y_min)
+
+    # Shrink an oversized canvas to the size limits instead of cropping cameras off it
+    max_width, max_height = Config.COMPILED_RIG_MAX_WIDTH, Config.COMPILED_RIG_MAX_HEIGHT
+    fit = float(minimum(1.0, minimum(max_width / width_panorama, max_height / height_panorama)))
+    if fit < 1.0:
+        logger.warning(f"✗ Panorama canvas {width_panorama}x{height_panorama} exceeds "
+                       f"{max_width}x{max_height}, scaling it by {fit:.3f}")
+        width_panorama = int(minimum(ceil(width_panorama * fit), max_width))
+        height_panorama = int(minimum(ceil(height_panorama * fit), max_height))
+
+    T = array([[fit, 0, -x_min * fit], [0, fit, -y_min * fit], [0, 0, 1]], dtype=float64)
+    return [T @ H for H in transforms], (width_panorama, height_panorama)
+
+
+def stitch_aligned(images, encoded=None, frames=None, pairs=None):
+    """
+    Align every frame to the reference camera and compose the panorama in one pass
+
+    Args:
+        images (list): BGR frames in rig order
+        encoded (list): JPEG bytes of the frames for reduced decode, see detect_features
+        frames (FrameSet): Shared memory handle of images, see detect_features
+        pairs (list): estimate_pairwise result for these frames, registered here when None
+
+    Returns:
+        numpy array: Panorama, or None if a pair could not be registered
+    """
+    from .rig import CompiledRig
+
+    start_time = time.time()
+    if pairs is None:
+        pairs = estimate_pairwise(images, encoded=encoded, frames=frames)
+    for i, pair in enumerate(pairs):
+        if pair is None:
+            logger.warning(f"✗ Alignment failed for cameras {i + 1} and {i + 2}")
+            return None
+
+    frame_shapes = [img.shape for img in images]
+    transforms, canvas_size = global_transforms([pair[0] for pair in pairs], frame_shapes)
+    logger.info(f"✓ Aligned {len(images)} frames in {time.time() - start_time:.2f}s")
+
+    return CompiledRig(transforms, frame_shapes, canvas_size).stitch(images)
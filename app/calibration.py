@@ -0,0 +1,303 @@
+import cv2
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from numpy import *
+from config import Config
+from .alignment import estimate_pairwise
+
+logger = logging.getLogger(__name__)
+
+# Bump when the on-disk calibration layout changes
+CALIBRATION_VERSION = 1
+
+# Active calibration shared by every stitch
+_calibration = None
+_calibration_lock = threading.Lock()
+_last_validation = 0.0
+
+# (fingerprint, time) of the last failed calibration, see ensure_calibration
+_last_failure = None
+
+
+class RigCalibration:
+    """Pairwise homographies solved once for a fixed camera rig"""
+
+    def __init__(self, homographies, fingerprint, errors=None, inliers=None,
+                 created_at=None, version=CALIBRATION_VERSION):
+        """
+        Initialize a rig calibration
+
+        Args:
+            homographies (list): 3x3 matrices, entry i maps camera i+1 onto camera i
+            fingerprint (str): Rig fingerprint the homographies were solved for
+            errors (list): Median reprojection error per pair in pixels
+            inliers (list): RANSAC inlier count per pair
+            created_at (float): Unix timestamp of the calibration
+            version (int): Calibration file format version
+        """
+        self.homographies = [array(H, dtype=float64) for H in homographies]
+        self.fingerprint = fingerprint
+        self.errors = errors or [0.0] * len(homographies)
+        self.inliers = inliers or [0] * len(homographies)
+        self.created_at = created_at or time.time()
+        self.version = version
+
+    def to_dict(self):
+        """Serialize the calibration to a JSON-compatible dict"""
+        return {
+            "version": self.version,
+            "fingerprint": self.fingerprint,
+            "created_at": self.created_at,
+            "homographies": [H.tolist() for H in self.homographies],
+            "errors": [float(e) for e in self.errors],
+            "inliers": [int(n) for n in self.inliers]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a calibration from a dict produced by to_dict"""
+        return cls(
+            homographies=data["homographies"],
+            fingerprint=data["fingerprint"],
+            errors=data.get("errors"),
+            inliers=data.get("inliers"),
+            created_at=data.get("created_at"),
+            version=data.get("version", CALIBRATION_VERSION)
+        )
+
+    def save(self, path=None):
+        """Write the calibration to disk atomically"""
+        path = path or Config.CALIBRATION_FILE
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=None):
+        """
+        Load a calibration from disk
+
+        Returns:
+            RigCalibration or None if missing, unreadable or from another version
+        """
+        path = path or Config.CALIBRATION_FILE
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if data.get("version") != CALIBRATION_VERSION:
+            logger.warning(f"Ignoring calibration {path}: version {data.get('version')} != {CALIBRATION_VERSION}")
+            return None
+        return cls.from_dict(data)
+
+
+def rig_fingerprint(images, ips=None):
+    """
+    Fingerprint the rig layout: camera order and frame sizes
+
+    Args:
+        images (list): Frames in rig order
+        ips (list): Camera addresses, defaults to Config.RASPBERRY_PI_IPS
+
+    Returns:
+        str: Hex digest identifying the rig
+    """
+    ips = Config.RASPBERRY_PI_IPS if ips is None else ips
+    layout = {
+        "cameras": list(ips),
+        "shapes": [list(img.shape[:2]) for img in images]
+    }
+    return hashlib.sha1(json.dumps(layout, sort_keys=True).encode()).hexdigest()
+
+
+def reprojection_error(H, points_train, points_query):
+    """Median distance between H-projected train points and their query matches"""
+    if len(points_train) == 0:
+        return float("inf")
+    projected = cv2.perspectiveTransform(points_train.reshape(-1, 1, 2), H).reshape(-1, 2)
+    return float(median(linalg.norm(projected - points_query, axis=1)))
+
+
+def solve_rig(images, pairs=None):
+    """
+    Solve the pairwise homographies of every adjacent camera pair
+
+    Args:
+        images (list): Frames in rig order, left to right
+        pairs (list): estimate_pairwise result for these frames, registered here when None
+
+    Returns:
+        RigCalibration or None if any pair could not be registered
+    """
+    homographies, errors, inliers = [], [], []
+    pairs = estimate_pairwise(images) if pairs is None else pairs
+
+    for i, solved in enumerate(pairs):
+        if solved is None:
+            logger.warning(f"✗ Calibration failed for cameras {i + 1} and {i + 2}")
+            return None
+
+        H, points_train, points_query, status = solved
+        homographies.append(H)
+        errors.append(reprojection_error(H, points_train[status], points_query[status]))
+        inliers.append(int(status.sum()))
+
+    return RigCalibration(homographies, rig_fingerprint(images), errors, inliers)
+
+
+def calibrate(images, save=True, pairs=None):
+    """
+    Solve a new calibration, make it active and optionally persist it
+
+    Args:
+        images (list): Frames in rig order
+        save (bool): Write the calibration to Config.CALIBRATION_FILE
+        pairs (list): estimate_pairwise result for these frames, see solve_rig
+
+    Returns:
+        RigCalibration or None if calibration failed
+    """
+    global _calibration, _last_validation, _last_failure
+
+    start_time = time.time()
+    calibration = solve_rig(images, pairs)
+    if calibration is None:
+        with _calibration_lock:
+            _last_failure = (rig_fingerprint(images), time.time())
+        return None
+
+    if save:
+        calibration.save()
+
+    with _calibration_lock:
+        _calibration = calibration
+        _last_validation = time.time()
+        _last_failure = None
+
+    logger.info(f"✓ Rig calibrated in {time.time() - start_time:.2f}s, "
+                f"max reprojection error {max(calibration.errors):.2f}px")
+    return calibration
+
+
+def load_calibration(path=None):
+    """Load the persisted calibration into memory, returns it or None"""
+    global _calibration
+
+    calibration = RigCalibration.load(path)
+    if calibration is not None:
+        with _calibration_lock:
+            _calibration = calibration
+        logger.info(f"✓ Loaded rig calibration {calibration.fingerprint[:12]}")
+    return calibration
+
+
+def get_calibration(images=None):
+    """
+    Return the active calibration if it matches the rig
+
+    Args:
+        images (list): Current frames, used to check the rig fingerprint
+
+    Returns:
+        RigCalibration or None
+    """
+    with _calibration_lock:
+        calibration = _calibration
+
+    if calibration is None or images is None:
+        return calibration
+    if calibration.fingerprint != rig_fingerprint(images):
+        logger.warning("Rig fingerprint changed, stored calibration no longer applies")
+        return None
+    return calibration
+
+
+def validate_calibration(calibration, images):
+    """
+    Cheaply measure how well the stored homographies still fit the rig
+
+    Features are matched on frames downscaled by Config.CALIBRATION_VALIDATION_SCALE
+    and the stored homography is scored against the RANSAC inliers.
+
+    Args:
+        calibration (RigCalibration): Calibration to check
+        images (list): Current frames in rig order
+
+    Returns:
+        list: Median reprojection error per pair in full-resolution pixels
+    """
+    errors = []
+    pairs = estimate_pairwise(images, scale=Config.CALIBRATION_VALIDATION_SCALE, refine=False)
+    for H, solved in zip(calibration.homographies, pairs):
+        if solved is None:
+            errors.append(float("inf"))
+            continue
+        _, points_train, points_query, status = solved
+        errors.append(reprojection_error(H, points_train[status], points_query[status]))
+    return errors
+
+
+def _failed_recently(images):
+    """True when this rig failed to calibrate less than Config.CALIBRATION_RETRY_INTERVAL ago"""
+    with _calibration_lock:
+        failure = _last_failure
+    if failure is None:
+        return False
+    fingerprint, failed_at = failure
+    return time.time() - failed_at < Config.CALIBRATION_RETRY_INTERVAL and fingerprint == rig_fingerprint(images)
+
+
+def ensure_calibration(images, encoded=None, frames=None):
+    """
+    Return a calibration valid for these frames, solving or refreshing it as needed
+
+    Calibrates on demand when nothing matches the rig, and every
+    Config.CALIBRATION_REVALIDATE_INTERVAL seconds re-validates the active
+    calibration, recalibrating when the error drifts past
+    Config.CALIBRATION_DRIFT_THRESHOLD. A rig that failed to calibrate is
+    not retried for Config.CALIBRATION_RETRY_INTERVAL seconds.
+
+    Args:
+        images (list): Frames in rig order
+        encoded (list): JPEG bytes of the frames, see estimate_pairwise
+        frames (FrameSet): Shared memory handle of the frames, see estimate_pairwise
+
+    Returns:
+        tuple: (calibration, pairs) where calibration is None if the rig could not be
+            calibrated and pairs is the estimate_pairwise result of a failed attempt on
+            these frames, so the caller does not register them again, or None
+    """
+    global _last_validation
+
+    calibration = get_calibration(images)
+    if calibration is None:
+        if _failed_recently(images):
+            return None, None
+        pairs = estimate_pairwise(images, encoded=encoded, frames=frames)
+        calibration = calibrate(images, pairs=pairs)
+        if calibration is None:
+            logger.warning(f"✗ Rig calibration failed, retrying in {Config.CALIBRATION_RETRY_INTERVAL}s")
+            return None, pairs
+        return calibration, None
+
+    interval = Config.CALIBRATION_REVALIDATE_INTERVAL
+    if interval and time.time() - _last_validation >= interval:
+        _last_validation = time.time()
+        errors = validate_calibration(calibration, images)
+        worst = max(errors) if errors else 0.0
+        logger.info(f"Calibration re-validated, max reprojection error {worst:.2f}px")
+        if worst > Config.CALIBRATION_DRIFT_THRESHOLD:
+            logger.warning("Calibration drifted, recalibrating")
+            return calibrate(images) or calibration, None
+
+    return calibration, None
@@ -0,0 +1,273 @@
+import cv2
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from numpy import *
+from config import Config
+from .metrics import stage
+
+logger = logging.getLogger(__name__)
+
+DETECTION_BACKENDS = ("hog", "dnn")
+
+# Person detector, loaded once per server, see get_detector
+_detector = None
+_detector_lock = threading.Lock()
+
+# Threads running the per-frame HOG detector
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Return the shared detection thread pool"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=Config.DETECTION_WORKERS,
+                thread_name_prefix="detection"
+            )
+        return _executor
+
+
+class HogDetector:
+    """OpenCV's pretrained HOG + linear SVM pedestrian detector, one frame per thread"""
+
+    batched = False
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _hog(self):
+        # HOGDescriptor keeps scratch buffers, so every thread gets its own
+        hog = getattr(self._local, "hog", None)
+        if hog is None:
+            hog = self._local.hog = cv2.HOGDescriptor()
+            hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+        return hog
+
+    def detect(self, image):
+        """
+        Detect people in one BGR frame
+
+        Returns:
+            list: (x, y, w, h, score) per person in frame pixels
+        """
+        scale = Config.DETECTION_SCALE
+        if scale != 1.0:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        rects, weights = self._hog().detectMultiScale(image, winStride=(8, 8), padding=(8, 8), scale=1.05)
+        return [
+            (x / scale, y / scale, w / scale, h / scale, float(score))
+            for (x, y, w, h), score in zip(rects, ravel(weights))
+            if score >= Config.DETECTION_CONFIDENCE
+        ]
+
+
+class DnnDetector:
+    """OpenCV DNN detector with an SSD-style output, all frames in one forward pass"""
+
+    batched = True
+
+    def __init__(self, model, config=None):
+        """
+        Load the network
+
+        Args:
+            model (str): Weights file, e.g. a MobileNet-SSD .caffemodel
+            config (str): Network description, e.g. the matching .prototxt
+        """
+        self.net = cv2.dnn.readNet(model, config or "")
+        self._lock = threading.Lock()
+
+    def detect_batch(self, images):
+        """
+        Detect people in every frame with one batched forward pass
+
+        Returns:
+            list: Per frame, (x, y, w, h, score) per person in frame pixels
+        """
+        blob = cv2.dnn.blobFromImages(
+            images, Config.DETECTION_BLOB_SCALE, tuple(Config.DETECTION_INPUT_SIZE),
+            tuple(Config.DETECTION_MEAN), swapRB=False, crop=False
+        )
+        with self._lock:
+            self.net.setInput(blob)
+            output = self.net.forward()
+
+        # detection_out rows: image id, class id, confidence, x0, y0, x1, y1 (normalized)
+        boxes = [[] for _ in images]
+        for image_id, class_id, score, x0, y0, x1, y1 in output.reshape(-1, 7):
+            if int(class_id) != Config.DETECTION_PERSON_CLASS or score < Config.DETECTION_CONFIDENCE:
+                continue
+            height, width = images[int(image_id)].shape[:2]
+            x0, x1 = clip([x0 * width, x1 * width], 0, width)
+            y0, y1 = clip([y0 * height, y1 * height], 0, height)
+            boxes[int(image_id)].append((x0, y0, x1 - x0, y1 - y0, float(score)))
+        return boxes
+
+
+def load_detector():
+    """Load the configured person detector up front so the first request does not pay for it"""
+    return get_detector()
+
+
+def get_detector():
+    """Return the shared person detector for Config.DETECTION_BACKEND"""
+    global _detector
+    with _detector_lock:
+        if _detector is None:
+            backend = Config.DETECTION_BACKEND
+            if backend == "hog":
+                _detector = HogDetector()
+            elif backend == "dnn":
+                if not Config.DETECTION_MODEL:
+                    raise ValueError("DETECTION_BACKEND 'dnn' needs Config.DETECTION_MODEL")
+                _detector = DnnDetector(Config.DETECTION_MODEL, Config.DETECTION_MODEL_CONFIG)
+            else:
+                raise ValueError(f"Unknown detection backend {backend!r}, expected one of {DETECTION_BACKENDS}")
+            logger.info(f"✓ Loaded {backend} person detector")
+        return _detector
+
+
+def detect_people(images):
+    """
+    Run the person detector on every source frame concurrently
+
+    Args:
+        images (list): BGR frames in rig order
+
+    Returns:
+        list: Per frame, (x, y, w, h, score) per person in frame pixels
+    """
+    detector = get_detector()
+    with stage("person_detection", cameras=len(images)):
+        if detector.batched:
+            return detector.detect_batch(images)
+        return list(_get_executor().map(detector.detect, images))
+
+
+def panorama_mapping(homographies, frame_shapes):
+    """
+    Build the camera -> panorama point mapping used by the stitcher
+
+    Args:
+        homographies (list): Entry i maps camera i+1 onto camera i
+        frame_shapes (list): Shapes of the camera frames
+
+    Returns:
+        tuple: (function(camera, Nx2 points) -> Nx2 points, (width, height),
+            wrap width for 360° projections or None)
+    """
+    from .alignment import global_transforms
+    from .projection import PROJECTION_MODES, camera_yaws, project_points
+
+    if Config.PROJECTION_MODE in PROJECTION_MODES:
+        yaws = camera_yaws(homographies, frame_shapes)
+        canvas_size = (Config.PROJECTION_WIDTH, Config.PROJECTION_HEIGHT)
+        return (
+            lambda camera, points: project_points(points, yaws[camera], frame_shapes[camera]),
+            canvas_size, canvas_size[0]
+        )
+
+    transforms, canvas_size = global_transforms(homographies, frame_shapes)
+    return (
+        lambda camera, points: cv2.perspectiveTransform(
+            float64(points).reshape(-1, 1, 2), transforms[camera]).reshape(-1, 2),
+        canvas_size, None
+    )
+
+
+def _box_to_panorama(mapper, camera, box):
+    """Bounding box in panorama pixels of a camera box, sampled along its edges"""
+    x, y, w, h = box[:4]
+    t = linspace(0, 1, 5)
+    edges = concatenate([
+        stack([x + t * w, full_like(t, y)], 1), stack([x + t * w, full_like(t, y + h)], 1),
+        stack([full_like(t, x), y + t * h], 1), stack([full_like(t, x + w), y + t * h], 1)
+    ])
+    points = mapper(camera, edges)
+    x0, y0 = points.min(axis=0)
+    x1, y1 = points.max(axis=0)
+    return array([x0, y0, x1 - x0, y1 - y0])
+
+
+def non_max_suppression(boxes, scores, threshold, wrap_width=None):
+    """
+    Greedy NMS, overlaps measured across the 0/360° seam when wrap_width is given
+
+    Args:
+        boxes (numpy array): Nx4 (x, y, w, h)
+        scores (numpy array): N scores
+        threshold (float): IoU above which the lower-scored box is dropped
+        wrap_width (int): Panorama width of a closed 360° panorama
+
+    Returns:
+        list: Indices of the kept boxes, best first
+    """
+    boxes = asarray(boxes, dtype=float64).reshape(-1, 4)
+    order = list(argsort(-asarray(scores)))
+    areas = boxes[:, 2] * boxes[:, 3]
+    keep = []
+    while order:
+        best = order.pop(0)
+        keep.append(int(best))
+        if not order:
+            break
+        rest = boxes[order]
+        dx = rest[:, 0] - boxes[best, 0]
+        if wrap_width:
+            dx = (dx + wrap_width / 2) % wrap_width - wrap_width / 2
+        left = maximum(0, dx)
+        right = minimum(boxes[best, 2], dx + rest[:, 2])
+        top = maximum(boxes[best, 1], rest[:, 1])
+        bottom = minimum(boxes[best, 1] + boxes[best, 3], rest[:, 1] + rest[:, 3])
+        intersection = clip(right - left, 0, None) * clip(bottom - top, 0, None)
+        iou = intersection / (areas[best] + areas[order] - intersection)
+        order = [index for index, overlap in zip(order, iou) if overlap <= threshold]
+    return keep
+
+
+def detect_and_map(images, homographies=None):
+    """
+    Detect people on the source frames and merge them into panorama coordinates
+
+    Args:
+        images (list): BGR frames in rig order
+        homographies (list): Pairwise rig homographies, None to skip the panorama mapping
+
+    Returns:
+        dict: {"cameras": per-frame detections, "panorama": merged detections or None}
+    """
+    detections = detect_people(images)
+    result = {
+        "cameras": [
+            [{"box": [round(float(v), 1) for v in d[:4]], "score": round(d[4], 3)} for d in frame]
+            for frame in detections
+        ],
+        "panorama": None
+    }
+    if homographies is None:
+        return result
+
+    mapper, canvas_size, wrap_width = panorama_mapping(homographies, [img.shape for img in images])
+    boxes, scores, cameras = [], [], []
+    for camera, frame in enumerate(detections):
+        for d in frame:
+            boxes.append(_box_to_panorama(mapper, camera, d))
+            scores.append(d[4])
+            cameras.append(camera)
+
+    merged = []
+    for i in non_max_suppression(boxes, scores, Config.DETECTION_NMS_THRESHOLD, wrap_width):
+        x, y, w, h = boxes[i]
+        if wrap_width:
+            x = x % wrap_width
+        merged.append({
+            "box": [round(float(v), 1) for v in (x, y, w, h)],
+            "score": round(scores[i], 3),
+            "camera": cameras[i]
+        })
+    result["panorama"] = {"size": [int(v) for v in canvas_size], "detections": merged}
+    return result
@@ -0,0 +1,85 @@
+import cv2
+import logging
+from numpy import frombuffer, uint8
+from config import Config
+from .metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Output formats: extension, mimetype and the OpenCV quality flag
+IMAGE_FORMATS = {
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+    "png": (".png", "image/png", cv2.IMWRITE_PNG_COMPRESSION)
+}
+
+# JPEG DCT-domain reductions available to decode_image, largest first
+_REDUCED_FLAGS = {
+    8: (cv2.IMREAD_REDUCED_COLOR_8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    4: (cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    2: (cv2.IMREAD_REDUCED_COLOR_2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+    1: (cv2.IMREAD_COLOR, cv2.IMREAD_GRAYSCALE)
+}
+
+
+def encode_image(image, fmt="jpeg", quality=None, max_width=None):
+    """
+    Encode an image in memory
+
+    Args:
+        image (numpy array): BGR image
+        fmt (str): One of IMAGE_FORMATS
+        quality (int): JPEG/WebP quality 1-100, or PNG compression 0-9
+        max_width (int): Downscale to at most this width, keeping the aspect ratio
+
+    Returns:
+        tuple: (encoded bytes, mimetype, file extension)
+    """
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported format {fmt!r}, expected one of {list(IMAGE_FORMATS)}")
+    extension, mimetype, quality_flag = IMAGE_FORMATS[fmt]
+
+    if quality is None:
+        quality = Config.PNG_COMPRESSION if fmt == "png" else Config.OUTPUT_QUALITY
+
+    with stage("encode", format=fmt):
+        if max_width and image.shape[1] > max_width:
+            height = round(image.shape[0] * max_width / image.shape[1])
+            image = cv2.resize(image, (max_width, height), interpolation=cv2.INTER_AREA)
+
+        ok, encoded = cv2.imencode(extension, image, [quality_flag, int(quality)])
+    if not ok:
+        raise ValueError(f"Failed to encode image as {fmt}")
+    return encoded.tobytes(), mimetype, extension
+
+
+def decode_image(data, scale=1.0, gray=False):
+    """
+    Decode an encoded frame straight from its bytes into BGR (or grayscale) uint8
+
+    Downscales by 1/2, 1/4 or 1/8 are done by the JPEG decoder itself, so a
+    reduced decode costs a fraction of a full one; any remaining factor,
+    including an upscale, is applied with a resize.
+
+    Args:
+        data (bytes): Encoded image
+        scale (float): Resize factor, 1.0 = full resolution
+        gray (bool): Decode the luma channel only
+
+    Returns:
+        numpy array: Decoded image
+
+    Raises:
+        ValueError: If scale is not positive or the bytes are not a decodable image
+    """
+    if not scale > 0:
+        raise ValueError(f"Decode scale must be positive, got {scale}")
+    reduction = next((r for r in _REDUCED_FLAGS if r * scale <= 1.0 + 1e-9), 1)
+    image = cv2.imdecode(frombuffer(data, uint8), _REDUCED_FLAGS[reduction][int(gray)])
+    if image is None:
+        raise ValueError("Failed to decode image")
+    remaining = scale * reduction
+    if abs(remaining - 1.0) > 1e-9:
+        interpolation = cv2.INTER_AREA if remaining < 1.0 else cv2.INTER_LINEAR
+        image = cv2.resize(image, None, fx=remaining, fy=remaining, interpolation=interpolation)
+    return image
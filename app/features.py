@@ -0,0 +1,198 @@
+import cv2
+import threading
+from numpy import *
+from config import Config
+from .metrics import INLIERS, KEYPOINTS, MATCHES, observe_stage
+
+# Supported Config.FEATURE_BACKEND values
+FEATURE_BACKENDS = ("sift-bf", "sift-flann", "orb", "akaze")
+
+# FLANN index parameters: KD-tree for float descriptors, LSH for binary ones
+FLANN_KDTREE_PARAMS = dict(algorithm=1, trees=5)
+FLANN_LSH_PARAMS = dict(algorithm=6, table_number=6, key_size=12, multi_probe_level=1)
+FLANN_SEARCH_PARAMS = dict(checks=50)
+
+# ORB pyramid step and descriptor patch at full resolution; smaller patches
+# keep keypoints near the borders of downscaled frames
+ORB_SCALE_FACTOR = 1.2
+ORB_PATCH_SIZE = 31
+ORB_MIN_PATCH_SIZE = 15
+
+# Per-backend timing and quality totals, see backend_stats
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _backend(backend=None):
+    """Resolve and check the feature backend name"""
+    backend = backend or Config.FEATURE_BACKEND
+    if backend not in FEATURE_BACKENDS:
+        raise ValueError(f"Unknown feature backend {backend!r}, expected one of {FEATURE_BACKENDS}")
+    return backend
+
+
+def create_detector(backend=None, scale=1.0):
+    """
+    Create the keypoint detector/descriptor for a backend
+
+    ORB and AKAZE are tuned for full-resolution frames. On frames downscaled
+    by scale the AKAZE response threshold drops with the pixel area, and the
+    ORB pyramid keeps the same coarsest level with a patch scaled to the
+    frame, so reduced-resolution registration still finds enough keypoints.
+
+    Args:
+        backend (str): One of FEATURE_BACKENDS, defaults to Config.FEATURE_BACKEND
+        scale (float): Factor the frames were resized by before detection
+
+    Returns:
+        cv2.Feature2D
+    """
+    backend = _backend(backend)
+    max_keypoints = Config.MAX_KEYPOINTS or 0
+
+    if backend in ("sift-bf", "sift-flann"):
+        return cv2.SIFT_create(nfeatures=max_keypoints)
+    if backend == "orb":
+        levels = int(round(Config.ORB_LEVELS + log(scale) / log(ORB_SCALE_FACTOR)))
+        patch = int(maximum(ORB_MIN_PATCH_SIZE, round(ORB_PATCH_SIZE * scale)))
+        return cv2.ORB_create(
+            nfeatures=max_keypoints or 5000,
+            scaleFactor=ORB_SCALE_FACTOR,
+            nlevels=int(maximum(1, levels)),
+            edgeThreshold=patch,
+            patchSize=patch,
+            fastThreshold=Config.ORB_FAST_THRESHOLD
+        )
+    return cv2.AKAZE_create(threshold=Config.AKAZE_THRESHOLD * scale ** 2)
+
+
+def detect_and_describe(image, backend=None, scale=1.0):
+    """
+    Detect keypoints and compute descriptors on a grayscale image
+
+    Args:
+        image (numpy array): Grayscale image
+        backend (str): Feature backend, defaults to Config.FEATURE_BACKEND
+        scale (float): Factor the image was resized by, see create_detector
+
+    Returns:
+        tuple: (keypoints, descriptors), (None, None) when nothing was found
+    """
+    backend = _backend(backend)
+    detector = create_detector(backend, scale)
+
+    if backend == "akaze" and Config.MAX_KEYPOINTS:
+        # AKAZE has no nfeatures cap, keep the strongest responses before describing
+        keypoints = detector.detect(image, None)
+        if len(keypoints) > Config.MAX_KEYPOINTS:
+            responses = array([kp.response for kp in keypoints])
+            strongest = argsort(-responses, kind="stable")[:Config.MAX_KEYPOINTS]
+            keypoints = [keypoints[i] for i in strongest]
+        keypoints, descriptors = detector.compute(image, keypoints)
+    else:
+        keypoints, descriptors = detector.detectAndCompute(image, None)
+
+    if not keypoints or descriptors is None:
+        return None, None
+    return keypoints, descriptors
+
+
+def match_descriptors(features_train_image, features_query_image, backend=None):
+    """
+    Match train descriptors against query descriptors
+
+    sift-bf is the brute-force L2 matcher with cross-check. The other backends
+    search a FLANN index (KD-tree for SIFT, LSH for binary ORB/AKAZE) and keep
+    matches passing Lowe's ratio test with Config.MATCH_RATIO.
+
+    Args:
+        features_train_image (numpy array): Train descriptors
+        features_query_image (numpy array): Query descriptors
+        backend (str): Feature backend, defaults to Config.FEATURE_BACKEND
+
+    Returns:
+        numpy array: (M, 2) int32 [train_index, query_index] rows, best match first
+    """
+    backend = _backend(backend)
+
+    if backend == "sift-bf":
+        bf = cv2.BFMatcher(cv2.NORM_L2, crossCheck=True)
+        best_matches = bf.match(features_train_image, features_query_image)
+        if not best_matches:
+            return zeros((0, 2), dtype=int32)
+        raw = array([(m.queryIdx, m.trainIdx, m.distance) for m in best_matches])
+        order = argsort(raw[:, 2], kind="stable")
+        return raw[order, :2].astype(int32)
+
+    if len(features_query_image) < 2 or len(features_train_image) == 0:
+        return zeros((0, 2), dtype=int32)
+
+    params = FLANN_KDTREE_PARAMS if backend == "sift-flann" else FLANN_LSH_PARAMS
+    index = cv2.flann_Index(features_query_image, params)
+    neighbours, distances = index.knnSearch(features_train_image, 2, params=FLANN_SEARCH_PARAMS)
+    distances = distances.astype(float32)
+
+    # KD-tree distances are squared L2, LSH distances are Hamming
+    ratio = Config.MATCH_RATIO ** 2 if backend == "sift-flann" else Config.MATCH_RATIO
+    keep = (neighbours[:, 0] >= 0) & (
+        (neighbours[:, 1] < 0) | (distances[:, 0] < ratio * distances[:, 1])
+    )
+
+    train_index = flatnonzero(keep)
+    order = argsort(distances[train_index, 0], kind="stable")
+    train_index = train_index[order]
+    return stack([train_index, neighbours[train_index, 0]], axis=1).astype(int32)
+
+
+def record_detection(seconds, keypoints, backend=None):
+    """Add one detection to the backend statistics and metrics"""
+    backend = _backend(backend)
+    _record(backend, detections=1, detect_seconds=seconds, keypoints=keypoints)
+    KEYPOINTS.observe(keypoints, backend=backend)
+    observe_stage("detect", seconds)
+
+
+def record_matching(seconds, matches, inliers, backend=None):
+    """Add one matched pair to the backend statistics and metrics"""
+    backend = _backend(backend)
+    _record(backend, pairs=1, match_seconds=seconds, matches=matches, inliers=inliers)
+    MATCHES.observe(matches, backend=backend)
+    INLIERS.observe(inliers, backend=backend)
+    observe_stage("match", seconds)
+
+
+def _record(backend, **totals):
+    backend = _backend(backend)
+    with _stats_lock:
+        entry = _stats.setdefault(backend, {
+            "detections": 0, "detect_seconds": 0.0, "keypoints": 0,
+            "pairs": 0, "match_seconds": 0.0, "matches": 0, "inliers": 0
+        })
+        for key, value in totals.items():
+            entry[key] += value
+
+
+def backend_stats():
+    """
+    Average timing and inlier ratio of every backend used so far
+
+    Returns:
+        dict: backend -> {detect_ms, keypoints, match_ms, matches, inlier_ratio, ...}
+    """
+    with _stats_lock:
+        stats = {backend: dict(entry) for backend, entry in _stats.items()}
+
+    summary = {}
+    for backend, entry in stats.items():
+        detections = entry["detections"] or 1
+        pairs = entry["pairs"] or 1
+        summary[backend] = {
+            "detections": entry["detections"],
+            "pairs": entry["pairs"],
+            "detect_ms": 1000 * entry["detect_seconds"] / detections,
+            "keypoints": entry["keypoints"] / detections,
+            "match_ms": 1000 * entry["match_seconds"] / pairs,
+            "matches": entry["matches"] / pairs,
+            "inlier_ratio": entry["inliers"] / entry["matches"] if entry["matches"] else 0.0
+        }
+    return summary
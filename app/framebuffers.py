@@ -0,0 +1,268 @@
+import atexit
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from numpy import copyto, int64, ndarray, uint8
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Shared pool, see get_frame_buffers
+_pool = None
+_pool_lock = threading.Lock()
+
+# Blocks attached by this process, by name
+_attached = {}
+_attached_lock = threading.Lock()
+
+_serial = itertools.count()
+
+
+def _attach(name):
+    """Shared memory block by name, attached at most once per process"""
+    with _attached_lock:
+        block = _attached.get(name)
+        if block is None:
+            block = _attached[name] = _attach_untracked(name)
+        return block
+
+
+def _attach_untracked(name):
+    """
+    Attach without registering with the resource tracker
+
+    Only the owner unlinks its blocks. Before Python 3.13 attaching registers
+    the block too, and the tracker would unlink it when a worker exits.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class FrameSet:
+    """
+    Picklable handle on a published frame set
+
+    Sending it to a worker process costs a few hundred bytes; the worker gets
+    NumPy views on the shared pixels. generation identifies this capture: once
+    valid turns False the slot was recycled and the views hold newer frames,
+    so readers check it before and after reading.
+    """
+
+    def __init__(self, header, slot, generation, blocks):
+        self.header = header
+        self.slot = slot
+        self.generation = generation
+        self.blocks = blocks
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def view(self, index):
+        """Zero-copy uint8 view of the index-th frame of the set"""
+        name, shape = self.blocks[index]
+        return ndarray(shape, dtype=uint8, buffer=_attach(name).buf)
+
+    @property
+    def valid(self):
+        """True while the slot still holds this generation"""
+        generations = ndarray((self.slot + 1,), dtype=int64, buffer=_attach(self.header).buf)
+        return int(generations[self.slot]) == self.generation
+
+
+class FrameWriter:
+    """Exclusive write access to one slot for the duration of a capture"""
+
+    def __init__(self, pool, slot, generation):
+        self.pool = pool
+        self.slot = slot
+        self.generation = generation
+
+    def write(self, camera, image):
+        """
+        Copy a decoded frame into the slot
+
+        Returns:
+            numpy array: View of the shared copy, or None once the capture was published or aborted
+        """
+        return self.pool._write(self, camera, image)
+
+    def publish(self, cameras):
+        """
+        Close the slot for writing and hand out its frames
+
+        Args:
+            cameras (list): Camera indices of the captured frames, in order
+
+        Returns:
+            FrameSet: Handle held by the caller until FrameBufferPool.release
+        """
+        return self.pool._publish(self, cameras)
+
+    def abort(self):
+        """Give the slot back without publishing"""
+        self.pool._abort(self)
+
+
+class FrameBufferPool:
+    """
+    Per-camera shared memory frame slots reused across captures
+
+    A capture writes into a free slot, publishes it as a FrameSet and holds a
+    reader reference until its stitch is done. A slot is only handed to a new
+    capture once every reader released it, so a frame set is never
+    overwritten while it is being read.
+    """
+
+    def __init__(self, slots=None):
+        """
+        Args:
+            slots (int): Frame sets kept, defaults to Config.FRAME_BUFFER_SLOTS
+        """
+        self.slots = slots or Config.FRAME_BUFFER_SLOTS
+        self._prefix = f"pano{os.getpid()}"
+        self._header = self._create("hdr", 8 * self.slots)
+        self._generations = ndarray((self.slots,), dtype=int64, buffer=self._header.buf)
+        self._generations[:] = 0
+        self._blocks = [{} for _ in range(self.slots)]
+        self._shapes = [{} for _ in range(self.slots)]
+        self._state = ["free"] * self.slots
+        self._readers = [0] * self.slots
+        self._released_at = [0.0] * self.slots
+        self._slot_locks = [threading.Lock() for _ in range(self.slots)]
+        self._condition = threading.Condition()
+        atexit.register(self.close)
+
+    def _create(self, label, size):
+        # POSIX shared memory is backed by /dev/shm; writing past its size raises SIGBUS, not an error
+        if os.path.isdir("/dev/shm"):
+            stat = os.statvfs("/dev/shm")
+            if stat.f_bavail * stat.f_frsize < size:
+                raise OSError(f"/dev/shm has less than {size} bytes free")
+        block = shared_memory.SharedMemory(create=True, size=size, name=f"{self._prefix}_{label}_{next(_serial)}")
+        with _attached_lock:
+            _attached[block._name] = block
+        return block
+
+    def _free(self, block):
+        with _attached_lock:
+            _attached.pop(block._name, None)
+        try:
+            block.close()
+        except BufferError:
+            # A stale view is still alive; the mapping goes away with it
+            pass
+        block.unlink()
+
+    def acquire(self, timeout=None):
+        """
+        Reserve the least recently used free slot for a new capture
+
+        Args:
+            timeout (float): Seconds to wait for a free slot, defaults to Config.FRAME_BUFFER_WAIT
+
+        Returns:
+            FrameWriter, or None when every slot is still being read
+        """
+        timeout = Config.FRAME_BUFFER_WAIT if timeout is None else timeout
+        with self._condition:
+            if not self._condition.wait_for(lambda: "free" in self._state, timeout):
+                logger.warning(f"✗ All {self.slots} frame buffer slots busy, decoding into private memory")
+                return None
+            slot = min((i for i in range(self.slots) if self._state[i] == "free"),
+                       key=lambda i: self._released_at[i])
+            # Bump the generation before opening the slot: a late write of an earlier
+            # capture, checked under the slot lock, then never matches the new capture
+            self._generations[slot] += 1
+            self._state[slot] = "writing"
+            return FrameWriter(self, slot, int(self._generations[slot]))
+
+    def _write(self, writer, camera, image):
+        slot = writer.slot
+        with self._slot_locks[slot]:
+            if not self._owns(writer):
+                return None
+            block = self._blocks[slot].get(camera)
+            if block is None or block.size < image.nbytes:
+                if block is not None:
+                    self._free(block)
+                block = self._blocks[slot][camera] = self._create(f"{slot}_{camera}", image.nbytes)
+            view = ndarray(image.shape, dtype=uint8, buffer=block.buf)
+            copyto(view, image)
+            self._shapes[slot][camera] = image.shape
+            return view
+
+    def _owns(self, writer):
+        """True while writer's capture still holds its slot for writing"""
+        return self._state[writer.slot] == "writing" and int(self._generations[writer.slot]) == writer.generation
+
+    def _publish(self, writer, cameras):
+        slot = writer.slot
+        with self._slot_locks[slot], self._condition:
+            if not self._owns(writer):
+                raise RuntimeError(f"Frame buffer slot {slot} no longer belongs to this capture")
+            self._state[slot] = "published"
+            self._readers[slot] = 1
+            blocks = [(self._blocks[slot][c]._name, self._shapes[slot][c]) for c in cameras]
+        return FrameSet(self._header._name, slot, writer.generation, blocks)
+
+    def _abort(self, writer):
+        with self._slot_locks[writer.slot], self._condition:
+            if self._owns(writer):
+                self._set_free(writer.slot)
+
+    def _set_free(self, slot):
+        self._state[slot] = "free"
+        self._readers[slot] = 0
+        self._released_at[slot] = time.monotonic()
+        self._condition.notify_all()
+
+    def release(self, frames):
+        """Drop a reader; the slot becomes reusable when the last one is gone"""
+        if frames is None:
+            return
+        with self._condition:
+            slot = frames.slot
+            if int(self._generations[slot]) != frames.generation or self._state[slot] != "published":
+                return
+            self._readers[slot] -= 1
+            if self._readers[slot] <= 0:
+                self._set_free(slot)
+
+    def stats(self):
+        """Slot states and shared bytes"""
+        with self._condition:
+            return {
+                "slots": list(self._state),
+                "readers": list(self._readers),
+                "bytes": sum(block.size for blocks in self._blocks for block in blocks.values())
+            }
+
+    def close(self):
+        """Unlink every block; called at exit"""
+        for blocks in self._blocks:
+            for block in blocks.values():
+                self._free(block)
+            blocks.clear()
+        if self._header is not None:
+            del self._generations
+            self._free(self._header)
+            self._header = None
+
+
+def get_frame_buffers():
+    """Return the shared frame buffer pool"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = FrameBufferPool()
+        return _pool
@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from numpy import percentile
+from config import Config
+from .pi_client import _get_session, pi_url
+
+logger = logging.getLogger(__name__)
+
+# Shared monitor, see get_health_monitor
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+class PiHealthMonitor:
+    """Background poller keeping the online state and latency of every Raspberry Pi"""
+
+    def __init__(self, interval=None):
+        """
+        Initialize the monitor
+
+        Args:
+            interval (float): Seconds between probe rounds, defaults to Config.HEALTH_POLL_INTERVAL
+        """
+        self.interval = interval or Config.HEALTH_POLL_INTERVAL
+        self._states = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=Config.CAPTURE_MAX_WORKERS,
+            thread_name_prefix="health"
+        )
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_poll = None
+
+    def start(self):
+        """Start the probe loop in a daemon thread"""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pi-health", daemon=True)
+        self._thread.start()
+        logger.info(f"Pi health monitor started, probing every {self.interval}s")
+
+    def stop(self):
+        """Ask the loop to exit after the current round"""
+        self._stop.set()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"✗ Health poll failed: {e}")
+            self._stop.wait(self.interval)
+
+    def poll(self, ips=None):
+        """
+        Probe every Pi's /status concurrently, bounded by one Config.HEALTH_TIMEOUT
+
+        Args:
+            ips (list): Raspberry Pi addresses, defaults to Config.RASPBERRY_PI_IPS
+        """
+        ips = Config.RASPBERRY_PI_IPS if ips is None else ips
+        futures = {self._executor.submit(self._probe, ip): ip for ip in ips}
+        done, _ = wait(futures, timeout=Config.HEALTH_TIMEOUT + 1)
+        for future, ip in futures.items():
+            if future not in done:
+                self.record(ip, False, error="probe did not finish")
+        self.last_poll = time.time()
+
+    def _probe(self, ip):
+        start = time.monotonic()
+        try:
+            response = _get_session(ip).get(pi_url(ip, Config.STATUS_ENDPOINT), timeout=Config.HEALTH_TIMEOUT)
+            response.raise_for_status()
+            self.record(ip, True, time.monotonic() - start)
+        except Exception as e:
+            self.record(ip, False, error=str(e))
+
+    def _state(self, ip):
+        state = self._states.get(ip)
+        if state is None:
+            state = self._states[ip] = {
+                "status": "unknown",
+                "last_seen": None,
+                "last_checked": None,
+                "consecutive_failures": 0,
+                "last_error": None,
+                "latencies": deque(maxlen=Config.HEALTH_LATENCY_WINDOW)
+            }
+        return state
+
+    def record(self, ip, ok, latency=None, error=None):
+        """
+        Record the outcome of a probe or capture request for one Pi
+
+        A Pi goes offline after Config.HEALTH_OFFLINE_AFTER consecutive failures
+        and back online on its first success.
+
+        Args:
+            ip (str): Raspberry Pi address
+            ok (bool): Whether the Pi answered
+            latency (float): Response time in seconds of a successful request
+            error (str): Failure reason
+        """
+        now = time.time()
+        with self._lock:
+            state = self._state(ip)
+            state["last_checked"] = now
+            if ok:
+                if state["status"] == "offline":
+                    logger.info(f"✓ Raspberry Pi {ip} is back online")
+                state["status"] = "online"
+                state["last_seen"] = now
+                state["consecutive_failures"] = 0
+                if latency is not None:
+                    state["latencies"].append(latency)
+            else:
+                state["consecutive_failures"] += 1
+                state["last_error"] = error
+                if state["consecutive_failures"] >= Config.HEALTH_OFFLINE_AFTER and state["status"] != "offline":
+                    logger.warning(f"✗ Raspberry Pi {ip} marked offline: {error}")
+                    state["status"] = "offline"
+
+    def is_down(self, ip):
+        """True when the Pi is known to be offline"""
+        with self._lock:
+            state = self._states.get(ip)
+            return state is not None and state["status"] == "offline"
+
+    def snapshot(self, ips=None):
+        """
+        Cached status of every Pi, probing once if the monitor never ran
+
+        Args:
+            ips (list): Raspberry Pi addresses, defaults to Config.RASPBERRY_PI_IPS
+
+        Returns:
+            list: Per Pi: ip, status, response_time (latest) and rolling latency stats
+        """
+        ips = Config.RASPBERRY_PI_IPS if ips is None else ips
+        if self.last_poll is None:
+            self.poll(ips)
+
+        pi_status = []
+        with self._lock:
+            for ip in ips:
+                state = self._state(ip)
+                latencies = list(state["latencies"])
+                pi_status.append({
+                    "ip": ip,
+                    "status": state["status"],
+                    "response_time": latencies[-1] if latencies else None,
+                    "latency_p50": float(percentile(latencies, 50)) if latencies else None,
+                    "latency_p95": float(percentile(latencies, 95)) if latencies else None,
+                    "last_seen": state["last_seen"],
+                    "last_checked": state["last_checked"],
+                    "consecutive_failures": state["consecutive_failures"],
+                    "last_error": state["last_error"]
+                })
+        return pi_status
+
+
+def get_health_monitor():
+    """Return the shared Pi health monitor"""
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = PiHealthMonitor()
+        return _monitor
@@ -0,0 +1,186 @@
+import cv2
+import logging
+import threading
+from numpy import *
+from config import Config
+from .memory import get_memory_budget
+from .metrics import INCREMENTAL_CAMERAS, stage
+
+logger = logging.getLogger(__name__)
+
+# Shared compositor, see get_incremental_compositor
+_compositor = None
+_compositor_lock = threading.Lock()
+
+
+def thumbnail(image):
+    """Small grayscale copy of a frame for change detection"""
+    height, width = image.shape[:2]
+    size = (Config.INCREMENTAL_THUMBNAIL_WIDTH, int(maximum(1, height * Config.INCREMENTAL_THUMBNAIL_WIDTH // width)))
+    small = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+
+def change_score(previous, current):
+    """
+    Fraction of thumbnail pixels that moved by more than Config.INCREMENTAL_PIXEL_DELTA
+
+    Downscaling averages sensor noise away, while a small object that moved
+    still changes a few thumbnail pixels strongly; a mean difference would
+    dilute it below any usable threshold.
+    """
+    changed = cv2.absdiff(previous, current) > Config.INCREMENTAL_PIXEL_DELTA
+    return float(changed.mean())
+
+
+def working_bytes(compiled):
+    """
+    Bytes the compositor needs for a compiled geometry: the resident bytes, the
+    new panorama and the old and new float32 contribution of the largest ROI
+    """
+    width_panorama, height_panorama = compiled.canvas_size
+    rois = [camera["roi"] for camera in compiled.cameras]
+    roi_pixels = int(amax([(x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in rois], initial=0))
+    return resident_bytes(compiled) + width_panorama * height_panorama * 3 + roi_pixels * 3 * 4 * 2
+
+
+def resident_bytes(compiled):
+    """Bytes that stay allocated between stitches: float32 accumulator, cached panorama and retained frames"""
+    width_panorama, height_panorama = compiled.canvas_size
+    frame_bytes = sum([height * width * 3 for height, width in compiled.frame_shapes])
+    return width_panorama * height_panorama * 3 * (4 + 1) + int(frame_bytes)
+
+
+def _retained(image):
+    """Frame safe to keep across stitches; shared memory frame slots are reused by later captures"""
+    return image if image.flags.owndata else image.copy()
+
+
+class IncrementalCompositor:
+    """
+    Keeps the last panorama of a compiled rig or projection and only
+    re-composes the cameras whose frames changed
+
+    The float32 accumulator holds the sum of every camera's weighted
+    contribution, so a changed camera is swapped in by subtracting its old
+    contribution and adding the new one over its own ROI; the seams it shares
+    with its neighbours are re-blended by that same update.
+
+    The accumulator, cached panorama and the retained copy of every frame stay
+    reserved in the memory budget until reset(), so concurrent composes cannot
+    claim the same bytes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._compiled = None
+        self._frames = None
+        self._thumbnails = None
+        self._accumulator = None
+        self.panorama = None
+        self._updates = 0
+        self._resident = None
+
+    def stitch(self, compiled, images):
+        """
+        Compose the panorama, reusing the cached canvas where frames did not change
+
+        Args:
+            compiled (CompiledRig or CompiledProjection): Compiled geometry
+            images (list): BGR frames in rig order
+
+        Returns:
+            numpy array: uint8 panorama, the cached array itself when nothing changed
+        """
+        with self._lock:
+            # The full working reservation covers the resident buffers while stitching
+            self._release_resident()
+            with get_memory_budget().reserve(working_bytes(compiled)) as reservation:
+                try:
+                    panorama = self._stitch(compiled, images)
+                except Exception:
+                    self._clear()
+                    raise
+                self._resident = reservation.keep(resident_bytes(compiled))
+                return panorama
+
+    def _stitch(self, compiled, images):
+        """Compose under the caller's lock and reservation, see stitch"""
+        thumbnails = [thumbnail(image) for image in images]
+        if (compiled is not self._compiled or len(images) != len(self._frames)
+                or self._updates >= Config.INCREMENTAL_REBASE_EVERY):
+            return self._rebuild(compiled, images, thumbnails)
+
+        scores = [change_score(old, new) for old, new in zip(self._thumbnails, thumbnails)]
+        changed = [i for i, score in enumerate(scores) if score > Config.INCREMENTAL_CHANGE_THRESHOLD]
+        INCREMENTAL_CAMERAS.inc(len(images) - len(changed), outcome="reused")
+        INCREMENTAL_CAMERAS.inc(len(changed), outcome="recomposed")
+        if not changed:
+            logger.debug("Incremental stitch: no camera changed, reusing the cached panorama")
+            return self.panorama
+
+        logger.debug(f"Incremental stitch: re-composing cameras {changed} "
+                     f"(scores {[round(scores[i], 4) for i in changed]})")
+        with stage("compose", cameras=len(changed)):
+            # Copy on write: earlier results may still be held by finished jobs
+            panorama = self.panorama.copy()
+            for camera in compiled.cameras:
+                index = camera["index"]
+                if index not in changed:
+                    continue
+                delta = compiled.contribution(camera, images[index])
+                delta -= compiled.contribution(camera, self._frames[index])
+                for target, source in compiled.segments(camera):
+                    self._accumulator[target] += delta[source]
+                    panorama[target] = clip(self._accumulator[target].round(), 0, 255).astype(uint8)
+
+        for index in changed:
+            self._frames[index] = _retained(images[index])
+            self._thumbnails[index] = thumbnails[index]
+        self._updates += 1
+        self.panorama = panorama
+        return panorama
+
+    def reset(self):
+        """Drop the cached canvas and accumulator and give their bytes back to the budget"""
+        with self._lock:
+            self._clear()
+            self._release_resident()
+
+    def _clear(self):
+        self._compiled = self._frames = self._thumbnails = self._accumulator = self.panorama = None
+
+    def _release_resident(self):
+        if self._resident is not None:
+            self._resident.release()
+            self._resident = None
+
+    def _rebuild(self, compiled, images, thumbnails):
+        """Compose every camera and reset the cache"""
+        # Drop the old canvas first so it is not held alongside the new one
+        self._clear()
+        width_panorama, height_panorama = compiled.canvas_size
+        with stage("compose", cameras=len(images)):
+            accumulator = zeros((height_panorama, width_panorama, 3), dtype=float32)
+            for camera in compiled.cameras:
+                contribution = compiled.contribution(camera, images[camera["index"]])
+                for target, source in compiled.segments(camera):
+                    accumulator[target] += contribution[source]
+            self.panorama = clip(accumulator.round(), 0, 255).astype(uint8)
+
+        INCREMENTAL_CAMERAS.inc(len(images), outcome="recomposed")
+        self._compiled = compiled
+        self._frames = [_retained(image) for image in images]
+        self._thumbnails = thumbnails
+        self._accumulator = accumulator
+        self._updates = 0
+        return self.panorama
+
+
+def get_incremental_compositor():
+    """Return the shared incremental compositor"""
+    global _compositor
+    with _compositor_lock:
+        if _compositor is None:
+            _compositor = IncrementalCompositor()
+        return _compositor
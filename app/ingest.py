@@ -0,0 +1,264 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from .encoding import decode_image
+from .metrics import INGEST_FRAMES, observe_stage, stage
+
+logger = logging.getLogger(__name__)
+
+# Shared cache, see get_frame_cache
+_cache = None
+_cache_lock = threading.Lock()
+
+# Decode pool for the chosen frame set, created once per server
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Return the shared ingest decode thread pool"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=Config.CAPTURE_MAX_WORKERS,
+                thread_name_prefix="ingest-decode"
+            )
+        return _executor
+
+
+class PushedFrame:
+    """One frame pushed by a camera, decoded on first use"""
+
+    def __init__(self, camera, data, timestamp, received_at):
+        self.camera = camera
+        self.data = data
+        self.timestamp = timestamp
+        self.received_at = received_at
+        self._image = None
+        self._failed = False
+        self._lock = threading.Lock()
+
+    @property
+    def image(self):
+        """Decoded BGR frame, None if the bytes do not decode"""
+        with self._lock:
+            if self._image is None and not self._failed:
+                try:
+                    with stage("decode"):
+                        self._image = decode_image(self.data)
+                except ValueError as e:
+                    logger.warning(f"✗ Pushed frame of camera {self.camera} does not decode: {e}")
+                    self._failed = True
+            return self._image
+
+    def drop_image(self):
+        """Forget the decoded pixels, the encoded bytes are kept"""
+        with self._lock:
+            self._image = None
+
+
+class FrameCache:
+    """
+    Latest frames pushed by every camera, see POST /ingest/<camera>
+
+    Each camera keeps its Config.INGEST_DEPTH newest frames as JPEG bytes.
+    A capture picks, per camera, the frames whose capture timestamps are
+    closest together and decodes only those, so a stitch never waits on the
+    network.
+    """
+
+    def __init__(self, depth=None):
+        """
+        Args:
+            depth (int): Frames kept per camera, defaults to Config.INGEST_DEPTH
+        """
+        self.depth = depth or Config.INGEST_DEPTH
+        self._frames = {}
+        self._decoded = []
+        self._lock = threading.Lock()
+
+    def add(self, camera, data, timestamp=None):
+        """
+        Store a pushed frame
+
+        Args:
+            camera (int): Camera index in Config.RASPBERRY_PI_IPS
+            data (bytes): Encoded frame
+            timestamp (float): Capture time (Unix seconds, camera clock), defaults to arrival time
+
+        Returns:
+            PushedFrame
+        """
+        received_at = time.time()
+        frame = PushedFrame(camera, data, received_at if timestamp is None else timestamp, received_at)
+        with self._lock:
+            frames = self._frames.get(camera)
+            if frames is None:
+                frames = self._frames[camera] = deque(maxlen=self.depth)
+            frames.append(frame)
+        INGEST_FRAMES.inc(camera=str(camera))
+        return frame
+
+    def select(self, cameras, tolerance=None, max_age=None):
+        """
+        Freshest set of one frame per camera whose timestamps lie within tolerance
+
+        Every cached frame is tried as an anchor, newest first, and paired with
+        each other camera's frame closest to it in time. The first set with a
+        spread within tolerance wins; without one, the tightest set is returned
+        so the caller can report its skew.
+
+        Args:
+            cameras (list): Camera indices
+            tolerance (float): Maximum timestamp spread in seconds, defaults to Config.INGEST_SKEW_TOLERANCE
+            max_age (float): Ignore frames received longer ago, defaults to Config.INGEST_MAX_AGE
+
+        Returns:
+            tuple: (frames, skew) where frames maps each camera with recent frames to its
+                PushedFrame and skew is their timestamp spread, (None, None) when nothing was pushed
+        """
+        tolerance = Config.INGEST_SKEW_TOLERANCE if tolerance is None else tolerance
+        max_age = Config.INGEST_MAX_AGE if max_age is None else max_age
+        oldest = time.time() - max_age
+        with self._lock:
+            recent = {
+                camera: [f for f in self._frames.get(camera, ()) if f.received_at >= oldest]
+                for camera in cameras
+            }
+        recent = {camera: frames for camera, frames in recent.items() if frames}
+        if not recent:
+            return None, None
+
+        anchors = sorted((f for frames in recent.values() for f in frames), key=lambda f: f.timestamp, reverse=True)
+        best, best_skew = None, None
+        for anchor in anchors:
+            chosen = {
+                camera: min(frames, key=lambda f: abs(f.timestamp - anchor.timestamp))
+                for camera, frames in recent.items()
+            }
+            timestamps = [f.timestamp for f in chosen.values()]
+            skew = max(timestamps) - min(timestamps)
+            if skew <= tolerance:
+                return chosen, skew
+            if best_skew is None or skew < best_skew:
+                best, best_skew = chosen, skew
+        return best, best_skew
+
+    def capture(self, ips=None):
+        """
+        Build a capture from the pushed frames, shaped like pi_client.capture_images
+
+        Cameras without a recent frame, with a frame outside the skew tolerance
+        of the chosen set or with undecodable bytes are reported and left out.
+
+        Args:
+            ips (list): Raspberry Pi addresses, defaults to Config.RASPBERRY_PI_IPS
+
+        Returns:
+            dict: capture_images result plus "complete", True when every camera is in the set
+        """
+        ips = Config.RASPBERRY_PI_IPS if ips is None else ips
+        start = time.monotonic()
+        chosen, skew = self.select(range(len(ips)))
+        chosen = chosen or {}
+        if skew is not None and skew > Config.INGEST_SKEW_TOLERANCE:
+            logger.warning(f"✗ No pushed frame set within {Config.INGEST_SKEW_TOLERANCE * 1000:.0f} ms, "
+                           f"tightest spans {skew * 1000:.0f} ms")
+            chosen = {}
+
+        # Decode the chosen frames in parallel and release the pixels of the previous set
+        frames = [chosen.get(i) for i in range(len(ips))]
+        decoded = list(_get_executor().map(lambda f: f.image if f is not None else None, frames))
+        with self._lock:
+            for frame in self._decoded:
+                if frame not in frames:
+                    frame.drop_image()
+            self._decoded = [f for f in frames if f is not None]
+
+        now = time.time()
+        images, encoded, cameras = [], [], []
+        for i, (ip, frame, image) in enumerate(zip(ips, frames, decoded)):
+            camera = {
+                "index": i,
+                "ip": ip,
+                "status": "ok",
+                "source": "push",
+                "bytes": 0,
+                "error": None,
+                "timestamp": None,
+                "age": None
+            }
+            if frame is None:
+                camera["status"] = "missing"
+                camera["error"] = "no recent pushed frame within the skew tolerance"
+            else:
+                camera["bytes"] = len(frame.data)
+                camera["timestamp"] = frame.timestamp
+                camera["age"] = now - frame.received_at
+                if image is None:
+                    camera["status"] = "error"
+                    camera["error"] = "pushed frame does not decode"
+                else:
+                    images.append(image)
+                    encoded.append(frame.data)
+            cameras.append(camera)
+
+        wall_time = time.monotonic() - start
+        observe_stage("capture", wall_time)
+        logger.info(f"Selected {len(images)}/{len(ips)} pushed frames in {wall_time:.2f}s "
+                    f"(frame skew {(skew or 0) * 1000:.0f} ms)")
+
+        return {
+            "images": images,
+            "encoded": encoded,
+            "frames": None,
+            "cameras": cameras,
+            "wall_time": wall_time,
+            "frame_skew": skew if images else 0.0,
+            "complete": len(images) == len(ips)
+        }
+
+    def stats(self, ips=None):
+        """Per camera: frames cached, newest timestamp and its age"""
+        ips = Config.RASPBERRY_PI_IPS if ips is None else ips
+        now = time.time()
+        with self._lock:
+            stats = []
+            for i, ip in enumerate(ips):
+                frames = self._frames.get(i, ())
+                latest = frames[-1] if frames else None
+                stats.append({
+                    "camera": i,
+                    "ip": ip,
+                    "frames": len(frames),
+                    "latest_timestamp": latest.timestamp if latest else None,
+                    "latest_age": now - latest.received_at if latest else None
+                })
+        return stats
+
+
+def camera_index(camera_id, ips=None):
+    """
+    Camera index of an /ingest path segment, either the index or the Pi address
+
+    Returns:
+        int: Index in ips, or None if unknown
+    """
+    ips = Config.RASPBERRY_PI_IPS if ips is None else ips
+    if camera_id.isdigit():
+        index = int(camera_id)
+        return index if index < len(ips) else None
+    return ips.index(camera_id) if camera_id in ips else None
+
+
+def get_frame_cache():
+    """Return the shared pushed frame cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = FrameCache()
+        return _cache
@@ -0,0 +1,309 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from .pi_client import capture_images, validate_images
+from .stitching import needs_frame_buffers, stitch_images
+from .encoding import encode_image
+from .streaming import get_stream
+from .store import get_store
+from .tiles import get_tile_cache
+from .framebuffers import get_frame_buffers
+from .memory import reset_peak, rss
+from .metrics import JOB_PEAK_RSS, JOBS, end_trace, observe_stage, start_trace
+
+logger = logging.getLogger(__name__)
+
+# Shared job manager, see get_job_manager
+_manager = None
+_manager_lock = threading.Lock()
+
+
+class StitchJob:
+    """One capture + stitch run, shared by every request attached to it"""
+
+    def __init__(self, options=None):
+        """
+        Initialize a queued job
+
+        Args:
+            options (dict): Output options of the creating request:
+                format, quality, max_width, debug
+        """
+        self.id = uuid.uuid4().hex[:12]
+        self.options = {"format": Config.OUTPUT_FORMAT, "quality": None, "max_width": None, "debug": False}
+        self.options.update(options or {})
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stages = {}
+        self.metadata = {}
+        self.spans = []
+        self.error = None
+        self.error_status = None
+        self.attached = 0
+        self.filename = None
+        self.panorama = None
+        self._encoded = {}
+        self._encode_lock = threading.Lock()
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the job finished, returns True if it did"""
+        return self._done.wait(timeout)
+
+    def finish(self, error=None, error_status=500):
+        """Mark the job finished and wake every waiting request"""
+        self.finished_at = time.time()
+        if error is None:
+            self.status = "done"
+        else:
+            self.status = "failed"
+            self.error = error
+            self.error_status = error_status
+        self._done.set()
+
+    def result(self, fmt=None, quality=None, max_width=None):
+        """
+        Return the encoded panorama, encoding each option set at most once
+
+        Args:
+            fmt (str): Output format, defaults to the job's format
+            quality (int): Output quality, defaults to the job's quality
+            max_width (int): Maximum width, defaults to the job's max_width, 0 = full size
+
+        Returns:
+            tuple: (bytes, mimetype, extension), or None if the job has no panorama
+        """
+        fmt = fmt or self.options["format"]
+        quality = quality if quality is not None else self.options["quality"]
+        max_width = max_width if max_width is not None else self.options["max_width"]
+        key = (fmt, quality, max_width)
+
+        with self._encode_lock:
+            if key not in self._encoded:
+                if self.panorama is None:
+                    return None
+                start_time = time.time()
+                self._encoded[key] = encode_image(self.panorama, fmt, quality, max_width)
+                self.stages.setdefault("encode", time.time() - start_time)
+            return self._encoded[key]
+
+    def release(self):
+        """Drop pixel data once the job is evicted"""
+        with self._encode_lock:
+            self.panorama = None
+            self._encoded.clear()
+
+    def to_dict(self, trace=None):
+        """
+        JSON status of the job
+
+        Args:
+            trace (bool): Include the stage spans, defaults to Config.TRACE_SPANS
+        """
+        trace = Config.TRACE_SPANS if trace is None else trace
+        status = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "attached_requests": self.attached,
+            "stages": self.stages,
+            "metadata": self.metadata,
+            "error": self.error,
+            "options": self.options,
+            "result_url": f"/jobs/{self.id}/result" if self.status == "done" else None
+        }
+        if trace:
+            status["trace"] = self.spans
+        return status
+
+
+class JobManager:
+    """Runs stitch jobs on a fixed worker pool and coalesces concurrent requests"""
+
+    def __init__(self, workers=None):
+        """
+        Initialize the manager
+
+        Args:
+            workers (int): Concurrent jobs, defaults to Config.JOB_WORKERS
+        """
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or Config.JOB_WORKERS,
+            thread_name_prefix="stitch-job"
+        )
+        self._jobs = OrderedDict()
+        self._active = None
+        self._pending = 0
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def submit(self, options=None):
+        """
+        Attach to the in-flight job, or queue a new one
+
+        Debug jobs always run on their own because they write per-run artifacts.
+
+        Args:
+            options (dict): Output options, see StitchJob
+
+        Returns:
+            tuple: (StitchJob, attached) where attached is True for a shared job
+
+        Raises:
+            OverflowError: When Config.JOB_QUEUE_LIMIT jobs are already waiting
+        """
+        debug = bool((options or {}).get("debug"))
+        with self._lock:
+            self._prune()
+            if not debug and self._active is not None and not self._active.done:
+                self._active.attached += 1
+                return self._active, True
+
+            if self._pending >= Config.JOB_QUEUE_LIMIT:
+                raise OverflowError(f"{self._pending} stitch jobs already queued")
+
+            job = StitchJob(options)
+            self._jobs[job.id] = job
+            self._pending += 1
+            if not debug:
+                self._active = job
+
+        self._executor.submit(self._run, job)
+        return job, False
+
+    def get(self, job_id):
+        """Return a job by id, or None if unknown or evicted"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        """Evict finished jobs past Config.JOB_RETENTION or beyond Config.JOB_HISTORY"""
+        now = time.time()
+        for job_id in list(self._jobs):
+            job = self._jobs[job_id]
+            expired = job.done and now - job.finished_at > Config.JOB_RETENTION
+            if expired or (job.done and len(self._jobs) > Config.JOB_HISTORY):
+                job.release()
+                del self._jobs[job_id]
+
+    def _run(self, job):
+        """Capture, stitch and encode one panorama, recording stage timings"""
+        job.started_at = time.time()
+        job.status = "running"
+        job.stages["queue"] = job.started_at - job.created_at
+        observe_stage("queue", job.stages["queue"])
+        start_trace()
+
+        # The kernel's peak RSS is per process, so it is only attributable to this job when it runs alone
+        with self._lock:
+            self._running += 1
+            exclusive = self._running == 1 and reset_peak()
+        rss_start, _ = rss()
+        capture = None
+        # The job is finished last, so waiters see its memory report and spans
+        error, error_status = None, 500
+
+        try:
+            stage_start = time.time()
+            # Shared memory slots only pay off when feature workers will read them
+            capture = capture_images(frame_buffers=needs_frame_buffers())
+            job.stages["capture"] = time.time() - stage_start
+            job.metadata["capture_time"] = capture["wall_time"]
+            job.metadata["frame_skew"] = capture["frame_skew"]
+            job.metadata["cameras"] = capture["cameras"]
+            job.metadata["stale_sectors"] = [
+                {"camera": c["index"], "ip": c["ip"], "age": c["age"], "missed": c["missed"]}
+                for c in capture["cameras"] if c["status"] == "stale"
+            ]
+
+            images = capture["images"]
+            if not validate_images(images):
+                error = f"Expected {Config.EXPECTED_IMAGE_COUNT} valid images, got {len(images)}"
+                error_status = 400
+                return
+
+            stage_start = time.time()
+            pano, _ = stitch_images(
+                images, debug=job.options["debug"], encoded=capture["encoded"], frames=capture["frames"]
+            )
+            job.stages["stitch"] = time.time() - stage_start
+            if pano is None:
+                error = "Panorama stitching failed"
+                return
+
+            job.panorama = pano
+            data, mimetype, extension = job.result()
+            job.filename = f"{int(job.started_at)}_{Config.FINAL_PANO_FILENAME.rsplit('.', 1)[0]}{extension}"
+            if Config.PERSIST_PANORAMAS:
+                get_store().add(job.id, data, mimetype, extension, size=(pano.shape[1], pano.shape[0]), metadata={
+                    "capture_time": capture["wall_time"],
+                    "frame_skew": capture["frame_skew"],
+                    "cameras": [{"ip": c["ip"], "status": c["status"]} for c in capture["cameras"]],
+                    "stale_sectors": job.metadata["stale_sectors"],
+                    "stages": dict(job.stages)
+                }, created_at=job.started_at)
+                job.metadata["panorama_url"] = f"/panoramas/{job.id}"
+            if Config.TILES_ENABLED:
+                get_tile_cache().add(job.id, pano)
+                job.metadata["tiles_url"] = f"/panoramas/{job.id}/tiles"
+            # The stream carries full-size JPEGs; a coalesced job with other options is re-encoded for it
+            if job.options["format"] == "jpeg" and not job.options["max_width"]:
+                get_stream().publish(data, {"job_id": job.id, "capture_time": capture["wall_time"]})
+            elif Config.STREAM_ENABLED:
+                jpeg, _, _ = job.result("jpeg", Config.STREAM_JPEG_QUALITY, 0)
+                get_stream().publish(jpeg, {"job_id": job.id, "capture_time": capture["wall_time"]})
+
+            job.stages["total"] = time.time() - job.started_at
+            logger.info(f"✓ Job {job.id} finished in {job.stages['total']:.2f}s "
+                        f"({job.attached} attached requests)")
+
+        except Exception as e:
+            logger.error(f"✗ Job {job.id} failed: {e}")
+            error = f"Unexpected error during stitching: {e}"
+
+        finally:
+            # Frames stay in their slot until the stitch is done, then the slot can be reused
+            if capture is not None and capture["frames"] is not None:
+                get_frame_buffers().release(capture["frames"])
+            rss_end, rss_peak = rss()
+            with self._lock:
+                self._running -= 1
+            job.metadata["memory"] = {
+                "rss_start": rss_start,
+                "rss_peak": rss_peak,
+                "rss_end": rss_end,
+                "peak_exclusive": exclusive
+            }
+            # A shared peak includes the other jobs running at the time
+            if exclusive:
+                JOB_PEAK_RSS.observe(rss_peak)
+            job.spans = end_trace()
+            job.finish(error, error_status)
+            JOBS.inc(status=job.status)
+            if job.status == "done":
+                observe_stage("total", job.stages["total"])
+            with self._lock:
+                self._pending -= 1
+                if self._active is job:
+                    self._active = None
+
+
+def get_job_manager():
+    """Return the shared job manager"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
@@ -0,0 +1,205 @@
+import logging
+import resource
+import sys
+import threading
+from contextlib import contextmanager
+from numpy import dtype as _dtype, empty, prod
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Shared budget, see get_memory_budget
+_budget = None
+_budget_lock = threading.Lock()
+
+# Scratch buffers reused by every stitch running in the same thread, and their reservation
+_scratch = threading.local()
+
+
+def rss():
+    """
+    Resident set size of the process
+
+    Returns:
+        tuple: (current bytes, peak bytes since start or the last reset_peak)
+    """
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f if line.startswith(("VmRSS", "VmHWM")))
+        return int(fields["VmRSS"].split()[0]) * 1024, int(fields["VmHWM"].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak *= 1 if sys.platform == "darwin" else 1024
+        return peak, peak
+
+
+def reset_peak():
+    """Restart the kernel's peak RSS counter (Linux only), returns True on success"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def scratch(name, shape, dtype):
+    """
+    Per-thread scratch array, grown when needed and reused across stitches
+
+    The returned array is a view into the thread's buffer for name and is
+    only valid until the next scratch() call with the same name. Callers
+    reserve the buffers with reserve_scratch().
+
+    Args:
+        name (str): Buffer name
+        shape (tuple): Shape of the returned array
+        dtype: numpy dtype
+
+    Returns:
+        numpy array: Uninitialized contiguous array
+    """
+    dtype = _dtype(dtype)
+    buffers = getattr(_scratch, "buffers", None)
+    if buffers is None:
+        buffers = _scratch.buffers = {}
+    size = int(prod(shape))
+    key = (name, dtype.str)
+    buffer = buffers.get(key)
+    if buffer is None or buffer.size < size:
+        buffer = buffers[key] = empty(size, dtype=dtype)
+    return buffer[:size].reshape(shape)
+
+
+def scratch_bytes():
+    """Bytes held by the current thread's scratch buffers"""
+    return sum(buffer.nbytes for buffer in getattr(_scratch, "buffers", {}).values())
+
+
+@contextmanager
+def reserve_scratch(fixed_bytes, scratch_nbytes):
+    """
+    Reserve a stitch's working memory, part of which lives in this thread's scratch buffers
+
+    The scratch buffers outlive the stitch, so afterwards their bytes stay
+    reserved under the thread until its next reserve_scratch(). Buffers
+    larger than the new stitch needs are freed instead of kept unaccounted.
+
+    Args:
+        fixed_bytes (int): Bytes the stitch allocates and frees itself
+        scratch_nbytes (int): Most bytes of scratch() buffers the stitch uses
+
+    Yields:
+        _Reservation: The stitch's reservation
+    """
+    held = getattr(_scratch, "reservation", None)
+    if held is not None:
+        held.release()
+        _scratch.reservation = None
+    if scratch_bytes() > scratch_nbytes:
+        _scratch.buffers = {}
+
+    with get_memory_budget().reserve(fixed_bytes + scratch_nbytes) as reservation:
+        try:
+            yield reservation
+        finally:
+            _scratch.reservation = reservation.keep(scratch_bytes())
+
+
+class MemoryBudget:
+    """Byte budget shared by concurrent stitches; reservations wait until they fit"""
+
+    def __init__(self, limit=None):
+        """
+        Args:
+            limit (int): Budget in bytes, defaults to Config.MEMORY_BUDGET
+        """
+        self.limit = limit or Config.MEMORY_BUDGET
+        self.used = 0
+        self._condition = threading.Condition()
+
+    def reserve(self, nbytes):
+        """
+        Context manager holding nbytes of the budget
+
+        A reservation larger than the whole budget still runs, alone, so a
+        single oversized stitch degrades to running serially instead of
+        deadlocking.
+        """
+        return _Reservation(self, nbytes)
+
+    def _acquire(self, nbytes):
+        with self._condition:
+            self._condition.wait_for(lambda: self.used == 0 or self.used + nbytes <= self.limit)
+            self.used += nbytes
+
+    def _release(self, nbytes):
+        with self._condition:
+            self.used -= nbytes
+            self._condition.notify_all()
+
+
+class _Reservation:
+    def __init__(self, budget, nbytes):
+        self.budget = budget
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.budget._acquire(self.nbytes)
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def keep(self, nbytes):
+        """
+        Split nbytes off this reservation into one that outlives the with block
+
+        For buffers that stay resident after a stitch; the bytes never leave
+        the budget, so nothing can grab them in between.
+
+        Returns:
+            _Reservation: Held until its release()
+        """
+        nbytes = min(nbytes, self.nbytes)
+        self.nbytes -= nbytes
+        return _Reservation(self.budget, nbytes)
+
+    def release(self):
+        """Give the bytes back, once"""
+        nbytes, self.nbytes = self.nbytes, 0
+        if nbytes:
+            self.budget._release(nbytes)
+
+
+def band_rows(height, fixed_bytes, row_bytes):
+    """
+    Rows per band so the fixed buffers plus one band fit Config.MEMORY_BUDGET
+
+    Args:
+        height (int): Total rows
+        fixed_bytes (int): Bytes needed regardless of the band height
+        row_bytes (int): Working bytes per band row
+
+    Returns:
+        int: Band height, at least Config.MEMORY_MIN_BAND_ROWS
+    """
+    available = Config.MEMORY_BUDGET - fixed_bytes
+    rows = available // row_bytes if row_bytes else height
+    return int(min(height, max(Config.MEMORY_MIN_BAND_ROWS, rows)))
+
+
+def memory_stats():
+    """Process RSS and budget usage for /health"""
+    current, peak = rss()
+    budget = get_memory_budget()
+    return {"rss": current, "rss_peak": peak, "budget": budget.limit, "reserved": budget.used}
+
+
+def get_memory_budget():
+    """Return the shared memory budget"""
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = MemoryBudget()
+        return _budget
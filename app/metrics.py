@@ -0,0 +1,171 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from a single remap up to a slow capture
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+# Memory buckets in bytes, 128 MB up to 8 GB
+MEMORY_BUCKETS = tuple(2**20 * mb for mb in (128, 256, 512, 768, 1024, 1536, 2048, 3072, 4096, 8192))
+
+# Every metric, in registration order, for render_metrics
+REGISTRY = []
+
+# Spans of the trace active in the current thread, see start_trace
+_trace = threading.local()
+
+
+class _Metric:
+    """Base class for labelled Prometheus metrics"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{self._labels(key)} {value}"]
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            entry["buckets"][bisect.bisect_left(self.buckets, value)] += 1
+            entry["sum"] += value
+            entry["count"] += 1
+
+    def _render_value(self, key, value):
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), value["buckets"]):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            lines.append(f"{self.name}_bucket{self._labels(key, {'le': le})} {cumulative}")
+        lines.append(f"{self.name}_sum{self._labels(key)} {value['sum']}")
+        lines.append(f"{self.name}_count{self._labels(key)} {value['count']}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "panorama_stage_seconds", "Wall time of each pipeline stage", ["stage"])
+PI_FETCH_SECONDS = Histogram(
+    "panorama_pi_fetch_seconds", "Latency of one frame fetch per camera", ["camera"])
+PI_FETCH_BYTES = Counter(
+    "panorama_pi_fetch_bytes_total", "Bytes received per camera", ["camera"])
+PI_FETCHES = Counter(
+    "panorama_pi_fetches_total", "Frame fetches per camera and outcome", ["camera", "status"])
+KEYPOINTS = Histogram(
+    "panorama_keypoints", "Keypoints detected per frame", ["backend"], COUNT_BUCKETS)
+MATCHES = Histogram(
+    "panorama_matches", "Descriptor matches per camera pair", ["backend"], COUNT_BUCKETS)
+INLIERS = Histogram(
+    "panorama_inliers", "RANSAC inliers per camera pair", ["backend"], COUNT_BUCKETS)
+INCREMENTAL_CAMERAS = Counter(
+    "panorama_incremental_cameras_total", "Cameras reused or re-composed by incremental stitching", ["outcome"])
+PI_HEDGES = Counter(
+    "panorama_pi_hedged_requests_total", "Second /capture requests sent after a slow or failed first one",
+    ["camera", "reason"])
+INGEST_FRAMES = Counter(
+    "panorama_ingested_frames_total", "Frames pushed to /ingest by camera", ["camera"])
+JOBS = Counter(
+    "panorama_jobs_total", "Finished stitch jobs by outcome", ["status"])
+JOB_PEAK_RSS = Histogram(
+    "panorama_job_peak_rss_bytes", "Peak resident memory of the process during a stitch job",
+    buckets=MEMORY_BUCKETS)
+
+
+def observe_stage(stage, seconds):
+    """Record a stage duration measured elsewhere, e.g. in a worker process"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    spans = getattr(_trace, "spans", None)
+    if spans is not None:
+        spans.append({"name": stage, "start": time.time() - seconds, "duration": seconds})
+
+
+@contextmanager
+def stage(name, **attributes):
+    """
+    Time a pipeline stage into panorama_stage_seconds and the active trace
+
+    Args:
+        name (str): Stage label
+        **attributes: Extra fields stored on the trace span
+    """
+    start_wall = time.time()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.observe(duration, stage=name)
+        spans = getattr(_trace, "spans", None)
+        if spans is not None:
+            spans.append({"name": name, "start": start_wall, "duration": duration, **attributes})
+
+
+def start_trace():
+    """Collect spans of stages that run in the current thread"""
+    _trace.spans = []
+
+
+def end_trace():
+    """Stop collecting spans and return them"""
+    spans = getattr(_trace, "spans", None)
+    _trace.spans = None
+    return spans or []
+
+
+def render_metrics():
+    """Render every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
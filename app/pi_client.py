@@ -1,41 +1,399 @@
 import requests
-from io import BytesIO
-from PIL import Image
-import numpy as np
-import cv2
+from requests.adapters import HTTPAdapter
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import logging
+import threading
+import time
+from numpy import percentile
 from config import Config
+from .encoding import decode_image
+from .metrics import PI_FETCH_BYTES, PI_FETCH_SECONDS, PI_FETCHES, PI_HEDGES, observe_stage, stage
 
+logger = logging.getLogger(__name__)
+
+# Keep-alive sessions, one per Pi, shared by every capture
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Capture thread pool, created on first use and reused across requests
+_executor = None
+_executor_lock = threading.Lock()
+
+# Threads running the individual /capture requests, including hedged ones
+_request_executor = None
+
+# Recent /capture latencies and the last good frame of every Pi
+_latencies = {}
+_last_good = {}
+_history_lock = threading.Lock()
+
+# Camera statuses that contribute a frame to a capture's images, in camera order
+CAPTURED_STATUSES = ("ok", "stale")
+
+
+def _get_session(ip):
+    """Return the pooled keep-alive session for a Raspberry Pi"""
+    with _sessions_lock:
+        session = _sessions.get(ip)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.CAPTURE_POOL_SIZE)
+            session.mount("http://", adapter)
+            _sessions[ip] = session
+        return session
+
+
+def pi_url(ip, path):
+    """URL of an endpoint on a Raspberry Pi; ip may carry its own port ("host:port")"""
+    host = ip if ":" in ip else f"{ip}:{Config.PI_PORT}"
+    return f"http://{host}{path}"
+
+
+def _get_executor():
+    """Return the shared capture thread pool"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=Config.CAPTURE_MAX_WORKERS,
+                thread_name_prefix="capture"
+            )
+        return _executor
+
+
+def _get_request_executor():
+    """Return the pool running single /capture requests, two per camera when hedging"""
+    global _request_executor
+    with _executor_lock:
+        if _request_executor is None:
+            _request_executor = ThreadPoolExecutor(
+                max_workers=Config.CAPTURE_MAX_WORKERS * 2,
+                thread_name_prefix="capture-request"
+            )
+        return _request_executor
+
+
+def hedge_delay(ip):
+    """
+    Seconds to wait on a /capture before sending a second one: the Pi's p95
+    latency, or Config.HEDGE_DEFAULT_DELAY until Config.HEDGE_MIN_SAMPLES were seen
+    """
+    with _history_lock:
+        latencies = list(_latencies.get(ip, ()))
+    if len(latencies) < Config.HEDGE_MIN_SAMPLES:
+        return Config.HEDGE_DEFAULT_DELAY
+    return float(percentile(latencies, 95))
+
+
+def _request_frame(ip, timeout):
+    """One /capture request, returns the encoded frame and records its latency"""
+    start = time.monotonic()
+    response = _get_session(ip).get(pi_url(ip, Config.CAPTURE_ENDPOINT), timeout=timeout)
+    response.raise_for_status()
+    with _history_lock:
+        latencies = _latencies.get(ip)
+        if latencies is None:
+            latencies = _latencies[ip] = deque(maxlen=Config.HEDGE_LATENCY_WINDOW)
+        latencies.append(time.monotonic() - start)
+    return response.content
+
+
+def _request_hedged(ip, started_at, deadline_at, result):
+    """
+    Fetch a frame, sending a second request when the first is slower than the
+    Pi's p95 latency or fails early, and return whichever answers first
+
+    Raises:
+        requests.exceptions.RequestException: When no request succeeded by deadline_at
+    """
+    executor = _get_request_executor()
+    pending = {executor.submit(_request_frame, ip, min(Config.REQUEST_TIMEOUT, deadline_at - started_at))}
+    hedge_at = started_at + hedge_delay(ip) if Config.HEDGE_REQUESTS else None
+    error = requests.exceptions.Timeout("capture deadline exceeded")
+
+    while True:
+        now = time.monotonic()
+        if hedge_at is not None and (now >= hedge_at or not pending) and now < deadline_at:
+            reason = "slow" if pending else "error"
+            pending.add(executor.submit(_request_frame, ip, min(Config.REQUEST_TIMEOUT, deadline_at - now)))
+            hedge_at = None
+            result["hedged"] = reason
+            PI_HEDGES.inc(camera=ip, reason=reason)
+            logger.debug(f"Hedging /capture on {ip} ({reason})")
+        if not pending or now >= deadline_at:
+            raise error
+
+        wake_at = deadline_at if hedge_at is None else min(hedge_at, deadline_at)
+        done, pending = wait(pending, timeout=max(0.0, wake_at - now), return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                return future.result()
+            except requests.exceptions.RequestException as e:
+                error = e
+
+
+def _fetch_one(index, ip, deadline_at, writer=None):
+    """
+    Fetch and decode a single frame from one Raspberry Pi
+
+    Args:
+        index (int): Camera position in the rig
+        ip (str): Raspberry Pi address
+        deadline_at (float): time.monotonic() value by which the capture must finish
+        writer (FrameWriter): Shared memory slot the decoded frame is copied into
+
+    Returns:
+        dict: Camera result with status, timing, byte count, decoded BGR image
+            and the encoded bytes
+    """
+    started_at = time.monotonic()
+    result = {
+        "index": index,
+        "ip": ip,
+        "status": "error",
+        "image": None,
+        "encoded": None,
+        "shared": False,
+        "hedged": None,
+        "bytes": 0,
+        "error": None
+    }
+
+    try:
+        remaining = deadline_at - started_at
+        if remaining <= 0:
+            raise requests.exceptions.Timeout("capture deadline exceeded before request")
+
+        content = _request_hedged(ip, started_at, deadline_at, result)
+        result["bytes"] = len(content)
+        PI_FETCH_SECONDS.observe(time.monotonic() - started_at, camera=ip)
+        PI_FETCH_BYTES.inc(result["bytes"], camera=ip)
+
+        # Decode straight into the pipeline's canonical BGR uint8 layout
+        with stage("decode"):
+            img_np = _decode_frame(index, content, writer, result)
+        with _history_lock:
+            _last_good[ip] = (content, time.time())
+        result["image"] = img_np
+        result["encoded"] = content
+        result["status"] = "ok"
+        logger.debug(f"✓ Successfully fetched from {ip} - Image shape: {img_np.shape}")
+
+    except requests.exceptions.Timeout:
+        result["status"] = "timeout"
+        result["error"] = "timeout"
+        logger.warning(f"✗ Timeout fetching from {ip}")
+    except requests.exceptions.RequestException as e:
+        result["error"] = str(e)
+        logger.warning(f"✗ Request error fetching from {ip}: {e}")
+    except Exception as e:
+        result["error"] = str(e)
+        logger.error(f"✗ Error processing image from {ip}: {e}")
+
+    result["started_at"] = started_at
+    result["finished_at"] = time.monotonic()
+    result["elapsed"] = result["finished_at"] - started_at
+    PI_FETCHES.inc(camera=ip, status=result["status"])
+    return result
+
+
+def _decode_frame(index, content, writer, result):
+    """Decode a frame, into its shared memory slot when capturing with one"""
+    image = decode_image(content)
+    if writer is not None:
+        shared = _write_shared(writer, index, image)
+        if shared is not None:
+            image = shared
+            result["shared"] = True
+    return image
+
+
+def _stale_frame(camera, writer):
+    """
+    Substitute a camera's last good frame when it is recent enough
+
+    Args:
+        camera (dict): Camera result that missed the capture, updated in place
+        writer (FrameWriter): Shared memory slot of this capture
+
+    Returns:
+        bool: True when the camera now carries a stale frame
+    """
+    with _history_lock:
+        last_good = _last_good.get(camera["ip"])
+    if last_good is None:
+        return False
+    content, captured_at = last_good
+    age = time.time() - captured_at
+    if age > Config.STALE_MAX_AGE:
+        return False
+    try:
+        image = _decode_frame(camera["index"], content, writer, camera)
+    except ValueError:
+        return False
+    logger.warning(f"✗ Using the {age:.1f}s old frame of {camera['ip']} ({camera['status']})")
+    PI_FETCHES.inc(camera=camera["ip"], status="stale")
+    camera.update({"status": "stale", "missed": camera["status"], "age": age,
+                   "image": image, "encoded": content})
+    return True
+
+
+def _write_shared(writer, index, image):
+    """Copy a frame into its shared memory slot, None if that is not possible"""
+    try:
+        return writer.write(index, image)
+    except OSError as e:
+        logger.warning(f"✗ Frame buffer unavailable for camera {index}, keeping a private copy: {e}")
+        return None
+
+
+def capture_images(ips=None, deadline=None, frame_buffers=False):
+    """
+    Capture frames from all Raspberry Pi devices concurrently
+
+    With Config.CAPTURE_SOURCE "push" (or "auto" and a complete set) the frames
+    come from the /ingest cache instead, see FrameCache.capture.
+
+    Every camera is requested at the same time over its pooled session, and the
+    whole capture is bounded by a single deadline. Cameras that have not answered
+    by then are reported with status "deadline" and left out of the images.
+    With Config.CAPTURE_SKIP_OFFLINE, Pis the health monitor knows to be down
+    are reported with status "offline" without waiting for their timeout.
+    Slow requests are hedged, see _request_hedged, and with Config.STALE_FALLBACK
+    a camera that still misses the capture contributes its last good frame if
+    it is at most Config.STALE_MAX_AGE old, reported with status "stale".
+
+    Args:
+        ips (list): Raspberry Pi addresses, defaults to Config.RASPBERRY_PI_IPS
+        deadline (float): Global capture deadline in seconds, defaults to Config.CAPTURE_DEADLINE
+        frame_buffers (bool): Decode into a shared memory slot (with Config.FRAME_BUFFERS);
+            the caller must hand "frames" back to FrameBufferPool.release when done
+
+    Returns:
+        dict: {"images": [...], "encoded": [...], "frames": FrameSet or None, "cameras": [...],
+            "wall_time": float, "frame_skew": float, "stale": [...]} where encoded holds the
+            JPEG bytes of each image, frames the shared memory handle of the images and
+            stale the indices of cameras using their last good frame
+    """
+    ips = Config.RASPBERRY_PI_IPS if ips is None else ips
+    deadline = Config.CAPTURE_DEADLINE if deadline is None else deadline
+
+    # Frames pushed to /ingest need no network wait; "auto" pulls when they are incomplete
+    if Config.CAPTURE_SOURCE in ("push", "auto"):
+        from .ingest import get_frame_cache
+
+        pushed = get_frame_cache().capture(ips)
+        if Config.CAPTURE_SOURCE == "push" or pushed["complete"]:
+            return pushed
+        logger.info("Pushed frames incomplete, pulling from the Raspberry Pis")
+
+    from .health import get_health_monitor
+
+    logger.info(f"Fetching images from {len(ips)} Raspberry Pi devices...")
+
+    monitor = get_health_monitor()
+    skipped = set()
+    if Config.CAPTURE_SKIP_OFFLINE:
+        skipped = {ip for ip in ips if monitor.is_down(ip)}
+
+    writer = None
+    if frame_buffers and Config.FRAME_BUFFERS:
+        from .framebuffers import get_frame_buffers
+
+        writer = get_frame_buffers().acquire()
+
+    start = time.monotonic()
+    deadline_at = start + deadline
+    executor = _get_executor()
+    futures = [
+        None if ip in skipped else executor.submit(_fetch_one, i, ip, deadline_at, writer)
+        for i, ip in enumerate(ips)
+    ]
+    done, _ = wait([f for f in futures if f is not None], timeout=max(0.0, deadline_at - time.monotonic()))
 
-def fetch_images():
-    """Fetch images from all configured Raspberry Pi devices"""
     images = []
-    successful_fetches = 0
+    encoded = []
+    shared = []
+    cameras = []
+    for i, (ip, future) in enumerate(zip(ips, futures)):
+        if future is None:
+            logger.warning(f"✗ Skipping {ip}, known to be offline")
+            PI_FETCHES.inc(camera=ip, status="offline")
+            camera = {
+                "index": i,
+                "ip": ip,
+                "status": "offline",
+                "image": None,
+                "encoded": None,
+                "bytes": 0,
+                "error": "offline according to the health monitor",
+                "started_at": start,
+                "finished_at": None,
+                "elapsed": None
+            }
+        elif future in done:
+            camera = future.result()
+        else:
+            future.cancel()
+            logger.warning(f"✗ Capture deadline exceeded for {ip}")
+            PI_FETCHES.inc(camera=ip, status="deadline")
+            camera = {
+                "index": i,
+                "ip": ip,
+                "status": "deadline",
+                "image": None,
+                "encoded": None,
+                "bytes": 0,
+                "error": f"no response within {deadline}s",
+                "started_at": start,
+                "finished_at": None,
+                "elapsed": None
+            }
+
+        if camera["status"] != "offline":
+            monitor.record(ip, camera["status"] == "ok", error=camera["error"])
+        if camera["status"] != "ok" and Config.STALE_FALLBACK:
+            camera.setdefault("shared", False)
+            _stale_frame(camera, writer)
+        if camera["status"] in CAPTURED_STATUSES:
+            images.append(camera["image"])
+            encoded.append(camera["encoded"])
+            shared.append(camera["shared"])
+        cameras.append({key: value for key, value in camera.items() if key not in ("image", "encoded", "shared")})
 
-    print(f"Fetching images from {len(Config.RASPBERRY_PI_IPS)} Raspberry Pi devices...")
+    # Late fetches past the deadline can no longer write once the slot is published or aborted
+    frames = None
+    if writer is not None:
+        if images and all(shared):
+            frames = writer.publish([c["index"] for c in cameras if c["status"] in CAPTURED_STATUSES])
+        else:
+            images = [image.copy() if is_shared else image for image, is_shared in zip(images, shared)]
+            writer.abort()
 
-    for i, ip in enumerate(Config.RASPBERRY_PI_IPS):
-        try:
-            print(f"Fetching image {i + 1}/{len(Config.RASPBERRY_PI_IPS)} from {ip}")
-            url = f"http://{ip}:8080{Config.CAPTURE_ENDPOINT}"
-            response = requests.get(url, timeout=Config.REQUEST_TIMEOUT)
-            response.raise_for_status()
+    wall_time = time.monotonic() - start
+    observe_stage("capture", wall_time)
+    arrivals = [c["finished_at"] for c in cameras if c["status"] == "ok"]
+    frame_skew = max(arrivals) - min(arrivals) if arrivals else 0.0
 
-            # Convert PIL image to OpenCV format (BGR)
-            img = Image.open(BytesIO(response.content))
-            img_np = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-            images.append(img_np)
-            successful_fetches += 1
-            print(f"✓ Successfully fetched from {ip} - Image shape: {img_np.shape}")
+    stale = [c["index"] for c in cameras if c["status"] == "stale"]
+    logger.info(f"Successfully fetched {len(images) - len(stale)}/{len(ips)} images in {wall_time:.2f}s "
+                f"(frame skew {frame_skew * 1000:.0f} ms)" + (f", stale cameras {stale}" if stale else ""))
 
-        except requests.exceptions.Timeout:
-            print(f"✗ Timeout fetching from {ip}")
-        except requests.exceptions.RequestException as e:
-            print(f"✗ Request error fetching from {ip}: {e}")
-        except Exception as e:
-            print(f"✗ Error processing image from {ip}: {e}")
+    return {
+        "images": images,
+        "encoded": encoded,
+        "frames": frames,
+        "cameras": cameras,
+        "wall_time": wall_time,
+        "frame_skew": frame_skew,
+        "stale": stale
+    }
 
-    print(f"Successfully fetched {successful_fetches}/{len(Config.RASPBERRY_PI_IPS)} images")
-    return images
+
+def fetch_images():
+    """Fetch images from all configured Raspberry Pi devices"""
+    return capture_images()["images"]
 
 
 def validate_images(images):
@@ -46,27 +404,17 @@ def validate_images(images):
     # Additional validation - check if images have reasonable dimensions
     for i, img in enumerate(images):
         if img is None or len(img.shape) != 3:
-            print(f"Invalid image at index {i}")
+            logger.warning(f"Invalid image at index {i}")
             return False
         if img.shape[0] < 100 or img.shape[1] < 100:
-            print(f"Image {i} too small: {img.shape}")
+            logger.warning(f"Image {i} too small: {img.shape}")
             return False
 
     return True
 
 
 def check_pi_status():
-    """Check the status of all configured Raspberry Pi devices"""
-    pi_status = []
-    for ip in Config.RASPBERRY_PI_IPS:
-        try:
-            response = requests.get(f"http://{ip}:8080/status", timeout=3)
-            pi_status.append({
-                "ip": ip,
-                "status": "online",
-                "response_time": response.elapsed.total_seconds()
-            })
-        except:
-            pi_status.append({"ip": ip, "status": "offline"})
+    """Status of all configured Raspberry Pi devices, served from the health monitor's cache"""
+    from .health import get_health_monitor
 
-    return pi_status
+    return get_health_monitor().snapshot()
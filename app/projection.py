@@ -0,0 +1,283 @@
+import cv2
+import logging
+import threading
+import time
+from numpy import *
+from config import Config
+from .metrics import stage
+from .rig import compose
+
+logger = logging.getLogger(__name__)
+
+PROJECTION_MODES = ("cylindrical", "equirectangular")
+
+# Compiled projection for the active rig geometry, rebuilt when it changes
+_compiled = None
+_compiled_key = None
+_compiled_lock = threading.Lock()
+
+
+def focal_length(frame_width):
+    """Focal length in pixels, from Config.CAMERA_FOCAL or the horizontal field of view"""
+    if Config.CAMERA_FOCAL:
+        return float(Config.CAMERA_FOCAL)
+    return (frame_width / 2) / tan(radians(Config.CAMERA_HFOV) / 2)
+
+
+def camera_yaws(homographies, frame_shapes):
+    """
+    Heading of every camera in radians, -pi being the left edge of the panorama
+
+    The yaw between neighbours is read from where the centre of camera i+1
+    lands in camera i. The first camera starts at the left edge; whatever
+    angle the chain leaves over closes the loop between the last and first
+    camera, so chain error never tears the wrap-around seam open.
+
+    Args:
+        homographies (list): Entry i maps camera i+1 onto camera i, or None
+            for evenly spaced cameras
+        frame_shapes (list): Shapes of the camera frames
+
+    Returns:
+        numpy array: Yaw per camera
+    """
+    camera_count = len(frame_shapes)
+    if Config.CAMERA_YAWS is not None:
+        return radians(array(Config.CAMERA_YAWS, dtype=float64))
+
+    height, width = frame_shapes[0][:2]
+    f = focal_length(width)
+    first = -pi + arctan2(width / 2, f)
+    if homographies is None:
+        return first + arange(camera_count) * 2 * pi / camera_count
+
+    deltas = []
+    for H, shape in zip(homographies, frame_shapes[1:]):
+        h, w = shape[:2]
+        x, _, z = H @ array([w / 2, h / 2, 1.0])
+        deltas.append(arctan2(x / z - width / 2, f))
+        height, width = h, w
+
+    closing = 2 * pi - sum(deltas)
+    if closing <= 0:
+        logger.warning("Estimated camera yaws exceed 360°, falling back to even spacing")
+        return first + arange(camera_count) * 2 * pi / camera_count
+    logger.debug(f"Camera yaws {degrees(cumsum([0] + deltas)).round(1)}, closing gap {degrees(closing):.1f}°")
+    return first + concatenate([[0.0], cumsum(deltas)])
+
+
+def project_points(points, yaw, frame_shape, mode=None, canvas_size=None):
+    """
+    Map camera pixel coordinates into the 360° panorama, the inverse of the remap tables
+
+    Args:
+        points (numpy array): Nx2 pixel coordinates in the camera frame
+        yaw (float): Camera heading in radians, see camera_yaws
+        frame_shape (tuple): Shape of the camera frame
+        mode (str): One of PROJECTION_MODES, defaults to Config.PROJECTION_MODE
+        canvas_size (tuple): Panorama (width, height), defaults to the configured size
+
+    Returns:
+        numpy array: Nx2 panorama coordinates, x not wrapped into [0, width)
+    """
+    mode = mode or Config.PROJECTION_MODE
+    width_panorama, height_panorama = canvas_size or (Config.PROJECTION_WIDTH, Config.PROJECTION_HEIGHT)
+    height, width = frame_shape[:2]
+    f = focal_length(width)
+    points = asarray(points, dtype=float64).reshape(-1, 2)
+    dx, dy = points[:, 0] - width / 2, points[:, 1] - height / 2
+    distance = hypot(dx, f)
+    half_vfov = radians(Config.PROJECTION_VFOV or Config.CAMERA_VFOV) / 2
+
+    theta = yaw + arctan2(dx, f)
+    if mode == "cylindrical":
+        row = dy / distance / tan(half_vfov)
+    else:
+        row = arctan2(dy, distance) / half_vfov
+    u = (theta + pi) * width_panorama / (2 * pi) - 0.5
+    v = (row + 1) / 2 * height_panorama - 0.5
+    return stack([u, v], axis=1)
+
+
+class CompiledProjection:
+    """Remap tables projecting every camera into its sector of a fixed-size 360° panorama"""
+
+    def __init__(self, yaws, frame_shapes, mode=None, canvas_size=None, feather=None):
+        """
+        Compile the per-camera projections into lookup tables
+
+        Args:
+            yaws (list): Camera headings in radians, see camera_yaws
+            frame_shapes (list): (height, width) of every camera frame
+            mode (str): One of PROJECTION_MODES, defaults to Config.PROJECTION_MODE
+            canvas_size (tuple): Panorama (width, height), defaults to
+                (Config.PROJECTION_WIDTH, Config.PROJECTION_HEIGHT)
+            feather (int): Width in source pixels of the blend ramp at each frame edge
+        """
+        start_time = time.time()
+        self.mode = mode or Config.PROJECTION_MODE
+        if self.mode not in PROJECTION_MODES:
+            raise ValueError(f"Unknown projection {self.mode!r}, expected one of {PROJECTION_MODES}")
+        self.canvas_size = canvas_size or (Config.PROJECTION_WIDTH, Config.PROJECTION_HEIGHT)
+        self.frame_shapes = [tuple(shape[:2]) for shape in frame_shapes]
+        self.yaws = array(yaws, dtype=float64)
+        self.feather = feather or Config.COMPILED_RIG_FEATHER
+        self.cameras = []
+
+        width_panorama, height_panorama = self.canvas_size
+        weight_sum = zeros((height_panorama, width_panorama), dtype=float32)
+
+        for index, (yaw, (height, width)) in enumerate(zip(yaws, self.frame_shapes)):
+            camera = self._compile_camera(yaw, height, width)
+            if camera is None:
+                continue
+            camera["index"] = index
+            for target, source in self.segments(camera):
+                weight_sum[target] += camera["weights"][source]
+            self.cameras.append(camera)
+
+        # Normalize so the weights of overlapping cameras, across the wrap too, sum to one
+        weight_sum[weight_sum == 0] = 1
+        for camera in self.cameras:
+            weights = camera["weights"]
+            for target, source in self.segments(camera):
+                weights[source] /= weight_sum[target]
+            camera["weights"] = weights[:, :, newaxis]
+
+        self.nbytes = int(sum([
+            c["map1"].nbytes + c["map2"].nbytes + c["weights"].nbytes for c in self.cameras
+        ]))
+        logger.info(f"✓ Compiled {self.mode} projection for {len(self.frame_shapes)} cameras into "
+                    f"{width_panorama}x{height_panorama} ({self.nbytes / 2**20:.0f} MB) "
+                    f"in {time.time() - start_time:.2f}s")
+
+    def _compile_camera(self, yaw, height, width):
+        """Build the remap tables and raw feather weights of one camera sector"""
+        width_panorama, height_panorama = self.canvas_size
+        f = focal_length(width)
+        cx, cy = width / 2, height / 2
+        columns_per_radian = width_panorama / (2 * pi)
+
+        # Longitude does not depend on the row, so the sector is the frame's horizontal field of view
+        left, right = yaw - arctan2(cx, f), yaw + arctan2(width - cx, f)
+        x0 = int(floor((left + pi) * columns_per_radian))
+        x1 = int(ceil((right + pi) * columns_per_radian)) + 1
+        x0, x1 = x0 % width_panorama, x0 % width_panorama + int(minimum(x1 - x0, width_panorama))
+
+        theta = (arange(x0, x1, dtype=float64) + 0.5) / columns_per_radian - pi - yaw
+        theta = (theta + pi) % (2 * pi) - pi
+        row = (arange(height_panorama, dtype=float64) + 0.5) / height_panorama * 2 - 1
+        half_vfov = radians(Config.PROJECTION_VFOV or Config.CAMERA_VFOV) / 2
+
+        # Ray (sin theta, elevation, cos theta) of every panorama pixel, projected into the camera
+        if self.mode == "cylindrical":
+            elevation = row * tan(half_vfov)
+        else:
+            elevation = tan(row * half_vfov)
+        cos_theta = cos(theta)
+        facing = cos_theta > 1e-6
+        safe_cos = where(facing, cos_theta, 1.0)
+        map_x = broadcast_to(f * tan(theta) * facing + cx, (height_panorama, x1 - x0))
+        map_y = f * elevation[:, newaxis] / safe_cos[newaxis, :] + cy
+
+        inside = (facing[newaxis, :] & (map_x >= 0) & (map_x <= width - 1) & (map_y >= 0) & (map_y <= height - 1))
+        rows = flatnonzero(inside.any(axis=1))
+        if not rows.size:
+            logger.warning("Camera falls outside the panorama canvas, skipping")
+            return None
+        y0, y1 = int(rows[0]), int(rows[-1]) + 1
+        inside = inside[y0:y1]
+        map_x = where(inside, map_x[y0:y1], -1).astype(float32)
+        map_y = where(inside, map_y[y0:y1], -1).astype(float32)
+
+        # Feather weights grow from every frame edge over self.feather source pixels
+        edge = minimum(minimum(map_x, width - 1 - map_x), minimum(map_y, height - 1 - map_y))
+        weights = where(inside, clip((edge + 1) / self.feather, 0, 1), 0).astype(float32)
+
+        map1, map2 = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+        return {"roi": (x0, y0, x1, y1), "map1": map1, "map2": map2, "weights": weights}
+
+    def segments(self, camera):
+        """(canvas slice, sector slice) pairs, two when the sector wraps past 360°"""
+        width_panorama = self.canvas_size[0]
+        x0, y0, x1, y1 = camera["roi"]
+        rows = slice(y0, y1)
+        if x1 <= width_panorama:
+            return [((rows, slice(x0, x1)), (slice(None), slice(None)))]
+        split = width_panorama - x0
+        return [
+            ((rows, slice(x0, width_panorama)), (slice(None), slice(0, split))),
+            ((rows, slice(0, x1 - width_panorama)), (slice(None), slice(split, None))),
+        ]
+
+    def contribution(self, camera, image):
+        """Warped, weighted float32 contribution of one frame to its sector"""
+        warped = cv2.remap(
+            image, camera["map1"], camera["map2"], cv2.INTER_LINEAR,
+            borderMode=cv2.BORDER_CONSTANT
+        )
+        return warped * camera["weights"]
+
+    def stitch(self, images):
+        """
+        Compose the panorama with one remap and one weighted accumulation per camera
+
+        Args:
+            images (list): Frames in rig order, same sizes as at compile time
+
+        Returns:
+            numpy array: uint8 panorama of self.canvas_size
+        """
+        return compose(self, images)
+
+
+def yaw_drift(yaws, compiled_yaws, width_panorama=None):
+    """
+    Largest heading difference between two sets of camera yaws, in panorama pixels
+
+    Args:
+        yaws (numpy array): Camera headings in radians
+        compiled_yaws (numpy array): Headings to compare against
+        width_panorama (int): Panorama width covering 360°, defaults to Config.PROJECTION_WIDTH
+
+    Returns:
+        float: Maximum drift in output pixels, inf when the camera counts differ
+    """
+    width_panorama = width_panorama or Config.PROJECTION_WIDTH
+    if len(yaws) != len(compiled_yaws):
+        return float("inf")
+    difference = asarray(yaws, dtype=float64) - compiled_yaws
+    difference = arctan2(sin(difference), cos(difference))
+    return float(amax(abs(difference), initial=0)) * width_panorama / (2 * pi)
+
+
+def get_compiled_projection(homographies, frame_shapes):
+    """
+    Return the projection for this rig geometry, compiling it on first use
+
+    Yaws estimated per request jitter slightly, so the compiled projection is
+    kept while every camera stays within Config.PROJECTION_YAW_TOLERANCE
+    output pixels of the headings it was compiled for.
+
+    Args:
+        homographies (list): Pairwise homographies the camera yaws are read
+            from, None for evenly spaced cameras
+        frame_shapes (list): Shapes of the camera frames
+
+    Returns:
+        CompiledProjection
+    """
+    global _compiled, _compiled_key
+
+    yaws = camera_yaws(homographies, frame_shapes)
+    key = (
+        Config.PROJECTION_MODE, Config.PROJECTION_WIDTH, Config.PROJECTION_HEIGHT,
+        tuple(tuple(shape[:2]) for shape in frame_shapes)
+    )
+    with _compiled_lock:
+        if (_compiled is None or _compiled_key != key or
+                yaw_drift(yaws, _compiled.yaws) > Config.PROJECTION_YAW_TOLERANCE):
+            with stage("compile"):
+                _compiled = CompiledProjection(yaws, frame_shapes)
+            _compiled_key = key
+        return _compiled
@@ -0,0 +1,210 @@
+import cv2
+import logging
+import threading
+import time
+from numpy import *
+from config import Config
+from .alignment import global_transforms
+from .memory import band_rows, reserve_scratch, scratch
+from .metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Compiled rig for the active calibration, rebuilt when the calibration changes
+_compiled = None
+_compiled_key = None
+_compiled_lock = threading.Lock()
+
+
+class CompiledRig:
+    """Precomputed remap tables and blend weights for a fixed camera rig"""
+
+    def __init__(self, global_homographies, frame_shapes, canvas_size, feather=None):
+        """
+        Compile the per-camera warps into lookup tables
+
+        Args:
+            global_homographies (list): 3x3 matrices mapping each camera into the panorama
+            frame_shapes (list): (height, width) of every camera frame
+            canvas_size (tuple): Panorama (width, height)
+            feather (int): Width in pixels of the blend ramp at each frame edge
+        """
+        start_time = time.time()
+        self.canvas_size = canvas_size
+        self.frame_shapes = [tuple(shape[:2]) for shape in frame_shapes]
+        self.feather = feather or Config.COMPILED_RIG_FEATHER
+        self.cameras = []
+
+        width_panorama, height_panorama = canvas_size
+        weight_sum = zeros((height_panorama, width_panorama), dtype=float32)
+
+        for index, (H, (height, width)) in enumerate(zip(global_homographies, self.frame_shapes)):
+            camera = self._compile_camera(H, height, width, width_panorama, height_panorama)
+            if camera is None:
+                continue
+            camera["index"] = index
+            x0, y0, x1, y1 = camera["roi"]
+            weight_sum[y0:y1, x0:x1] += camera["weights"]
+            self.cameras.append(camera)
+
+        # Normalize so the weights of overlapping cameras sum to one
+        weight_sum[weight_sum == 0] = 1
+        for camera in self.cameras:
+            x0, y0, x1, y1 = camera["roi"]
+            camera["weights"] = (camera["weights"] / weight_sum[y0:y1, x0:x1])[:, :, newaxis]
+
+        logger.info(f"✓ Compiled rig for {len(self.frame_shapes)} cameras into "
+                    f"{width_panorama}x{height_panorama} in {time.time() - start_time:.2f}s")
+
+    def _compile_camera(self, H, height, width, width_panorama, height_panorama):
+        """Build the remap tables and raw feather weights of one camera"""
+        corners = float32([[0, 0], [width, 0], [width, height], [0, height]]).reshape(-1, 1, 2)
+        projected = cv2.perspectiveTransform(corners, H).reshape(-1, 2)
+
+        x0 = int(clip(floor(projected[:, 0].min()), 0, width_panorama))
+        x1 = int(clip(ceil(projected[:, 0].max()), 0, width_panorama))
+        y0 = int(clip(floor(projected[:, 1].min()), 0, height_panorama))
+        y1 = int(clip(ceil(projected[:, 1].max()), 0, height_panorama))
+        if x1 <= x0 or y1 <= y0:
+            logger.warning("Camera falls outside the panorama canvas, skipping")
+            return None
+
+        # Source coordinates of every panorama pixel in the camera's bounding box
+        xs, ys = meshgrid(arange(x0, x1, dtype=float32), arange(y0, y1, dtype=float32))
+        points = stack([xs, ys], axis=-1).reshape(-1, 1, 2)
+        source = cv2.perspectiveTransform(points, linalg.inv(H)).reshape(y1 - y0, x1 - x0, 2)
+        map_x = ascontiguousarray(source[:, :, 0])
+        map_y = ascontiguousarray(source[:, :, 1])
+
+        # Feather weights grow from the frame edge over self.feather pixels
+        inside = ((map_x >= 0) & (map_x <= width - 1) & (map_y >= 0) & (map_y <= height - 1))
+        distance = cv2.distanceTransform(inside.astype(uint8), cv2.DIST_L2, 3)
+        weights = clip(distance / self.feather, 0, 1).astype(float32)
+
+        map1, map2 = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+        return {"roi": (x0, y0, x1, y1), "map1": map1, "map2": map2, "weights": weights}
+
+    def segments(self, camera):
+        """(canvas slice, contribution slice) pairs covered by a camera"""
+        x0, y0, x1, y1 = camera["roi"]
+        return [((slice(y0, y1), slice(x0, x1)), (slice(None), slice(None)))]
+
+    def contribution(self, camera, image):
+        """Warped, weighted float32 contribution of one frame to its ROI"""
+        warped = cv2.remap(
+            image, camera["map1"], camera["map2"], cv2.INTER_LINEAR,
+            borderMode=cv2.BORDER_CONSTANT
+        )
+        return warped * camera["weights"]
+
+    def stitch(self, images):
+        """
+        Compose a panorama with one remap and one weighted accumulation per camera
+
+        Args:
+            images (list): Frames in rig order, same sizes as at compile time
+
+        Returns:
+            numpy array: uint8 panorama of self.canvas_size
+        """
+        return compose(self, images)
+
+
+def working_bytes(compiled):
+    """
+    Bytes compose() needs for a compiled rig or projection
+
+    Args:
+        compiled (CompiledRig or CompiledProjection): Compiled geometry
+
+    Returns:
+        tuple: (fixed bytes, bytes per band row)
+    """
+    width_panorama, height_panorama = compiled.canvas_size
+    roi_width = int(amax([c["roi"][2] - c["roi"][0] for c in compiled.cameras], initial=0))
+    # uint8 panorama, plus per row: the float32 band and one camera's uint8 remap and float32 product
+    return width_panorama * height_panorama * 3, width_panorama * 3 * 4 + roi_width * 3 * 5
+
+
+def compose(compiled, images):
+    """
+    Compose a compiled rig or projection in horizontal bands that fit Config.MEMORY_BUDGET
+
+    Only the uint8 panorama is allocated per stitch; the float32 band and the
+    per-camera remap buffers are per-thread scratch arrays reused by the next
+    stitch, and stay reserved in the memory budget in between. Tall panoramas under a tight budget are accumulated a band of rows
+    at a time, with identical output.
+
+    Args:
+        compiled (CompiledRig or CompiledProjection): Compiled geometry
+        images (list): BGR frames in rig order, same sizes as at compile time
+
+    Returns:
+        numpy array: uint8 panorama of compiled.canvas_size
+    """
+    width_panorama, height_panorama = compiled.canvas_size
+    fixed, per_row = working_bytes(compiled)
+    rows = band_rows(height_panorama, fixed, per_row)
+    bands = range(0, height_panorama, rows)
+
+    with reserve_scratch(fixed, rows * per_row), \
+            stage("compose", cameras=len(images), bands=len(bands)):
+        result = empty((height_panorama, width_panorama, 3), dtype=uint8)
+        for b0 in bands:
+            b1 = int(minimum(b0 + rows, height_panorama))
+            band = scratch("band", (b1 - b0, width_panorama, 3), float32)
+            band.fill(0)
+
+            for camera in compiled.cameras:
+                x0, y0, x1, y1 = camera["roi"]
+                r0, r1 = int(maximum(y0, b0)), int(minimum(y1, b1))
+                if r0 >= r1:
+                    continue
+                weighted = _band_contribution(camera, images[camera["index"]], r0 - y0, r1 - y0)
+                for (_, columns), (_, source) in compiled.segments(camera):
+                    band[r0 - b0:r1 - b0, columns] += weighted[:, source]
+
+            rint(band, out=band)
+            result[b0:b1] = band
+        return result
+
+
+def _band_contribution(camera, image, r0, r1):
+    """Weighted contribution of ROI rows r0:r1 of one camera, in scratch buffers"""
+    map1 = camera["map1"][r0:r1]
+    shape = map1.shape[:2] + (3,)
+    warped = cv2.remap(
+        image, map1, camera["map2"][r0:r1], cv2.INTER_LINEAR,
+        dst=scratch("warped", shape, uint8), borderMode=cv2.BORDER_CONSTANT
+    )
+    weighted = scratch("weighted", shape, float32)
+    multiply(warped, camera["weights"][r0:r1], out=weighted)
+    return weighted
+
+
+def compile_rig(calibration, frame_shapes):
+    """
+    Compile a calibration into a CompiledRig aligned to the reference camera
+
+    Args:
+        calibration (RigCalibration): Pairwise rig calibration
+        frame_shapes (list): Shapes of the camera frames
+
+    Returns:
+        CompiledRig
+    """
+    transforms, canvas_size = global_transforms(calibration.homographies, frame_shapes)
+    return CompiledRig(transforms, frame_shapes, canvas_size)
+
+
+def get_compiled_rig(calibration, frame_shapes):
+    """Return the compiled rig for this calibration, compiling it on first use"""
+    global _compiled, _compiled_key
+
+    key = (calibration.fingerprint, calibration.created_at)
+    with _compiled_lock:
+        if _compiled is None or _compiled_key != key:
+            with stage("compile"):
+                _compiled = compile_rig(calibration, frame_shapes)
+            _compiled_key = key
+        return _compiled
@@ -1,12 +1,26 @@
-from flask import Blueprint, send_file, jsonify, request
-from .pi_client import fetch_images, validate_images, check_pi_status
-from .stitching import stitch_images
-from .utils import cleanup_old_files
+from flask import Blueprint, Response, send_file, jsonify, request
+from .pi_client import CAPTURED_STATUSES, capture_images, validate_images, check_pi_status
+from .calibration import calibrate, get_calibration
+from .alignment import estimate_pairwise, last_registration_stats
+from .detection import detect_and_map
+from .health import get_health_monitor
+from .ingest import camera_index, get_frame_cache
+from .store import get_store
+from .tiles import get_tile_cache
+from .features import backend_stats
+from .streaming import get_stream
+from .encoding import IMAGE_FORMATS
+from .jobs import get_job_manager
+from .memory import memory_stats
+from .metrics import render_metrics
 from config import Config
-import cv2
+from io import BytesIO
+import logging
 import os
 import time
 
+logger = logging.getLogger(__name__)
+
 bp = Blueprint('main', __name__)
 
 @bp.route("/", methods=["GET"])
@@ -17,79 +31,356 @@ def index():
         "status": "running",
         "configured_pis": len(Config.RASPBERRY_PI_IPS),
         "expected_images": Config.EXPECTED_IMAGE_COUNT,
-        "endpoints": ["/", "/stitch", "/status", "/health"]
+        "endpoints": ["/", "/stitch", "/jobs/<id>", "/jobs/<id>/result", "/panoramas", "/panoramas/<id>", "/panoramas/<id>/tiles/<z>/<x>/<y>", "/stream", "/latest", "/ingest/<camera>", "/detect", "/calibrate", "/calibration", "/status", "/health", "/metrics"]
     })
 
 
 @bp.route("/stitch", methods=["POST"])
 def stitch_endpoint():
-    """Main endpoint for creating panoramas"""
+    """
+    Main endpoint for creating panoramas
+
+    Queues a stitch job, or attaches to the one already running, and returns
+    its id. With ?wait=1 the request blocks until the job finishes and returns
+    the image like a synchronous call.
+    """
+    # Output options: ?format=jpeg|webp|png&quality=90&max_width=4096&debug=1&wait=1
+    options = {
+        "format": request.args.get("format", Config.OUTPUT_FORMAT).lower(),
+        "quality": request.args.get("quality", type=int),
+        "max_width": request.args.get("max_width", type=int),
+        "debug": _flag("debug")
+    }
+    if options["format"] not in IMAGE_FORMATS:
+        return jsonify({
+            "error": f"Unsupported format {options['format']!r}",
+            "details": f"Use one of {list(IMAGE_FORMATS)}"
+        }), 400
+
+    try:
+        job, attached = get_job_manager().submit(options)
+    except OverflowError as e:
+        return jsonify({"error": "Stitching queue is full", "details": str(e)}), 503
+
+    logger.info(f"=== Stitch request {'attached to' if attached else 'queued as'} job {job.id} ===")
+
+    if _flag("wait") and job.wait(Config.JOB_WAIT_TIMEOUT):
+        return _job_result_response(job, options)
+
+    status = job.to_dict()
+    status["attached"] = attached
+    status["status_url"] = f"/jobs/{job.id}"
+    return jsonify(status), 202
+
+
+@bp.route("/jobs/<job_id>", methods=["GET"])
+def job_endpoint(job_id):
+    """Status, stage timings and metadata of a stitch job, ?trace=1 adds the stage spans"""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job {job_id}"}), 404
+    return jsonify(job.to_dict(trace=_flag("trace") or None))
+
+
+@bp.route("/jobs/<job_id>/result", methods=["GET"])
+def job_result_endpoint(job_id):
+    """Panorama of a finished job, optionally re-encoded with ?format/quality/max_width"""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job {job_id}"}), 404
+    if not job.done:
+        return jsonify(job.to_dict()), 202
+
+    fmt = request.args.get("format", job.options["format"]).lower()
+    if fmt not in IMAGE_FORMATS:
+        return jsonify({
+            "error": f"Unsupported format {fmt!r}",
+            "details": f"Use one of {list(IMAGE_FORMATS)}"
+        }), 400
+
+    return _job_result_response(job, {
+        "format": fmt,
+        "quality": request.args.get("quality", type=int),
+        "max_width": request.args.get("max_width", type=int)
+    })
+
+
+def _flag(name):
+    """Read a boolean query parameter"""
+    return request.args.get(name, "0").lower() in ("1", "true", "yes")
+
+
+def _job_result_response(job, options):
+    """Image response for a finished job, or its error"""
+    if job.status != "done":
+        return jsonify({
+            "error": job.error,
+            "details": "Check Raspberry Pi connections, image overlap and quality",
+            "job_id": job.id,
+            "stages": job.stages
+        }), job.error_status or 500
+
+    result = job.result(options["format"], options["quality"], options["max_width"])
+    if result is None:
+        return jsonify({"error": f"Result of job {job.id} is no longer available"}), 410
+
+    data, mimetype, extension = result
+    filename = f"{job.filename.rsplit('.', 1)[0]}{extension}"
+    response = send_file(
+        BytesIO(data),
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=filename
+    )
+    response.headers["X-Job-Id"] = job.id
+    response.headers["X-Capture-Time"] = f"{job.metadata.get('capture_time', 0):.3f}"
+    response.headers["X-Frame-Skew"] = f"{job.metadata.get('frame_skew', 0):.3f}"
+    response.headers["X-Stale-Cameras"] = ",".join(str(c["camera"]) for c in job.metadata.get("stale_sectors", []))
+    response.headers["X-Processing-Time"] = f"{job.stages.get('total', 0):.3f}"
+    return response
+
+
+@bp.route("/panoramas", methods=["GET"])
+def panoramas_endpoint():
+    """Stored panoramas newest first, ?since=<unix time>&limit=<n>"""
+    since = request.args.get("since", type=float)
+    limit = min(request.args.get("limit", 100, type=int), 1000)
+    store = get_store()
+    return jsonify({"panoramas": store.list(since, limit), "store": store.stats()})
+
+
+@bp.route("/panoramas/<panorama_id>", methods=["GET"])
+def panorama_endpoint(panorama_id):
+    """One stored panorama, ?meta=1 returns its index entry instead of the image"""
+    store = get_store()
+    entry = store.get(panorama_id)
+    if entry is None:
+        return jsonify({"error": f"Unknown panorama {panorama_id}"}), 404
+    if _flag("meta"):
+        return jsonify(entry)
+
+    path = store.path(entry)
+    if not os.path.exists(path):
+        return jsonify({"error": f"Panorama {panorama_id} was evicted"}), 410
+    response = send_file(os.path.abspath(path), mimetype=entry["mimetype"], max_age=Config.STORE_MAX_AGE)
+    response.headers["X-Panorama-Id"] = entry["id"]
+    response.headers["X-Created-At"] = f"{entry['created_at']:.3f}"
+    return response
+
+
+def _tile_pyramid(panorama_id):
+    """Pyramid of a panorama id, "latest" meaning the newest panorama"""
+    cache = get_tile_cache()
+    if panorama_id == "latest":
+        panorama_id = cache.latest_id()
+        if panorama_id is None:
+            latest = get_store().list(limit=1)
+            panorama_id = latest[0]["id"] if latest else None
+    if panorama_id is None:
+        return None
+    return cache.pyramid(panorama_id)
+
+
+@bp.route("/panoramas/<panorama_id>/tiles", methods=["GET"])
+def tiles_endpoint(panorama_id):
+    """Deep Zoom descriptor of a panorama's tile pyramid"""
+    pyramid = _tile_pyramid(panorama_id)
+    if pyramid is None:
+        return jsonify({"error": f"Unknown panorama {panorama_id}"}), 404
+    return jsonify(pyramid.describe())
+
+
+@bp.route("/panoramas/<panorama_id>/tiles/<int:z>/<int:x>/<int:y>", methods=["GET"])
+def tile_endpoint(panorama_id, z, x, y):
+    """
+    One tile of a panorama with a strong ETag; unchanged tiles keep their ETag
+    across panoramas, so polling /panoramas/latest/tiles/... mostly answers 304
+    """
+    pyramid = _tile_pyramid(panorama_id)
+    if pyramid is None:
+        return jsonify({"error": f"Unknown panorama {panorama_id}"}), 404
+    tile = get_tile_cache().tile(pyramid, z, x, y)
+    if tile is None:
+        return jsonify({"error": f"No tile {z}/{x}/{y}"}), 404
+
+    data, mimetype, etag = tile
+    response = Response(data, mimetype=mimetype)
+    response.set_etag(etag)
+    response.cache_control.no_cache = panorama_id == "latest"
+    if panorama_id != "latest":
+        response.cache_control.max_age = Config.STORE_MAX_AGE
+    return response.make_conditional(request)
+
+
+@bp.route("/stream", methods=["GET"])
+def stream_endpoint():
+    """Live multipart MJPEG stream of the newest panoramas"""
+    if not Config.STREAM_ENABLED:
+        return jsonify({
+            "error": "Streaming is disabled",
+            "details": "Set STREAM_ENABLED to capture and stitch continuously"
+        }), 503
+
+    return Response(
+        get_stream().mjpeg(),
+        mimetype="multipart/x-mixed-replace; boundary=frame",
+        headers={"Cache-Control": "no-store"}
+    )
+
+
+@bp.route("/latest", methods=["GET"])
+def latest_endpoint():
+    """Return the newest panorama immediately"""
+    frame = get_stream().latest()
+    if frame is None:
+        return jsonify({
+            "error": "No panorama available yet",
+            "details": "Enable STREAM_ENABLED or call /stitch"
+        }), 503
+
+    return Response(frame["jpeg"], mimetype="image/jpeg", headers={
+        "Cache-Control": "no-store",
+        "X-Frame-Sequence": str(frame["sequence"]),
+        "X-Frame-Timestamp": f"{frame['timestamp']:.3f}"
+    })
+
+
+@bp.route("/ingest/<camera_id>", methods=["POST"])
+def ingest_endpoint(camera_id):
+    """
+    Frame pushed by a camera, by index or Pi address
+
+    The body is the JPEG itself (or a multipart "image" file); the capture
+    time goes in the X-Capture-Timestamp header or ?timestamp=, as Unix seconds.
+    """
+    camera = camera_index(camera_id)
+    if camera is None:
+        return jsonify({"error": f"Unknown camera {camera_id}"}), 404
+
+    upload = request.files.get("image")
+    data = upload.read() if upload is not None else request.get_data()
+    if not data:
+        return jsonify({"error": "Empty frame"}), 400
+    if len(data) > Config.INGEST_MAX_BYTES:
+        return jsonify({"error": f"Frame larger than {Config.INGEST_MAX_BYTES} bytes"}), 413
+
+    timestamp = request.headers.get("X-Capture-Timestamp", request.args.get("timestamp"))
+    try:
+        timestamp = float(timestamp) if timestamp is not None else None
+    except ValueError:
+        return jsonify({"error": f"Invalid timestamp {timestamp!r}"}), 400
+
+    frame = get_frame_cache().add(camera, data, timestamp)
+    get_health_monitor().record(Config.RASPBERRY_PI_IPS[camera], True)
+    return jsonify({"camera": camera, "timestamp": frame.timestamp, "bytes": len(data)})
+
+
+@bp.route("/ingest", methods=["GET"])
+def ingest_status_endpoint():
+    """Frames cached per camera from /ingest"""
+    return jsonify({
+        "source": Config.CAPTURE_SOURCE,
+        "skew_tolerance": Config.INGEST_SKEW_TOLERANCE,
+        "cameras": get_frame_cache().stats()
+    })
+
+
+@bp.route("/detect", methods=["GET", "POST"])
+def detect_endpoint():
+    """Detect people on the source frames and return their boxes, per camera and in panorama coordinates"""
     start_time = time.time()
 
+    capture = capture_images()
+    images = capture["images"]
+    if not images:
+        return jsonify({
+            "error": "No camera responded",
+            "details": "Check Raspberry Pi connections"
+        }), 400
+
+    # Boxes are mapped with the stitching geometry, which needs every camera
+    homographies = None
     try:
-        # Clean up old files first
-        cleanup_old_files()
-
-        print("=== Starting Panorama Stitching Process ===")
-
-        # Fetch images from all Raspberry Pi devices
-        images = fetch_images()
-
-        # Validate we have the expected number of images
-        if not validate_images(images):
-            return jsonify({
-                "error": f"Expected {Config.EXPECTED_IMAGE_COUNT} valid images, got {len(images)}",
-                "details": "Check Raspberry Pi connections and image quality"
-            }), 400
-
-        print(f"✓ All {len(images)} images validated successfully")
-
-        # Stitch the images
-        pano, mapped_image = stitch_images(images)
-
-        if pano is not None:
-            # Save the final panorama
-            timestamp = str(int(time.time()))
-            filename = f"{timestamp}_{Config.FINAL_PANO_FILENAME}"
-            filepath = os.path.join(Config.OUTPUT_DIR, filename)
-
-            # Convert RGB back to BGR for saving
-            pano_bgr = cv2.cvtColor(pano.astype(np.uint8), cv2.COLOR_RGB2BGR)
-            cv2.imwrite(filepath, pano_bgr)
-
-            processing_time = time.time() - start_time
-            print(f"✓ Panorama created successfully in {processing_time:.2f} seconds")
-
-            # Return the image file
-            return send_file(
-                filepath,
-                mimetype='image/jpeg',
-                as_attachment=True,
-                download_name=filename
-            )
-        else:
-            return jsonify({
-                "error": "Panorama stitching failed",
-                "details": "Check image overlap and quality"
-            }), 500
+        if validate_images(images):
+            calibration = get_calibration(images) if Config.USE_CALIBRATION else None
+            if calibration is not None:
+                homographies = calibration.homographies
+            else:
+                pairs = estimate_pairwise(images, encoded=capture["encoded"])
+                if all(pair is not None for pair in pairs):
+                    homographies = [pair[0] for pair in pairs]
+    except Exception as e:
+        logger.error(f"✗ Alignment for person detection failed: {e}")
+        return jsonify({
+            "error": "Image alignment failed",
+            "details": str(e)
+        }), 500
 
+    try:
+        detections = detect_and_map(images, homographies)
     except Exception as e:
-        processing_time = time.time() - start_time
-        print(f"✗ Stitching failed after {processing_time:.2f} seconds: {e}")
+        logger.error(f"✗ Person detection failed: {e}")
+        return jsonify({
+            "error": "Person detection failed",
+            "details": str(e)
+        }), 500
+
+    # One entry per image, stale fallback frames included
+    cameras = [camera for camera in capture["cameras"] if camera["status"] in CAPTURED_STATUSES]
+    return jsonify({
+        "cameras": [
+            {"camera": camera["index"], "ip": camera["ip"], "status": camera["status"], "detections": boxes}
+            for camera, boxes in zip(cameras, detections["cameras"])
+        ],
+        "panorama": detections["panorama"],
+        "capture_time": capture["wall_time"],
+        "processing_time": time.time() - start_time
+    })
+
+
+@bp.route("/calibrate", methods=["POST"])
+def calibrate_endpoint():
+    """Capture a frame set and solve a new rig calibration"""
+    start_time = time.time()
+
+    images = capture_images()["images"]
+    if not validate_images(images):
         return jsonify({
-            "error": f"Unexpected error during stitching: {str(e)}",
-            "processing_time": processing_time
+            "error": f"Expected {Config.EXPECTED_IMAGE_COUNT} valid images, got {len(images)}",
+            "details": "Check Raspberry Pi connections and image quality"
+        }), 400
+
+    calibration = calibrate(images)
+    if calibration is None:
+        return jsonify({
+            "error": "Rig calibration failed",
+            "details": "Check image overlap and quality"
         }), 500
 
+    return jsonify({
+        "calibration": calibration.to_dict(),
+        "processing_time": time.time() - start_time
+    })
+
+
+@bp.route("/calibration", methods=["GET"])
+def calibration_endpoint():
+    """Return the active rig calibration"""
+    calibration = get_calibration()
+    if calibration is None:
+        return jsonify({"calibrated": False})
+    return jsonify({"calibrated": True, "calibration": calibration.to_dict()})
+
 
 @bp.route("/status", methods=["GET"])
 def status_endpoint():
-    """Check the status of connected Raspberry Pi devices"""
+    """Cached status of the connected Raspberry Pi devices, see PiHealthMonitor"""
     pi_status = check_pi_status()
     online_count = len([pi for pi in pi_status if pi["status"] == "online"])
 
     return jsonify({
         "raspberry_pis": pi_status,
+        "last_poll": get_health_monitor().last_poll,
         "total_configured": len(Config.RASPBERRY_PI_IPS),
         "online_count": online_count,
         "expected_images": Config.EXPECTED_IMAGE_COUNT,
@@ -119,8 +410,13 @@ def health_endpoint():
             "configuration": {
                 "smoothing_window_percent": Config.SMOOTHING_WINDOW_PERCENT,
                 "min_match_count": Config.MIN_MATCH_COUNT,
-                "reproj_threshold": Config.REPROJ_THRESHOLD
-            }
+                "reproj_threshold": Config.REPROJ_THRESHOLD,
+                "feature_backend": Config.FEATURE_BACKEND,
+                "max_keypoints": Config.MAX_KEYPOINTS
+            },
+            "feature_backends": backend_stats(),
+            "registration": last_registration_stats(),
+            "memory": memory_stats()
         }
 
         return jsonify(health_status)
@@ -130,3 +426,9 @@ def health_endpoint():
             "status": "error",
             "error": str(e)
         }), 500
+
+
+@bp.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus metrics: stage latencies, per-camera fetches, feature counts, jobs"""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -1,59 +1,139 @@
 from numpy import *
 import cv2
+import logging
 import os
 from config import Config
 from .utils import ImageStitching
+from .calibration import ensure_calibration, get_calibration
+from .rig import get_compiled_rig
+from .alignment import estimate_pairwise, reads_frame_buffers, stitch_aligned
+from .projection import PROJECTION_MODES, get_compiled_projection
+from .metrics import stage
+from .incremental import get_incremental_compositor, working_bytes as incremental_bytes
 
-def stitch_images(images):
+logger = logging.getLogger(__name__)
+
+def stitch_images(images, debug=None, encoded=None, frames=None):
     """
     Main stitching function that processes multiple images into a panorama
 
     Args:
-        images (list): List of OpenCV images (BGR format)
+        images (list): List of OpenCV images (BGR format), used as-is by every stage
+        debug (bool): Render match visualizations and write them with the
+            intermediate panorama to Config.OUTPUT_DIR, defaults to Config.DEBUG_ARTIFACTS
+        encoded (list): JPEG bytes of the images, lets registration decode
+            reduced grayscale frames instead of converting the full ones
+        frames (FrameSet): Shared memory handle of the images, lets feature
+            worker processes read the frames without pickling them
 
     Returns:
         tuple: (result_image, mapped_image) or (None, None) if failed
     """
+    debug = Config.DEBUG_ARTIFACTS if debug is None else debug
+
     if not images or len(images) < 2:
-        print("Need at least 2 images for stitching")
+        logger.warning("Need at least 2 images for stitching")
         return None, None
 
     try:
-        print(f"Starting panorama stitching with {len(images)} images...")
-
-        # Convert BGR to RGB for processing
-        images_rgb = []
-        for img in images:
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            images_rgb.append(img_rgb)
-
-        # Use recursive stitching approach
-        result, mapped_image = recurse_stitch(images_rgb, len(images_rgb))
+        logger.info(f"Starting panorama stitching with {len(images)} images...")
+
+        # Reuse the rig calibration so only warping and blending run per request
+        # A failed calibration attempt hands back its pairs, so they are not matched twice
+        homographies = pairs = None
+        if Config.USE_CALIBRATION:
+            calibration, pairs = ensure_calibration(images, encoded=encoded, frames=frames)
+            if calibration is not None:
+                homographies = calibration.homographies
+            else:
+                logger.warning("No usable calibration, matching features for this stitch")
+
+        with stage("stitch", cameras=len(images)):
+            if Config.PROJECTION_MODE in PROJECTION_MODES:
+                # Fixed-size 360° canvas, each camera projected once into its sector
+                if homographies is None and Config.CAMERA_YAWS is None:
+                    if pairs is None:
+                        pairs = estimate_pairwise(images, encoded=encoded, frames=frames)
+                    if all(pair is not None for pair in pairs):
+                        homographies = [pair[0] for pair in pairs]
+                    else:
+                        logger.warning("Alignment failed, assuming evenly spaced cameras")
+                projection = get_compiled_projection(homographies, [img.shape for img in images])
+                result, mapped_image = _compose(projection, images), None
+            elif homographies is not None and Config.COMPILED_RIG:
+                # Precomputed remap tables take every frame straight to the panorama
+                rig = get_compiled_rig(calibration, [img.shape for img in images])
+                result, mapped_image = _compose(rig, images), None
+            elif homographies is None and Config.ALIGNMENT_MODE == "global":
+                # Align all original frames to the reference camera, compose once
+                result, mapped_image = stitch_aligned(images, encoded, frames, pairs), None
+            else:
+                if homographies is None and pairs is not None:
+                    homographies = [pair[0] if pair is not None else None for pair in pairs]
+                # Use recursive stitching approach on a copy of the list, frames are not modified
+                result, mapped_image = recurse_stitch(list(images), len(images), homographies, debug)
+
+        # Frames in a recycled shared memory slot were overwritten by another capture mid-stitch
+        if result is not None and frames is not None and not frames.valid:
+            logger.warning("✗ Frame buffer slot was reused during the stitch, discarding the panorama")
+            result = None
 
         if result is not None:
-            # Save intermediate results
-            cv2.imwrite(os.path.join(Config.OUTPUT_DIR, Config.PANORAMA_FILENAME), result)
-            if mapped_image is not None:
-                cv2.imwrite(os.path.join(Config.OUTPUT_DIR, Config.MAPPED_FILENAME), mapped_image)
+            if debug:
+                # Save intermediate results
+                cv2.imwrite(os.path.join(Config.OUTPUT_DIR, Config.PANORAMA_FILENAME), result)
+                if mapped_image is not None:
+                    cv2.imwrite(os.path.join(Config.OUTPUT_DIR, Config.MAPPED_FILENAME), mapped_image)
 
-            print("✓ Panorama stitching completed successfully")
+            logger.info("✓ Panorama stitching completed successfully")
             return result, mapped_image
         else:
-            print("✗ Panorama stitching failed")
+            logger.warning("✗ Panorama stitching failed")
             return None, None
 
     except Exception as e:
-        print(f"✗ Error during stitching: {e}")
+        logger.error(f"✗ Error during stitching: {e}")
         return None, None
 
 
-def forward_stitch(query_photo, train_photo):
+def needs_frame_buffers():
+    """
+    True when the next stitch would read its frames from shared memory slots
+
+    Only registration in feature worker processes reads them, see
+    reads_frame_buffers; a calibrated rig or fixed Config.CAMERA_YAWS skip
+    registration, so the capture can keep its frames in private memory.
     """
-    Stitches two images together using SIFT features and homography
+    if not reads_frame_buffers():
+        return False
+    if Config.USE_CALIBRATION and get_calibration() is not None:
+        return False
+    return not (Config.PROJECTION_MODE in PROJECTION_MODES and Config.CAMERA_YAWS is not None)
+
+
+def _compose(compiled, images):
+    """
+    Compose with a compiled rig or projection, incrementally when Config.INCREMENTAL_STITCH
+    is set and its resident canvas fits Config.MEMORY_BUDGET, in bands otherwise
+    """
+    if Config.INCREMENTAL_STITCH:
+        compositor = get_incremental_compositor()
+        if incremental_bytes(compiled) <= Config.MEMORY_BUDGET:
+            return compositor.stitch(compiled, images)
+        compositor.reset()
+    return compiled.stitch(images)
+
+
+def forward_stitch(query_photo, train_photo, homography_matrix=None, debug=False):
+    """
+    Stitches two images together using image features and homography
 
     Args:
-        query_photo (numpy array): Left/query image (RGB)
-        train_photo (numpy array): Right/train image (RGB)
+        query_photo (numpy array): Left/query image (BGR)
+        train_photo (numpy array): Right/train image (BGR)
+        homography_matrix (numpy array): Calibrated train -> query homography,
+            skips feature matching when given
+        debug (bool): Render the feature match visualization
 
     Returns:
         tuple: (result_image, mapped_feature_image)
@@ -61,80 +141,102 @@ def forward_stitch(query_photo, train_photo):
     try:
         image_stitching = ImageStitching(query_photo, train_photo)
 
-        # Convert to grayscale
+        if homography_matrix is not None:
+            result = image_stitching.blending_smoothing(query_photo, train_photo, homography_matrix)
+            if result is None:
+                logger.warning("Blending/smoothing failed")
+                return None, None
+            return result, None
+
+        # Convert to grayscale at the registration working resolution
         _, query_photo_gray = image_stitching.give_gray(query_photo)
         _, train_photo_gray = image_stitching.give_gray(train_photo)
+        scale = Config.REGISTRATION_SCALE
+        if scale != 1.0:
+            query_photo_gray = cv2.resize(query_photo_gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            train_photo_gray = cv2.resize(train_photo_gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
 
-        # Detect SIFT features
-        keypoints_train_image, features_train_image = image_stitching._sift_detector(train_photo_gray)
-        keypoints_query_image, features_query_image = image_stitching._sift_detector(query_photo_gray)
+        # Detect features
+        with stage("detect"):
+            keypoints_train_image, features_train_image = image_stitching._sift_detector(train_photo_gray, scale)
+            keypoints_query_image, features_query_image = image_stitching._sift_detector(query_photo_gray, scale)
 
         if features_train_image is None or features_query_image is None:
-            print("Failed to detect features in one or both images")
+            logger.warning("Failed to detect features in one or both images")
             return None, None
 
         # Match keypoints
-        matches = image_stitching.create_and_match_keypoints(features_train_image, features_query_image)
+        with stage("match"):
+            matches = image_stitching.create_and_match_keypoints(features_train_image, features_query_image)
 
         if len(matches) < Config.MIN_MATCH_COUNT:
-            print(f"Not enough matches found: {len(matches)} < {Config.MIN_MATCH_COUNT}")
+            logger.warning(f"Not enough matches found: {len(matches)} < {Config.MIN_MATCH_COUNT}")
             return None, None
 
         # Draw matches for visualization
-        mapped_feature_image = cv2.drawMatches(
-            train_photo, keypoints_train_image,
-            query_photo, keypoints_query_image,
-            matches[:100], None,
-            flags=cv2.DrawMatchesFlags_NOT_DRAW_SINGLE_POINTS
-        )
+        mapped_feature_image = None
+        if debug:
+            mapped_feature_image = cv2.drawMatches(
+                train_photo if scale == 1.0 else train_photo_gray, keypoints_train_image,
+                query_photo if scale == 1.0 else query_photo_gray, keypoints_query_image,
+                [cv2.DMatch(int(t), int(q), 0) for t, q in matches[:100]], None,
+                flags=cv2.DrawMatchesFlags_NOT_DRAW_SINGLE_POINTS
+            )
 
         # Compute homography
-        M = image_stitching.compute_homography(
-            keypoints_train_image, keypoints_query_image, matches,
-            reprojThresh=Config.REPROJ_THRESHOLD
-        )
+        with stage("homography"):
+            M = image_stitching.compute_homography(
+                keypoints_train_image, keypoints_query_image, matches,
+                reprojThresh=Config.REPROJ_THRESHOLD
+            )
 
         if M is None:
-            print("Failed to compute homography")
+            logger.warning("Failed to compute homography")
             return None, None
 
         (matches, homography_matrix, status) = M
 
+        # Scale the working-resolution homography back to full resolution
+        S = diag([scale, scale, 1.0])
+        homography_matrix = linalg.inv(S) @ homography_matrix @ S
+
         # Blend and stitch images
         result = image_stitching.blending_smoothing(query_photo, train_photo, homography_matrix)
 
         if result is None:
-            print("Blending/smoothing failed")
+            logger.warning("Blending/smoothing failed")
             return None, None
 
-        # Convert to proper format
-        result_float32 = float32(result)
-        mapped_float_32 = float32(mapped_feature_image)
-
-        result_rgb = cv2.cvtColor(result_float32, cv2.COLOR_BGR2RGB)
-        mapped_feature_image_rgb = cv2.cvtColor(mapped_float_32, cv2.COLOR_BGR2RGB)
-
-        return result_rgb, mapped_feature_image_rgb
+        return result, mapped_feature_image
 
     except Exception as e:
-        print(f"Error in forward_stitch: {e}")
+        logger.error(f"Error in forward_stitch: {e}")
         return None, None
 
-def recurse_stitch(image_list, no_of_images):
+def recurse_stitch(image_list, no_of_images, homographies=None, debug=False):
     """
     Recursively stitch multiple images into a panorama
 
     Args:
         image_list (list): List of images to stitch
         no_of_images (int): Number of images
+        homographies (list): Calibrated pairwise homographies, entry i maps
+            image i+1 onto image i; pairs without one (None) are matched
+        debug (bool): Render the match visualization of the final pair
 
     Returns:
         tuple: (result_image, mapped_image)
     """
+    # The growing panorama keeps the frame of its leftmost image, so the
+    # pairwise homography of the original images applies at every step
+    homography_matrix = homographies[no_of_images - 2] if homographies is not None else None
+
     if no_of_images == 2:
         result, mapped_image = forward_stitch(
             query_photo=image_list[no_of_images - 2],
             train_photo=image_list[no_of_images - 1],
+            homography_matrix=homography_matrix,
+            debug=debug,
         )
         return result, mapped_image
 
@@ -143,22 +245,19 @@ def recurse_stitch(image_list, no_of_images):
         result, _ = forward_stitch(
             query_photo=image_list[no_of_images - 2],
             train_photo=image_list[no_of_images - 1],
+            homography_matrix=homography_matrix,
         )
 
         if result is None:
-            print(f"Failed to stitch images at step {no_of_images}")
+            logger.warning(f"Failed to stitch images at step {no_of_images}")
             return None, None
 
-        # Convert result back to uint8 and RGB
-        result_int8 = uint8(result)
-        result_rgb = cv2.cvtColor(result_int8, cv2.COLOR_BGR2RGB)
-
         # Replace the second-to-last image with the stitched result
-        image_list[no_of_images - 2] = result_rgb
+        image_list[no_of_images - 2] = result
 
         # Recursively stitch with remaining images
-        return recurse_stitch(image_list, no_of_images - 1)
+        return recurse_stitch(image_list, no_of_images - 1, homographies, debug)
 
     else:
-        print("Invalid number of images for stitching")
+        logger.warning("Invalid number of images for stitching")
         return None, None
@@ -0,0 +1,245 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from .encoding import IMAGE_FORMATS
+
+logger = logging.getLogger(__name__)
+
+# Shared store, see get_store
+_store = None
+_store_lock = threading.Lock()
+
+# Single writer thread so persistence never blocks a response
+_writer = None
+_writer_lock = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS panoramas (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    filename TEXT NOT NULL,
+    mimetype TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS panoramas_created_at ON panoramas (created_at);
+"""
+
+_COLUMNS = ("id", "created_at", "filename", "mimetype", "bytes", "width", "height", "metadata")
+
+
+class PanoramaStore:
+    """Panorama files in OUTPUT_DIR indexed in SQLite, bounded by a byte budget and a maximum age"""
+
+    def __init__(self, directory=None, db_path=None):
+        """
+        Open (or create) the store
+
+        Args:
+            directory (str): Where panorama files live, defaults to Config.OUTPUT_DIR
+            db_path (str): SQLite index, defaults to Config.STORE_DB_FILE or panoramas.db in directory
+        """
+        self.directory = directory or Config.OUTPUT_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        db_path = db_path or Config.STORE_DB_FILE or os.path.join(self.directory, "panoramas.db")
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        created = not os.path.exists(db_path)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        if created:
+            self._import_existing()
+        self._total_bytes = self._db.execute("SELECT COALESCE(SUM(bytes), 0) FROM panoramas").fetchone()[0]
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _import_existing(self):
+        """Index panoramas written before the store existed, once, so retention covers them"""
+        extensions = {extension: mimetype for extension, mimetype, _ in IMAGE_FORMATS.values()}
+        debug_files = {Config.PANORAMA_FILENAME, Config.MAPPED_FILENAME}
+        rows = []
+        for entry in os.scandir(self.directory):
+            extension = os.path.splitext(entry.name)[1].lower()
+            if entry.is_file() and extension in extensions and entry.name not in debug_files:
+                stat = entry.stat()
+                rows.append((os.path.splitext(entry.name)[0], stat.st_mtime, entry.name,
+                             extensions[extension], stat.st_size, None, None, None))
+        self._db.executemany(f"INSERT OR IGNORE INTO panoramas VALUES ({', '.join('?' * len(_COLUMNS))})", rows)
+        if rows:
+            logger.info(f"Indexed {len(rows)} existing panoramas in {self.directory}")
+
+    def start(self):
+        """Start background eviction"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="panorama-store", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.evict()
+            except Exception as e:
+                logger.error(f"✗ Panorama eviction failed: {e}")
+            self._wake.wait(Config.STORE_EVICT_INTERVAL)
+            self._wake.clear()
+
+    def add(self, panorama_id, data, mimetype, extension, size=None, metadata=None, created_at=None):
+        """
+        Write a panorama in the background and index it once it is on disk
+
+        Args:
+            panorama_id (str): Unique id, the job id
+            data (bytes): Encoded panorama
+            mimetype (str): MIME type of data
+            extension (str): File extension including the dot
+            size (tuple): Panorama (width, height)
+            metadata (dict): Capture metadata stored with the entry
+            created_at (float): Capture timestamp, defaults to now
+
+        Returns:
+            str: File name inside the store directory
+        """
+        filename = f"{panorama_id}{extension}"
+        width, height = size or (None, None)
+        row = (panorama_id, created_at or time.time(), filename, mimetype, len(data),
+               width, height, json.dumps(metadata or {}))
+        _get_writer().submit(self._write, row, data)
+        return filename
+
+    def _write(self, row, data):
+        path = os.path.join(self.directory, row[2])
+        try:
+            with open(path, "wb") as f:
+                f.write(data)
+            with self._lock:
+                # Replacing an entry swaps its bytes in the running total instead of adding them
+                previous = self._db.execute("SELECT filename, bytes FROM panoramas WHERE id = ?", (row[0],)).fetchone()
+                self._db.execute(f"INSERT OR REPLACE INTO panoramas VALUES ({', '.join('?' * len(_COLUMNS))})", row)
+                self._total_bytes += row[4] - (previous[1] if previous else 0)
+                over_budget = self._total_bytes > Config.STORE_MAX_BYTES
+            if previous and previous[0] != row[2]:
+                try:
+                    os.remove(os.path.join(self.directory, previous[0]))
+                except OSError:
+                    pass
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"✗ Failed to store panorama {row[0]}: {e}")
+            return
+        if over_budget:
+            self._wake.set()
+
+    def evict(self):
+        """
+        Drop panoramas older than Config.STORE_MAX_AGE, then the oldest ones until
+        the store fits in Config.STORE_MAX_BYTES
+
+        Returns:
+            int: Number of evicted panoramas
+        """
+        cutoff = time.time() - Config.STORE_MAX_AGE
+        with self._lock:
+            victims = self._db.execute(
+                "SELECT id, filename, bytes FROM panoramas WHERE created_at < ? ORDER BY created_at",
+                (cutoff,)
+            ).fetchall()
+            excess = self._total_bytes - sum(v[2] for v in victims) - Config.STORE_MAX_BYTES
+            if excess > 0:
+                for row in self._db.execute(
+                    "SELECT id, filename, bytes FROM panoramas WHERE created_at >= ? ORDER BY created_at",
+                    (cutoff,)
+                ):
+                    if excess <= 0:
+                        break
+                    victims.append(row)
+                    excess -= row[2]
+            if not victims:
+                return 0
+            self._db.executemany("DELETE FROM panoramas WHERE id = ?", [(v[0],) for v in victims])
+            self._total_bytes -= sum(v[2] for v in victims)
+
+        for _, filename, _ in victims:
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except OSError:
+                pass
+        logger.info(f"Evicted {len(victims)} panoramas, {self._total_bytes / 2**20:.1f} MB stored")
+        return len(victims)
+
+    def _entry(self, row):
+        entry = dict(zip(_COLUMNS, row))
+        entry["metadata"] = json.loads(entry["metadata"]) if entry["metadata"] else {}
+        entry["url"] = f"/panoramas/{entry['id']}"
+        return entry
+
+    def list(self, since=None, limit=100):
+        """
+        Index entries newest first
+
+        Args:
+            since (float): Only panoramas created after this timestamp
+            limit (int): Maximum number of entries
+
+        Returns:
+            list: Entry dicts
+        """
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM panoramas WHERE created_at > ? "
+                "ORDER BY created_at DESC LIMIT ?",
+                (since or 0, limit)
+            ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def get(self, panorama_id):
+        """Index entry of one panorama, or None"""
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM panoramas WHERE id = ?", (panorama_id,)
+            ).fetchone()
+        return self._entry(row) if row else None
+
+    def path(self, entry):
+        """File path of an index entry"""
+        return os.path.join(self.directory, entry["filename"])
+
+    def stats(self):
+        """Count and bytes currently stored"""
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM panoramas").fetchone()[0]
+            return {"count": count, "bytes": self._total_bytes, "max_bytes": Config.STORE_MAX_BYTES,
+                    "max_age": Config.STORE_MAX_AGE}
+
+
+def _get_writer():
+    """Return the background writer thread"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+        return _writer
+
+
+def get_store():
+    """Return the shared panorama store"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PanoramaStore()
+        return _store
@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+from collections import deque
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Shared stream, see get_stream
+_stream = None
+_stream_lock = threading.Lock()
+
+
+class PanoramaStream:
+    """Background capture/stitch loop feeding a bounded ring buffer of panoramas"""
+
+    def __init__(self, target_fps=None, buffer_size=None):
+        """
+        Initialize the stream
+
+        Args:
+            target_fps (float): Panoramas per second to aim for, defaults to Config.STREAM_TARGET_FPS
+            buffer_size (int): Recent panoramas kept, defaults to Config.STREAM_BUFFER_SIZE
+        """
+        self.target_fps = target_fps or Config.STREAM_TARGET_FPS
+        self._frames = deque(maxlen=buffer_size or Config.STREAM_BUFFER_SIZE)
+        self._condition = threading.Condition()
+        self._sequence = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the capture/stitch loop in a daemon thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="panorama-stream", daemon=True)
+        self._thread.start()
+        logger.info(f"Panorama stream started at {self.target_fps} FPS target")
+
+    def stop(self):
+        """Ask the loop to exit after the current panorama"""
+        self._stop.set()
+
+    def _run(self):
+        interval = 1.0 / self.target_fps
+        while not self._stop.is_set():
+            start_time = time.time()
+            try:
+                self._produce()
+            except Exception as e:
+                logger.error(f"✗ Stream iteration failed: {e}")
+
+            # Never queue work: if a panorama took longer than the interval, start the next one now
+            self._stop.wait(max(0.0, interval - (time.time() - start_time)))
+
+    def _produce(self):
+        """Run one stitch job; the job publishes its panorama into the ring buffer"""
+        from .jobs import get_job_manager
+
+        job, _ = get_job_manager().submit({"format": "jpeg", "quality": Config.STREAM_JPEG_QUALITY})
+        job.wait()
+        if job.status != "done":
+            logger.warning(f"Stream skipped a frame: {job.error}")
+
+    def publish(self, jpeg, metadata=None):
+        """
+        Add an encoded panorama to the ring buffer and wake waiting viewers
+
+        Args:
+            jpeg (bytes): JPEG-encoded panorama
+            metadata (dict): Extra fields stored with the frame
+
+        Returns:
+            dict: The stored frame
+        """
+        with self._condition:
+            self._sequence += 1
+            frame = {
+                "sequence": self._sequence,
+                "timestamp": time.time(),
+                "jpeg": jpeg,
+                **(metadata or {})
+            }
+            self._frames.append(frame)
+            self._condition.notify_all()
+        return frame
+
+    def latest(self):
+        """Return the newest frame, or None before the first panorama"""
+        with self._condition:
+            return self._frames[-1] if self._frames else None
+
+    def wait_for_newer(self, sequence, timeout=None):
+        """
+        Block until a frame newer than sequence exists and return the newest one
+
+        Frames published in between are skipped, so slow viewers see the most
+        recent panorama rather than a backlog.
+
+        Args:
+            sequence (int): Sequence number the caller already has
+            timeout (float): Seconds to wait
+
+        Returns:
+            dict: Newest frame, or None on timeout
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._frames and self._frames[-1]["sequence"] > sequence,
+                timeout=timeout
+            )
+            if self._frames and self._frames[-1]["sequence"] > sequence:
+                return self._frames[-1]
+            return None
+
+    def mjpeg(self):
+        """Generate a multipart MJPEG body that always sends the newest frame"""
+        sequence = 0
+        while True:
+            frame = self.wait_for_newer(sequence, timeout=Config.STREAM_KEEPALIVE_INTERVAL)
+            if frame is None:
+                continue
+            sequence = frame["sequence"]
+            yield (
+                b"--frame\r\n"
+                b"Content-Type: image/jpeg\r\n"
+                b"Content-Length: " + str(len(frame["jpeg"])).encode() + b"\r\n\r\n"
+                + frame["jpeg"] + b"\r\n"
+            )
+
+
+def get_stream():
+    """Return the shared panorama stream"""
+    global _stream
+    with _stream_lock:
+        if _stream is None:
+            _stream = PanoramaStream()
+        return _stream
@@ -23,7 +23,7 @@ for filename in image_filenames:
 if images:
     pano, mapped_image = stitch_images(images)
     if pano is not None:
-        cv2.imwrite("panorama_result.jpg", cv2.cvtColor(pano, cv2.COLOR_RGB2BGR))
+        cv2.imwrite("panorama_result.jpg", pano)
         print("✓ Panorama stitched and saved to panorama_result.jpg")
     else:
         print("✗ Stitching failed")
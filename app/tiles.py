@@ -0,0 +1,173 @@
+import cv2
+import hashlib
+import logging
+import math
+import threading
+from collections import OrderedDict
+from config import Config
+from .encoding import encode_image
+from .metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# Shared pyramid cache, see get_tile_cache
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class TilePyramid:
+    """
+    Deep Zoom style pyramid of one panorama
+
+    Level max_level is the full resolution and every level below halves it,
+    down to a single pixel at level 0. Levels are downscaled on first use and
+    tiles are encoded on request, so the cost follows what viewers look at.
+    """
+
+    def __init__(self, panorama, tile_size=None):
+        """
+        Args:
+            panorama (numpy array): BGR uint8 panorama
+            tile_size (int): Tile edge in pixels, defaults to Config.TILE_SIZE
+        """
+        self.tile_size = tile_size or Config.TILE_SIZE
+        self.height, self.width = panorama.shape[:2]
+        self.max_level = math.ceil(math.log2(max(self.width, self.height, 1)))
+        self._levels = {self.max_level: panorama}
+        self._lock = threading.Lock()
+
+    def level_size(self, level):
+        """(width, height) of a level"""
+        factor = 2 ** (self.max_level - level)
+        return math.ceil(self.width / factor), math.ceil(self.height / factor)
+
+    def level(self, level):
+        """Image of a level, halving from the nearest finer level already built"""
+        with self._lock:
+            if level not in self._levels:
+                finer = min(l for l in self._levels if l > level)
+                image = self._levels[finer]
+                for l in range(finer - 1, level - 1, -1):
+                    image = cv2.resize(image, self.level_size(l), interpolation=cv2.INTER_AREA)
+                    self._levels[l] = image
+            return self._levels[level]
+
+    def tile(self, level, x, y):
+        """
+        Pixels of one tile
+
+        Returns:
+            numpy array: Tile, or None when the coordinates are outside the pyramid
+        """
+        if not 0 <= level <= self.max_level:
+            return None
+        width, height = self.level_size(level)
+        x0, y0 = x * self.tile_size, y * self.tile_size
+        if x < 0 or y < 0 or x0 >= width or y0 >= height:
+            return None
+        return self.level(level)[y0:y0 + self.tile_size, x0:x0 + self.tile_size]
+
+    def describe(self):
+        """JSON descriptor for viewers"""
+        return {
+            "width": self.width,
+            "height": self.height,
+            "tile_size": self.tile_size,
+            "overlap": 0,
+            "min_level": 0,
+            "max_level": self.max_level,
+            "format": Config.TILE_FORMAT
+        }
+
+
+class TileCache:
+    """Recent panorama pyramids plus encoded tiles keyed by their content"""
+
+    def __init__(self):
+        self._pyramids = OrderedDict()
+        self._encoded = OrderedDict()
+        self._encoded_bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, panorama_id, panorama):
+        """Make a panorama available for tiling, keeping Config.TILE_PYRAMIDS_KEPT of them"""
+        pyramid = TilePyramid(panorama)
+        with self._lock:
+            self._pyramids[panorama_id] = pyramid
+            self._pyramids.move_to_end(panorama_id)
+            while len(self._pyramids) > Config.TILE_PYRAMIDS_KEPT:
+                self._pyramids.popitem(last=False)
+        return pyramid
+
+    def latest_id(self):
+        """Id of the newest panorama in memory, or None"""
+        with self._lock:
+            return next(reversed(self._pyramids), None)
+
+    def pyramid(self, panorama_id):
+        """
+        Pyramid of a panorama, loading it from the panorama store if it is not in memory
+
+        Returns:
+            TilePyramid or None
+        """
+        with self._lock:
+            pyramid = self._pyramids.get(panorama_id)
+        if pyramid is not None:
+            return pyramid
+
+        from .store import get_store
+
+        store = get_store()
+        entry = store.get(panorama_id)
+        if entry is None:
+            return None
+        panorama = cv2.imread(store.path(entry), cv2.IMREAD_COLOR)
+        if panorama is None:
+            return None
+        return self.add(panorama_id, panorama)
+
+    def tile(self, pyramid, level, x, y):
+        """
+        Encoded tile and its strong ETag
+
+        The ETag hashes the tile pixels, so a tile that did not change between
+        two panoramas keeps its ETag and its encoded bytes are reused.
+
+        Returns:
+            tuple: (bytes, mimetype, etag), or None outside the pyramid
+        """
+        pixels = pyramid.tile(level, x, y)
+        if pixels is None:
+            return None
+
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{pixels.shape}:{Config.TILE_FORMAT}:{Config.TILE_QUALITY}".encode())
+        digest.update(pixels.tobytes())
+        etag = digest.hexdigest()
+
+        with self._lock:
+            cached = self._encoded.get(etag)
+            if cached is not None:
+                self._encoded.move_to_end(etag)
+                return cached[0], cached[1], etag
+
+        with stage("tile_encode"):
+            data, mimetype, _ = encode_image(pixels, Config.TILE_FORMAT, Config.TILE_QUALITY)
+        with self._lock:
+            if etag not in self._encoded:
+                self._encoded[etag] = (data, mimetype)
+                self._encoded_bytes += len(data)
+                while self._encoded_bytes > Config.TILE_CACHE_BYTES and len(self._encoded) > 1:
+                    _, (old, _) = self._encoded.popitem(last=False)
+                    self._encoded_bytes -= len(old)
+        return data, mimetype, etag
+
+
+def get_tile_cache():
+    """Return the shared tile cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TileCache()
+        return _cache
@@ -1,6 +1,11 @@
+import logging
 import cv2
 from numpy import *
 from config import Config
+from .metrics import stage
+from .features import detect_and_describe, match_descriptors
+
+logger = logging.getLogger(__name__)
 
 class ImageStitching:
     """Contains the utilities required to stitch images"""
@@ -16,14 +21,13 @@ class ImageStitching:
         super().__init__()
         width_query_photo = query_photo.shape[1]
         width_train_photo = train_photo.shape[1]
-        lowest_width = min(width_query_photo, width_train_photo)
+        lowest_width = minimum(width_query_photo, width_train_photo)
 
-        # Calculate smoothing window size
-        self.smoothing_window_size = max(
-            100,
-            min(Config.SMOOTHING_WINDOW_PERCENT * lowest_width, 1000)
-        )
-        print(f"Smoothing window size: {self.smoothing_window_size}")
+        # Calculate smoothing window size (numpy's min/max shadow the builtins here)
+        self.smoothing_window_size = float(clip(
+            Config.SMOOTHING_WINDOW_PERCENT * lowest_width, 100, 1000
+        ))
+        logger.debug(f"Smoothing window size: {self.smoothing_window_size}")
 
     def give_gray(self, image):
         """
@@ -36,97 +40,105 @@ class ImageStitching:
             tuple: (original_image, grayscale_image)
         """
         if len(image.shape) == 3:
-            photo_gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            photo_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         else:
             photo_gray = image
         return image, photo_gray
 
     @staticmethod
-    def _sift_detector(image):
+    def _sift_detector(image, scale=1.0):
         """
-        Apply SIFT algorithm to detect keypoints and features
+        Detect keypoints and features with the configured backend (SIFT by default)
 
         Args:
             image (numpy array): Input grayscale image
+            scale (float): Factor the image was resized by from the camera frame
 
         Returns:
             tuple: (keypoints, features)
         """
         try:
-            descriptor = cv2.SIFT_create()
-            keypoints, features = descriptor.detectAndCompute(image, None)
+            keypoints, features = detect_and_describe(image, scale=scale)
 
             if keypoints is None or features is None:
-                print("SIFT detection failed")
+                logger.warning("Feature detection failed")
                 return None, None
 
-            print(f"Found {len(keypoints)} keypoints")
+            logger.debug(f"Found {len(keypoints)} keypoints")
             return keypoints, features
 
         except Exception as e:
-            print(f"Error in SIFT detection: {e}")
+            logger.error(f"Error in feature detection: {e}")
             return None, None
 
-    def create_and_match_keypoints(self, features_train_image, features_query_image):
+    @staticmethod
+    def create_and_match_keypoints(features_train_image, features_query_image):
         """
-        Create and match keypoints using Brute Force matcher
+        Match keypoints with the configured matcher backend
 
         Args:
-            features_train_image: SIFT features of train image
-            features_query_image: SIFT features of query image
+            features_train_image: Descriptors of train image
+            features_query_image: Descriptors of query image
 
         Returns:
-            list: Sorted matches
+            numpy array: (M, 2) [train_index, query_index] matches, best first
         """
         try:
-            bf = cv2.BFMatcher(cv2.NORM_L2, crossCheck=True)
-            best_matches = bf.match(features_train_image, features_query_image)
-            raw_matches = sorted(best_matches, key=lambda x: x.distance)
+            raw_matches = match_descriptors(features_train_image, features_query_image)
 
-            print(f"Found {len(raw_matches)} matches")
+            logger.debug(f"Found {len(raw_matches)} matches")
             return raw_matches
 
         except Exception as e:
-            print(f"Error in keypoint matching: {e}")
-            return []
+            logger.error(f"Error in keypoint matching: {e}")
+            return zeros((0, 2), dtype=int32)
 
-    def compute_homography(self, keypoints_train_image, keypoints_query_image, matches, reprojThresh):
+    @staticmethod
+    def compute_homography(keypoints_train_image, keypoints_query_image, matches, reprojThresh):
         """
         Compute homography matrix using RANSAC
 
         Args:
-            keypoints_train_image: Keypoints from train image
-            keypoints_query_image: Keypoints from query image
-            matches: Feature matches
+            keypoints_train_image: Keypoints (or Nx2 point array) from train image
+            keypoints_query_image: Keypoints (or Nx2 point array) from query image
+            matches: (M, 2) [train_index, query_index] matches
             reprojThresh: RANSAC reprojection threshold
 
         Returns:
             tuple: (matches, homography_matrix, status) or None
         """
         try:
-            keypoints_train_image = float32([kp.pt for kp in keypoints_train_image])
-            keypoints_query_image = float32([kp.pt for kp in keypoints_query_image])
+            if not isinstance(keypoints_train_image, ndarray):
+                keypoints_train_image = cv2.KeyPoint_convert(keypoints_train_image)
+            if not isinstance(keypoints_query_image, ndarray):
+                keypoints_query_image = cv2.KeyPoint_convert(keypoints_query_image)
 
             if len(matches) >= Config.MIN_MATCH_COUNT:
-                points_train = float32([keypoints_train_image[m.queryIdx] for m in matches])
-                points_query = float32([keypoints_query_image[m.trainIdx] for m in matches])
+                points_train = keypoints_train_image[matches[:, 0]]
+                points_query = keypoints_query_image[matches[:, 1]]
 
                 H, status = cv2.findHomography(
                     points_train, points_query, cv2.RANSAC, reprojThresh
                 )
 
-                if H is not None:
-                    print("✓ Homography computed successfully")
-                    return (matches, H, status)
-                else:
-                    print("✗ Failed to compute homography")
+                if H is None:
+                    logger.warning("✗ Failed to compute homography")
+                    return None
+
+                # A handful of inliers fits a homography to almost anything
+                inliers = int(status.sum())
+                if inliers < Config.MIN_INLIER_COUNT or inliers < Config.MIN_INLIER_RATIO * len(matches):
+                    logger.warning(f"✗ Too few inliers: {inliers} of {len(matches)} matches")
                     return None
+
+                logger.debug("✓ Homography computed successfully")
+                return (matches, H, status)
             else:
-                print(f"✗ Insufficient matches: {len(matches)} < {Config.MIN_MATCH_COUNT}")
+                logger.warning(f"✗ Insufficient matches: {len(matches)} < {Config.MIN_MATCH_COUNT}")
                 return None
 
         except Exception as e:
-            print(f"Error computing homography: {e}")
+            logger.error(f"Error computing homography: {e}")
             return None
 
     def create_mask(self, query_image, train_image, version):
@@ -166,81 +178,105 @@ class ImageStitching:
             return cv2.merge([mask, mask, mask])
 
         except Exception as e:
-            print(f"Error creating mask: {e}")
+            logger.error(f"Error creating mask: {e}")
             return None
 
     def blending_smoothing(self, query_image, train_image, homography_matrix):
         """
         Blend images using homography transformation and masks
 
+        Only the smoothing strip where the two images overlap is blended, in
+        float32. Everything left of it is copied from the query image and
+        everything right of it is warped straight into the uint8 output, whose
+        width comes from the warped corners of the train image.
+
         Args:
             query_image (numpy array): Query image
             train_image (numpy array): Train image
             homography_matrix (numpy array): Homography transformation matrix
 
         Returns:
-            numpy array: Blended panoramic image
+            numpy array: Blended panoramic image (uint8)
         """
         try:
-            height_img1 = query_image.shape[0]
-            width_img1 = query_image.shape[1]
-            width_img2 = train_image.shape[1]
-            height_panorama = height_img1
-            width_panorama = width_img1 + width_img2
-
-            # Create panorama canvas
-            panorama1 = zeros((height_panorama, width_panorama, 3))
-
-            # Create masks
-            mask1 = self.create_mask(query_image, train_image, version="left_image")
-            mask2 = self.create_mask(query_image, train_image, version="right_image")
-
-            if mask1 is None or mask2 is None:
-                print("Failed to create masks")
-                return None
-
-            # Place first image
-            panorama1[0:query_image.shape[0], 0:query_image.shape[1], :] = query_image
-            panorama1 *= mask1
+            height_panorama = query_image.shape[0]
+            width_query = query_image.shape[1]
+            width_panorama = width_query + train_image.shape[1]
 
-            # Warp and place second image
-            panorama2 = cv2.warpPerspective(
-                train_image, homography_matrix, (width_panorama, height_panorama)
-            ) * mask2
+            offset = int(self.smoothing_window_size / 2)
+            strip_start = width_query - 2 * offset
+
+            # Crop bound from the warped train corners instead of scanning pixels
+            height_train, width_train = train_image.shape[:2]
+            corners = float32([[0, 0], [width_train, 0], [width_train, height_train], [0, height_train]])
+            projected = cv2.perspectiveTransform(corners.reshape(-1, 1, 2), homography_matrix)
+            right_edge = int(clip(ceil(projected[:, 0, 0].max()), width_query, width_panorama))
+
+            # Warp the train image only from the strip onwards
+            T = array([[1, 0, -strip_start], [0, 1, 0], [0, 0, 1]], dtype=float64)
+            with stage("warp"):
+                warped = cv2.warpPerspective(
+                    train_image, T @ homography_matrix, (right_edge - strip_start, height_panorama)
+                )
 
-            # Blend images
-            result = panorama1 + panorama2
+            result = empty((height_panorama, right_edge, 3), dtype=uint8)
+            result[:, :strip_start] = query_image[:, :strip_start]
+            result[:, width_query:] = warped[:, 2 * offset:]
 
-            # Crop out black borders
-            rows, cols = where(result[:, :, 0] != 0)
-            if len(rows) > 0 and len(cols) > 0:
-                min_row, max_row = min(rows), max(rows) + 1
-                min_col, max_col = min(cols), max(cols) + 1
-                final_result = result[min_row:max_row, min_col:max_col, :]
-            else:
-                final_result = result
+            left_strip = query_image[:, strip_start:width_query]
+            right_strip = warped[:, :2 * offset]
+            with stage("blend", mode=Config.BLEND_MODE):
+                if Config.BLEND_MODE == "multiband":
+                    result[:, strip_start:width_query] = self._multiband_blend(left_strip, right_strip)
+                else:
+                    ramp = linspace(1, 0, 2 * offset, dtype=float32)[newaxis, :, newaxis]
+                    blended = right_strip + (left_strip.astype(float32) - right_strip) * ramp
+                    result[:, strip_start:width_query] = blended.round().astype(uint8)
 
-            return final_result
+            return result
 
         except Exception as e:
-            print(f"Error in blending/smoothing: {e}")
+            logger.error(f"Error in blending/smoothing: {e}")
             return None
 
-def cleanup_old_files(max_age_hours=24):
-    """Clean up old panorama files"""
-    import os
-    import time
+    @staticmethod
+    def _multiband_blend(left_strip, right_strip, levels=None):
+        """
+        Blend two overlapping strips with Laplacian pyramids
 
-    current_time = time.time()
+        Low frequencies are mixed across the whole strip while fine detail
+        switches over close to the seam in its middle.
 
-    for filename in os.listdir(Config.OUTPUT_DIR):
-        if filename.endswith('.jpg'):
-            filepath = os.path.join(Config.OUTPUT_DIR, filename)
-            file_time = os.path.getmtime(filepath)
-            if (current_time - file_time) > (max_age_hours * 3600):
-                try:
-                    os.remove(filepath)
-                    print(f"Cleaned up old file: {filename}")
-                except OSError:
-                    pass
+        Args:
+            left_strip (numpy array): Query pixels of the overlap strip
+            right_strip (numpy array): Warped train pixels of the overlap strip
+            levels (int): Pyramid levels, defaults to Config.MULTIBAND_LEVELS
 
+        Returns:
+            numpy array: Blended uint8 strip
+        """
+        levels = levels or Config.MULTIBAND_LEVELS
+        height, width = left_strip.shape[:2]
+        levels = int(minimum(levels, floor(log2(minimum(height, width))) - 1))
+
+        mask = zeros((height, width, 3), dtype=float32)
+        mask[:, :width // 2] = 1
+
+        gaussian_left = [left_strip.astype(float32)]
+        gaussian_right = [right_strip.astype(float32)]
+        gaussian_mask = [mask]
+        for _ in range(levels):
+            gaussian_left.append(cv2.pyrDown(gaussian_left[-1]))
+            gaussian_right.append(cv2.pyrDown(gaussian_right[-1]))
+            gaussian_mask.append(cv2.pyrDown(gaussian_mask[-1]))
+
+        # Blend the coarsest level, then add back each blended Laplacian band
+        blended = gaussian_left[-1] * gaussian_mask[-1] + gaussian_right[-1] * (1 - gaussian_mask[-1])
+        for level in range(levels - 1, -1, -1):
+            size = (gaussian_left[level].shape[1], gaussian_left[level].shape[0])
+            laplacian_left = gaussian_left[level] - cv2.pyrUp(gaussian_left[level + 1], dstsize=size)
+            laplacian_right = gaussian_right[level] - cv2.pyrUp(gaussian_right[level + 1], dstsize=size)
+            band = laplacian_left * gaussian_mask[level] + laplacian_right * (1 - gaussian_mask[level])
+            blended = cv2.pyrUp(blended, dstsize=size) + band
+
+        return clip(blended, 0, 255).round().astype(uint8)
@@ -0,0 +1,203 @@
+"""
+Stage-level benchmark of the stitching pipeline on synthetic rigs
+
+Usage:
+    python -m benchmarks.bench_pipeline --cameras 8 --resolution 1280x960
+    python -m benchmarks.bench_pipeline --record benchmarks/baseline.json
+    python -m benchmarks.bench_pipeline --baseline benchmarks/baseline.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import cv2
+from numpy import *
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app.alignment import global_transforms
+from app.encoding import encode_image
+from app.features import detect_and_describe, match_descriptors
+from app.rig import CompiledRig
+from app.stitching import stitch_images
+from app.utils import ImageStitching
+from benchmarks.synthetic_rig import make_rig, homography_error
+
+STAGES = ("decode", "detect", "match", "homography", "warp", "blend", "compose", "encode", "stitch")
+
+
+def _timed(function, repeat):
+    """Median wall time of repeat calls, and the last return value"""
+    timings, value = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = function()
+        timings.append(time.perf_counter() - start)
+    return float(median(timings)), value
+
+
+def benchmark_rig(cameras, view_size, repeat=3, jitter=0.5, source=None):
+    """
+    Time every pipeline stage on one synthetic rig
+
+    Args:
+        cameras (int): Number of cameras
+        view_size (tuple): (width, height) of each frame
+        repeat (int): Runs per stage, the median is reported
+        jitter (float): Per-camera rotation/perspective noise of the rig
+        source (numpy array): Source image to slice, procedural when None
+
+    Returns:
+        dict: {"stages": {stage: seconds}, "alignment_error": px, ...}
+    """
+    rig = make_rig(cameras, view_size, jitter=jitter, source=source)
+    width, height = view_size
+    scale = Config.REGISTRATION_SCALE
+    stages = {}
+
+    encoded = rig.encoded()
+    stages["decode"], frames = _timed(
+        lambda: [cv2.imdecode(frombuffer(data, uint8), cv2.IMREAD_COLOR) for data in encoded], repeat)
+
+    grays = [cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), None, fx=scale, fy=scale,
+                        interpolation=cv2.INTER_AREA) for frame in frames]
+    stages["detect"], features = _timed(lambda: [detect_and_describe(gray, scale=scale) for gray in grays], repeat)
+
+    pairs = range(cameras - 1)
+    stages["match"], matches = _timed(
+        lambda: [match_descriptors(features[i + 1][1], features[i][1]) for i in pairs], repeat)
+
+    def _homographies():
+        result = []
+        for i in pairs:
+            M = ImageStitching.compute_homography(
+                features[i + 1][0], features[i][0], matches[i], Config.REPROJ_THRESHOLD)
+            S = diag([scale, scale, 1.0])
+            result.append(None if M is None else linalg.inv(S) @ M[1] @ S)
+        return result
+    stages["homography"], homographies = _timed(_homographies, repeat)
+
+    errors = [homography_error(H, truth, width, height) if H is not None else float("inf")
+              for H, truth in zip(homographies, rig.ground_truth)]
+
+    # Warp, blend and compose with the ground truth so timings do not depend on alignment quality
+    transforms, canvas_size = global_transforms(rig.ground_truth, [f.shape for f in frames])
+    stages["warp"], _ = _timed(
+        lambda: [cv2.warpPerspective(frame, H, canvas_size) for frame, H in zip(frames, transforms)], repeat)
+
+    blender = ImageStitching(frames[0], frames[1])
+    stages["blend"], _ = _timed(
+        lambda: [blender.blending_smoothing(frames[i], frames[i + 1], rig.ground_truth[i]) for i in pairs], repeat)
+
+    rig_tables = CompiledRig(transforms, [f.shape for f in frames], canvas_size)
+    stages["compose"], panorama = _timed(lambda: rig_tables.stitch(frames), repeat)
+    stages["encode"], _ = _timed(lambda: encode_image(panorama, "jpeg"), repeat)
+
+    use_calibration = Config.USE_CALIBRATION
+    Config.USE_CALIBRATION = False
+    try:
+        stages["stitch"], _ = _timed(lambda: stitch_images(list(frames)), 1)
+    finally:
+        Config.USE_CALIBRATION = use_calibration
+
+    return {
+        "cameras": cameras,
+        "resolution": f"{width}x{height}",
+        "stages": stages,
+        "alignment_error": float(max(errors)) if errors else 0.0,
+        "pair_errors": errors
+    }
+
+
+def compare(results, baseline, threshold, max_error):
+    """
+    Compare results against a recorded baseline
+
+    Returns:
+        list: Human-readable regressions, empty when everything is within bounds
+    """
+    regressions = []
+    for key, result in results.items():
+        if result["alignment_error"] > max_error:
+            regressions.append(f"{key} alignment error {result['alignment_error']:.2f}px > {max_error}px")
+        reference = baseline.get("results", {}).get(key)
+        if reference is None:
+            continue
+        for stage, seconds in result["stages"].items():
+            base = reference["stages"].get(stage)
+            if base and seconds > base * (1 + threshold):
+                regressions.append(
+                    f"{key} {stage}: {seconds * 1000:.1f}ms vs baseline {base * 1000:.1f}ms "
+                    f"(+{(seconds / base - 1) * 100:.0f}%)")
+    return regressions
+
+
+def _parse_resolution(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the stitching pipeline on synthetic rigs")
+    parser.add_argument("--cameras", type=int, nargs="+", default=[8])
+    parser.add_argument("--resolution", type=_parse_resolution, nargs="+", default=[(1280, 960)])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--jitter", type=float, default=0.5, help="per-camera rotation/perspective noise")
+    parser.add_argument("--source", help="large image to slice instead of a procedural scene")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--record", help="record results as a new baseline JSON file")
+    parser.add_argument("--baseline", help="fail when a stage regresses against this baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown per stage (0.25 = 25%%)")
+    parser.add_argument("--max-error", type=float, default=3.0, help="allowed alignment error in pixels")
+    args = parser.parse_args(argv)
+
+    source = cv2.imread(args.source) if args.source else None
+    Config.FEATURE_PROCESSES = 0
+
+    results = {}
+    for cameras in args.cameras:
+        for view_size in args.resolution:
+            key = f"{cameras}x{view_size[0]}x{view_size[1]}"
+            print(f"Benchmarking {cameras} cameras at {view_size[0]}x{view_size[1]}...")
+            results[key] = benchmark_rig(cameras, view_size, args.repeat, args.jitter, source)
+
+    print()
+    print(f"{'rig':<18}" + "".join(f"{stage:>11}" for stage in STAGES) + f"{'error px':>10}")
+    for key, result in results.items():
+        row = "".join(f"{result['stages'][stage] * 1000:>9.1f}ms" for stage in STAGES)
+        print(f"{key:<18}{row}{result['alignment_error']:>10.2f}")
+
+    report = {
+        "created_at": time.time(),
+        "machine": platform.platform(),
+        "feature_backend": Config.FEATURE_BACKEND,
+        "registration_scale": Config.REGISTRATION_SCALE,
+        "results": results
+    }
+    for path in (args.output, args.record):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.max_error)
+    else:
+        regressions = compare(results, {}, args.threshold, args.max_error)
+
+    if regressions:
+        print("✗ Regressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("✓ No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+End-to-end load test of the Flask API against simulated Pis
+
+Starts a simulated rig (see pi_simulator) and the panorama server in this
+process, or drives an already running --server, then issues requests at a
+fixed concurrency and reports throughput and p50/p95/p99 latency per endpoint.
+
+Usage:
+    python -m benchmarks.load_test --cameras 8 --concurrency 4 --requests 40
+    python -m benchmarks.load_test --endpoints "POST /stitch?wait=1" "GET /status" --failure-rate 0.05
+    python -m benchmarks.load_test --server http://localhost:5001 --duration 60 --output load.json
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from numpy import percentile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from benchmarks.pi_simulator import add_arguments, simulator_from_args
+
+DEFAULT_ENDPOINTS = ("POST /stitch?wait=1", "GET /status", "GET /health")
+
+
+def start_server(port=0):
+    """
+    Run the panorama server in a background thread
+
+    Returns:
+        tuple: (base URL, werkzeug server)
+    """
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    server = make_server("127.0.0.1", port, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, name="load-test-server", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def _request(session, base_url, endpoint, timeout):
+    method, path = endpoint.split(" ", 1)
+    start = time.perf_counter()
+    try:
+        response = session.request(method, base_url + path, timeout=timeout)
+        status = response.status_code
+    except requests.exceptions.RequestException as e:
+        status = type(e).__name__
+    return endpoint, status, time.perf_counter() - start
+
+
+def run_load(base_url, endpoints, concurrency, requests_count=None, duration=None, timeout=120):
+    """
+    Issue requests round-robin over endpoints from concurrency workers
+
+    Args:
+        base_url (str): Server base URL
+        endpoints (list): "METHOD /path" strings
+        concurrency (int): Requests in flight at once
+        requests_count (int): Total requests, unless duration is given
+        duration (float): Seconds to keep issuing requests
+        timeout (float): Per-request timeout in seconds
+
+    Returns:
+        dict: Per endpoint: requests, throughput, p50/p95/p99/max latency and status counts
+    """
+    sessions = threading.local()
+    schedule = itertools.cycle(endpoints)
+    schedule_lock = threading.Lock()
+    issued = itertools.count()
+    stop_at = time.monotonic() + duration if duration else None
+    results = []
+
+    def worker():
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        while True:
+            if stop_at is not None and time.monotonic() >= stop_at:
+                return
+            if stop_at is None and next(issued) >= requests_count:
+                return
+            with schedule_lock:
+                endpoint = next(schedule)
+            results.append(_request(sessions.session, base_url, endpoint, timeout))
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    elapsed = time.monotonic() - start
+
+    report = {}
+    for endpoint in endpoints:
+        latencies = [r[2] for r in results if r[0] == endpoint]
+        statuses = {}
+        for r in results:
+            if r[0] == endpoint:
+                statuses[str(r[1])] = statuses.get(str(r[1]), 0) + 1
+        report[endpoint] = {
+            "requests": len(latencies),
+            "throughput": len(latencies) / elapsed if elapsed else 0.0,
+            "p50": float(percentile(latencies, 50)) if latencies else None,
+            "p95": float(percentile(latencies, 95)) if latencies else None,
+            "p99": float(percentile(latencies, 99)) if latencies else None,
+            "max": max(latencies) if latencies else None,
+            "statuses": statuses
+        }
+    return {"elapsed": elapsed, "concurrency": concurrency, "endpoints": report}
+
+
+def print_report(report):
+    print(f"\n{'endpoint':<28} {'n':>5} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  statuses")
+    for endpoint, stats in report["endpoints"].items():
+        if not stats["requests"]:
+            print(f"{endpoint:<28} {0:>5}")
+            continue
+        print(f"{endpoint:<28} {stats['requests']:>5} {stats['throughput']:>7.2f} "
+              f"{stats['p50'] * 1000:>8.1f} {stats['p95'] * 1000:>8.1f} {stats['p99'] * 1000:>8.1f}  "
+              f"{stats['statuses']}")
+    print(f"\n{report['elapsed']:.1f}s at concurrency {report['concurrency']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the panorama API against simulated Pis")
+    add_arguments(parser, port=0)
+    parser.add_argument("--server", help="drive this running server instead of starting one with a simulator")
+    parser.add_argument("--endpoints", nargs="+", default=list(DEFAULT_ENDPOINTS), help='"METHOD /path" strings')
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=40, help="total requests, ignored with --duration")
+    parser.add_argument("--duration", type=float, help="seconds to run instead of a request count")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout in seconds")
+    parser.add_argument("--output", help="write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    pis = []
+    if args.server:
+        base_url = args.server.rstrip("/")
+    else:
+        pis = simulator_from_args(args)
+        Config.RASPBERRY_PI_IPS = [pi.address for pi in pis]
+        Config.EXPECTED_IMAGE_COUNT = len(pis)
+        base_url, _ = start_server()
+        print(f"✓ Server at {base_url} with {len(pis)} simulated Pis")
+
+    report = run_load(base_url, args.endpoints, args.concurrency, args.requests, args.duration, args.timeout)
+    if pis:
+        report["simulator"] = [
+            {"address": pi.address, "captures": pi.captures, "failures": pi.failures, "stalls": pi.stalls}
+            for pi in pis
+        ]
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
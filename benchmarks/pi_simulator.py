@@ -0,0 +1,204 @@
+"""
+Local stand-in for a rig of Raspberry Pi cameras
+
+Starts N HTTP servers serving /capture and /status, one port each, with
+synthetic (or recorded) overlapping frames and configurable latency, jitter
+and failures. Point RASPBERRY_PI_IPS at the printed addresses.
+
+Usage:
+    python -m benchmarks.pi_simulator --cameras 8 --port 9000 --latency 0.05 --jitter 0.02
+    python -m benchmarks.pi_simulator --frames recorded/ --failure-rate 0.05 --stall-rate 0.01
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from benchmarks.bench_pipeline import _parse_resolution
+from benchmarks.synthetic_rig import make_rig
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class SimulatedPi:
+    """One fake camera server"""
+
+    def __init__(self, host, port, frame, latency=0.0, jitter=0.0, failure_rate=0.0, stall_rate=0.0, stall=30.0):
+        """
+        Args:
+            host (str): Address to bind
+            port (int): Port to bind, 0 picks a free one
+            frame (bytes): JPEG served by /capture
+            latency (float): Base /capture delay in seconds
+            jitter (float): Standard deviation in seconds added to the delay
+            failure_rate (float): Probability that /capture answers 503
+            stall_rate (float): Probability that /capture hangs for stall seconds, like a rebooting Pi
+            stall (float): Length of a stall in seconds
+        """
+        self.frame = frame
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.captures = 0
+        self.failures = 0
+        self.stalls = 0
+        self._lock = threading.Lock()
+
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if self.path.startswith(Config.CAPTURE_ENDPOINT):
+                    simulator._capture(self)
+                elif self.path.startswith(Config.STATUS_ENDPOINT):
+                    self._send(200, "application/json", json.dumps({"status": "ok"}).encode())
+                else:
+                    self._send(404, "application/json", b'{"error": "not found"}')
+
+            def _send(self, status, mimetype, body):
+                self.send_response(status)
+                self.send_header("Content-Type", mimetype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = f"{host}:{self.server.server_address[1]}"
+
+    def _capture(self, handler):
+        roll = random.random()
+        if roll < self.stall_rate:
+            with self._lock:
+                self.stalls += 1
+            time.sleep(self.stall)
+        else:
+            time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if roll >= 1 - self.failure_rate:
+            with self._lock:
+                self.failures += 1
+            handler._send(503, "application/json", b'{"error": "camera busy"}')
+            return
+        with self._lock:
+            self.captures += 1
+        handler._send(200, "image/jpeg", self.frame)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name=f"pi-{self.address}", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def load_frames(cameras, resolution=(1280, 960), frames_dir=None, quality=90):
+    """
+    JPEG frames for every camera: recorded files in name order, or a synthetic rig
+
+    Args:
+        cameras (int): Number of cameras
+        resolution (tuple): (width, height) of synthetic frames
+        frames_dir (str): Directory of recorded frames, used in order and cycled if short
+        quality (int): JPEG quality of synthetic or re-encoded frames
+
+    Returns:
+        list: JPEG bytes per camera
+    """
+    if frames_dir is None:
+        return make_rig(cameras=cameras, view_size=resolution).encoded(quality)
+
+    names = sorted(n for n in os.listdir(frames_dir) if n.lower().endswith(IMAGE_EXTENSIONS))
+    if not names:
+        raise ValueError(f"No images in {frames_dir}")
+    frames = []
+    for i in range(cameras):
+        path = os.path.join(frames_dir, names[i % len(names)])
+        if path.lower().endswith((".jpg", ".jpeg")):
+            with open(path, "rb") as f:
+                frames.append(f.read())
+        else:
+            frames.append(cv2.imencode(".jpg", cv2.imread(path), [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+    return frames
+
+
+def start_simulator(cameras=8, host="127.0.0.1", port=0, resolution=(1280, 960), frames_dir=None, **behaviour):
+    """
+    Start a simulated rig
+
+    Args:
+        cameras (int): Number of Pis
+        host (str): Address to bind
+        port (int): First port, camera i listens on port + i; 0 picks free ports
+        resolution (tuple): Synthetic frame (width, height)
+        frames_dir (str): Recorded frames instead of a synthetic rig
+        **behaviour: latency, jitter, failure_rate, stall_rate, stall, see SimulatedPi
+
+    Returns:
+        list: Started SimulatedPi servers; their addresses go in Config.RASPBERRY_PI_IPS
+    """
+    frames = load_frames(cameras, resolution, frames_dir)
+    return [
+        SimulatedPi(host, port + i if port else 0, frame, **behaviour).start()
+        for i, frame in enumerate(frames)
+    ]
+
+
+def add_arguments(parser, port=9000):
+    """Simulator options, shared with the load test"""
+    parser.add_argument("--cameras", type=int, default=8)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=port, help="first camera port, 0 for free ports")
+    parser.add_argument("--resolution", type=_parse_resolution, default=(1280, 960))
+    parser.add_argument("--frames", help="directory of recorded frames instead of a synthetic rig")
+    parser.add_argument("--latency", type=float, default=0.05, help="base /capture delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="delay standard deviation in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="probability of a 503")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="probability of a stalled capture")
+    parser.add_argument("--stall", type=float, default=30.0, help="stall length in seconds")
+
+
+def simulator_from_args(args):
+    return start_simulator(
+        args.cameras, args.host, args.port, args.resolution, args.frames,
+        latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+        stall_rate=args.stall_rate, stall=args.stall
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate a rig of Raspberry Pi cameras")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    pis = simulator_from_args(args)
+    print(f"✓ {len(pis)} simulated Pis, set RASPBERRY_PI_IPS = {json.dumps([pi.address for pi in pis])}")
+    try:
+        while True:
+            time.sleep(10)
+            print("captures " + ", ".join(f"{pi.address}: {pi.captures} ok/{pi.failures} failed/{pi.stalls} stalled"
+                                          for pi in pis))
+    except KeyboardInterrupt:
+        pass
+    for pi in pis:
+        pi.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Stand-in for the Raspberry Pi push client: every simulated camera posts
+timestamped JPEGs of a synthetic rig to POST /ingest/<camera>
+
+Usage:
+    python -m benchmarks.push_client --server http://localhost:5001 --cameras 8 --fps 2
+    python -m benchmarks.push_client --cameras 8 --skew 0.02 --drop 0.1 --duration 30
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_pipeline import _parse_resolution
+from benchmarks.synthetic_rig import make_rig
+
+
+class PushCamera(threading.Thread):
+    """One simulated camera pushing a frame on every shared trigger tick"""
+
+    def __init__(self, server, camera, data, trigger, skew=0.0, drop=0.0):
+        """
+        Args:
+            server (str): Panorama server base URL
+            camera (int): Camera index, the /ingest/<camera> path segment
+            data (bytes): JPEG pushed on every tick
+            trigger (Trigger): Shared capture clock
+            skew (float): Maximum random offset in seconds of this camera's capture time
+            drop (float): Probability of skipping a tick, as a lagging camera would
+        """
+        super().__init__(name=f"push-{camera}", daemon=True)
+        self.url = f"{server.rstrip('/')}/ingest/{camera}"
+        self.data = data
+        self.trigger = trigger
+        self.skew = skew
+        self.drop = drop
+        self.session = requests.Session()
+        self.sent = 0
+        self.failed = 0
+
+    def run(self):
+        tick = 0
+        while True:
+            tick, timestamp = self.trigger.wait(tick)
+            if timestamp is None:
+                return
+            if random.random() < self.drop:
+                continue
+            timestamp += random.uniform(-self.skew, self.skew)
+            try:
+                response = self.session.post(self.url, data=self.data, timeout=5, headers={
+                    "Content-Type": "image/jpeg",
+                    "X-Capture-Timestamp": f"{timestamp:.6f}"
+                })
+                response.raise_for_status()
+                self.sent += 1
+            except requests.exceptions.RequestException as e:
+                self.failed += 1
+                print(f"✗ {self.url}: {e}")
+
+
+class Trigger:
+    """Capture clock shared by every camera, like a hardware sync line"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._tick = 0
+        self._timestamp = None
+        self._stopped = False
+
+    def fire(self):
+        with self._condition:
+            self._tick += 1
+            self._timestamp = time.time()
+            self._condition.notify_all()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def wait(self, last_tick):
+        """Block until the tick after last_tick, returns (tick, timestamp) or (tick, None) once stopped"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._stopped or self._tick > last_tick)
+            return self._tick, None if self._stopped else self._timestamp
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Push synthetic camera frames to /ingest")
+    parser.add_argument("--server", default="http://localhost:5001")
+    parser.add_argument("--cameras", type=int, default=8)
+    parser.add_argument("--resolution", type=_parse_resolution, default=(1280, 960))
+    parser.add_argument("--fps", type=float, default=2.0)
+    parser.add_argument("--duration", type=float, help="seconds to run, forever when omitted")
+    parser.add_argument("--skew", type=float, default=0.005, help="per-frame capture time noise in seconds")
+    parser.add_argument("--drop", type=float, default=0.0, help="probability a camera skips a frame")
+    parser.add_argument("--quality", type=int, default=90)
+    args = parser.parse_args(argv)
+
+    rig = make_rig(cameras=args.cameras, view_size=args.resolution)
+    trigger = Trigger()
+    cameras = [
+        PushCamera(args.server, i, data, trigger, args.skew, args.drop)
+        for i, data in enumerate(rig.encoded(args.quality))
+    ]
+    for camera in cameras:
+        camera.start()
+
+    print(f"Pushing {args.cameras} cameras at {args.fps} fps to {args.server}/ingest/<camera>")
+    start = time.monotonic()
+    try:
+        while args.duration is None or time.monotonic() - start < args.duration:
+            trigger.fire()
+            time.sleep(1.0 / args.fps)
+    except KeyboardInterrupt:
+        pass
+    trigger.stop()
+    for camera in cameras:
+        camera.join(timeout=5)
+
+    sent = sum(c.sent for c in cameras)
+    failed = sum(c.failed for c in cameras)
+    print(f"✓ Pushed {sent} frames, {failed} failed, in {time.monotonic() - start:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import cv2
+from numpy import *
+
+
+class SyntheticRig:
+    """Overlapping camera views cut from one source image with known geometry"""
+
+    def __init__(self, views, view_transforms):
+        """
+        Args:
+            views (list): BGR camera frames in rig order
+            view_transforms (list): 3x3 matrices mapping source pixels into each view
+        """
+        self.views = views
+        self.view_transforms = view_transforms
+
+    @property
+    def ground_truth(self):
+        """Pairwise homographies, entry i maps view i+1 onto view i"""
+        return [
+            self.view_transforms[i] @ linalg.inv(self.view_transforms[i + 1])
+            for i in range(len(self.views) - 1)
+        ]
+
+    def encoded(self, quality=95):
+        """JPEG-encode every view, as a camera would send it"""
+        return [cv2.imencode(".jpg", view, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+                for view in self.views]
+
+
+def procedural_scene(height, width, seed=0):
+    """
+    Build a textured scene with structure at several scales
+
+    Args:
+        height (int): Scene height
+        width (int): Scene width
+        seed (int): Random seed
+
+    Returns:
+        numpy array: BGR uint8 scene
+    """
+    rs = random.RandomState(seed)
+    scene = zeros((height, width, 3), dtype=float32)
+    for cell in (256, 64, 16):
+        noise = rs.rand(height // cell + 2, width // cell + 2, 3).astype(float32)
+        scene += cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC)[:height, :width] * 85
+    scene = clip(scene, 0, 255).astype(uint8)
+
+    for _ in range(int(height * width / 4000)):
+        colour = tuple(int(c) for c in rs.randint(0, 255, 3))
+        x, y = int(rs.randint(0, width)), int(rs.randint(0, height))
+        size = int(rs.randint(4, 40))
+        if rs.rand() < 0.5:
+            cv2.circle(scene, (x, y), size, colour, -1)
+        else:
+            cv2.rectangle(scene, (x, y), (x + size, y + int(rs.randint(4, 40))), colour, -1)
+    return scene
+
+
+def make_rig(cameras=8, view_size=(1280, 960), overlap=0.3, jitter=0.0, source=None, seed=0):
+    """
+    Slice a source image into N overlapping camera views
+
+    Each view is the source seen through a known homography: a horizontal
+    step along the ring plus, with jitter > 0, a small random rotation and
+    perspective tilt per camera.
+
+    Args:
+        cameras (int): Number of views
+        view_size (tuple): (width, height) of every view
+        overlap (float): Fraction of a view shared with its neighbour
+        jitter (float): Strength of the per-camera rotation/perspective noise
+        source (numpy array): Source image, resized to fit; procedural when None
+        seed (int): Random seed
+
+    Returns:
+        SyntheticRig
+    """
+    rs = random.RandomState(seed)
+    view_width, view_height = view_size
+    step = int(view_width * (1 - overlap))
+    margin = int(0.1 * view_height)
+    scene_width = view_width + step * (cameras - 1) + 2 * margin
+    scene_height = view_height + 2 * margin
+
+    if source is None:
+        source = procedural_scene(scene_height, scene_width, seed)
+    else:
+        source = cv2.resize(source, (scene_width, scene_height), interpolation=cv2.INTER_AREA)
+
+    views, transforms = [], []
+    centre = array([[1, 0, view_width / 2], [0, 1, view_height / 2], [0, 0, 1]])
+    for i in range(cameras):
+        angle = rs.uniform(-1, 1) * jitter * 2.0
+        tilt = rs.uniform(-1, 1, 2) * jitter * 2e-5
+        rotation = cv2.getRotationMatrix2D((0, 0), angle, 1.0)
+        local = vstack([rotation, [tilt[0], tilt[1], 1]])
+        shift = array([[1, 0, -(margin + i * step)], [0, 1, -margin], [0, 0, 1]], dtype=float64)
+        V = centre @ local @ linalg.inv(centre) @ shift
+        views.append(cv2.warpPerspective(source, V, (view_width, view_height)))
+        transforms.append(V)
+
+    return SyntheticRig(views, transforms)
+
+
+def homography_error(H_estimated, H_truth, width, height):
+    """
+    Mean misalignment of two train -> query homographies inside the overlap
+
+    A grid of train-frame points is mapped by both homographies; only points
+    the ground truth places inside the query frame are scored, so the error
+    reflects the seam rather than extrapolation far outside the overlap.
+
+    Args:
+        H_estimated (numpy array): Estimated homography
+        H_truth (numpy array): Ground-truth homography
+        width (int): Frame width
+        height (int): Frame height
+
+    Returns:
+        float: Mean point error in pixels
+    """
+    xs, ys = meshgrid(linspace(0, width - 1, 32), linspace(0, height - 1, 24))
+    points = stack([xs.ravel(), ys.ravel()], axis=1).astype(float32).reshape(-1, 1, 2)
+    truth = cv2.perspectiveTransform(points, H_truth).reshape(-1, 2)
+    estimated = cv2.perspectiveTransform(points, H_estimated).reshape(-1, 2)
+
+    inside = ((truth[:, 0] >= 0) & (truth[:, 0] < width) & (truth[:, 1] >= 0) & (truth[:, 1] < height))
+    if not inside.any():
+        inside[:] = True
+    return float(linalg.norm(estimated[inside] - truth[inside], axis=1).mean())
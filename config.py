@@ -20,17 +20,157 @@ class Config:
 
     # Image capture settings
     REQUEST_TIMEOUT = 10
+    PI_PORT = 8080                 # Port of entries in RASPBERRY_PI_IPS without their own "host:port"
     CAPTURE_ENDPOINT = "/capture"
+    STATUS_ENDPOINT = "/status"
     EXPECTED_IMAGE_COUNT = 8
+    CAPTURE_DEADLINE = 12          # Seconds for the whole capture across all Pis
+    CAPTURE_MAX_WORKERS = 8        # Concurrent capture threads
+    CAPTURE_POOL_SIZE = 2          # Keep-alive connections per Pi
+    HEDGE_REQUESTS = True          # Send a second /capture once the first is slower than the Pi's p95
+    HEDGE_DEFAULT_DELAY = 1.0      # Hedge delay in seconds until HEDGE_MIN_SAMPLES latencies were seen
+    HEDGE_MIN_SAMPLES = 8
+    HEDGE_LATENCY_WINDOW = 64      # Captures kept per Pi for its p95
+    STALE_FALLBACK = True          # Stitch a camera's last good frame when it misses the capture
+    STALE_MAX_AGE = 30             # Seconds a last good frame may stand in
+    CAPTURE_SOURCE = "pull"        # "pull" from each Pi, "push" frames sent to /ingest, "auto" push when in sync
+
+    # Push ingestion, see /ingest/<camera>
+    INGEST_DEPTH = 8               # Newest pushed frames kept per camera
+    INGEST_SKEW_TOLERANCE = 0.05   # Seconds between the capture timestamps of one frame set
+    INGEST_MAX_AGE = 2.0           # Seconds after which a pushed frame is too old to stitch
+    INGEST_MAX_BYTES = 16 * 2**20  # Largest accepted frame
 
     # Stitching settings
     SMOOTHING_WINDOW_PERCENT = 0.10
+    BLEND_MODE = "linear"           # "linear" ramp or "multiband" Laplacian blend in the overlap strip
+    MULTIBAND_LEVELS = 4
     MIN_MATCH_COUNT = 4
+    MIN_INLIER_COUNT = 12           # RANSAC inliers a pair needs before its homography is trusted
+    MIN_INLIER_RATIO = 0.1          # ... and the share of its matches they must make up
     REPROJ_THRESHOLD = 4.0
+    FEATURE_BACKEND = "sift-bf"     # "sift-bf", "sift-flann", "orb" or "akaze"
+    MAX_KEYPOINTS = 0               # Keypoint cap per frame, 0 = unlimited (ORB defaults to 5000)
+    ORB_LEVELS = 8                  # ORB pyramid levels at full resolution, fewer at REGISTRATION_SCALE
+    ORB_FAST_THRESHOLD = 10         # FAST corner threshold of ORB (OpenCV default 20)
+    AKAZE_THRESHOLD = 0.0005        # AKAZE response threshold at full resolution, times REGISTRATION_SCALE²
+    MATCH_RATIO = 0.75              # Lowe's ratio test for the FLANN backends
+    ALIGNMENT_MODE = "global"       # "global" (one reference camera) or "chained" (recurse_stitch)
+    ALIGNMENT_WORKERS = 8           # Threads for per-camera detection and per-pair matching
+    REFERENCE_CAMERA = None         # Camera index aligned to the identity, None = middle camera
+    REGISTRATION_SCALE = 0.5        # Detect and match on frames resized by this factor (1.0 = full resolution)
+    REGISTRATION_DECODE = "reduced" # "reduced": workers decode the JPEG bytes to grayscale at REGISTRATION_SCALE, "frame": convert decoded frames
+    REGISTRATION_REFINE = False     # Refine working-resolution homographies against full-resolution frames
+    REFINE_PATCH_SIZE = 21          # Correlation patch size in pixels for refinement
+    REFINE_MAX_POINTS = 200         # Inliers re-located per pair during refinement
+    REFINE_MIN_SCORE = 0.8          # Minimum normalized correlation to accept a refined point
+    REFINE_REPROJ_THRESHOLD = 1.5   # RANSAC threshold (px) for the refined fit
+    FEATURE_PROCESSES = None        # Feature/matching worker processes, None = one per core, 0 = threads
+    FEATURE_POOL_START_METHOD = "spawn"
+
+    # Rig calibration settings
+    USE_CALIBRATION = True
+    CALIBRATE_ON_STARTUP = False
+    CALIBRATION_FILE = "calibration/rig_calibration.json"
+    CALIBRATION_REVALIDATE_INTERVAL = 3600  # Seconds between drift checks, 0 disables
+    CALIBRATION_VALIDATION_SCALE = 0.25     # Frame scale used for the cheap drift check
+    CALIBRATION_DRIFT_THRESHOLD = 6.0       # Median reprojection error (px) that triggers recalibration
+    CALIBRATION_RETRY_INTERVAL = 300        # Seconds before a rig that failed to calibrate is tried again
+
+    # Compiled rig: precomputed remap tables for calibrated stitches
+    COMPILED_RIG = True
+    COMPILED_RIG_FEATHER = 50       # Blend ramp width in pixels at each frame edge
+    COMPILED_RIG_MAX_WIDTH = 32768  # Upper bound on the compiled panorama width, larger canvases are scaled down
+    COMPILED_RIG_MAX_HEIGHT = 8192  # Upper bound on the compiled panorama height
+
+    # Incremental stitching: only cameras whose frames changed are re-composed
+    INCREMENTAL_STITCH = True       # Applies to the compiled rig and 360° projection paths
+    INCREMENTAL_CHANGE_THRESHOLD = 0.002  # Fraction of changed thumbnail pixels that counts as a change
+    INCREMENTAL_PIXEL_DELTA = 10    # Thumbnail gray-level difference that marks a pixel as changed
+    INCREMENTAL_THUMBNAIL_WIDTH = 96
+    INCREMENTAL_REBASE_EVERY = 100  # Full re-compose after this many incremental updates
+
+    # 360° projection: every camera lands in its angular sector of a fixed-size panorama
+    PROJECTION_MODE = "planar"      # "planar" (homography canvas), "cylindrical" or "equirectangular"
+    PROJECTION_WIDTH = 8192         # Panorama width covering 360°
+    PROJECTION_HEIGHT = 1024
+    PROJECTION_VFOV = None          # Vertical span of the panorama in degrees, None = CAMERA_VFOV
+    PROJECTION_YAW_TOLERANCE = 2.0  # Output pixels estimated yaws may drift before the projection is recompiled
+    CAMERA_HFOV = 62.2              # Raspberry Pi Camera v2 field of view in degrees
+    CAMERA_VFOV = 48.8
+    CAMERA_FOCAL = None             # Focal length in pixels, None = derived from CAMERA_HFOV
+    CAMERA_YAWS = None              # Camera headings in degrees (-180..180 left to right), None = from calibration
+
+    # Person detection on the source frames, see /detect
+    DETECTION_BACKEND = "hog"       # "hog" (built-in pedestrian SVM) or "dnn" (SSD-style model below)
+    DETECTION_WORKERS = 8           # Threads running the HOG detector, one frame each
+    DETECTION_SCALE = 1.0           # Resize factor for HOG, people must stay taller than 128 px
+    DETECTION_CONFIDENCE = 0.5      # Minimum SSD confidence or HOG SVM weight
+    DETECTION_NMS_THRESHOLD = 0.4   # IoU above which overlapping panorama boxes are merged
+    DETECTION_MODEL = None          # e.g. "models/MobileNetSSD_deploy.caffemodel"
+    DETECTION_MODEL_CONFIG = None   # e.g. "models/MobileNetSSD_deploy.prototxt"
+    DETECTION_INPUT_SIZE = (300, 300)
+    DETECTION_BLOB_SCALE = 0.007843 # Pixel scale and mean of the MobileNet-SSD preprocessing
+    DETECTION_MEAN = (127.5, 127.5, 127.5)
+    DETECTION_PERSON_CLASS = 15     # "person" in the VOC labels of MobileNet-SSD
+
+    # Raspberry Pi health monitor behind /status and /health
+    HEALTH_POLL_INTERVAL = 5        # Seconds between probe rounds
+    HEALTH_TIMEOUT = 2              # Per-probe timeout, all Pis are probed concurrently
+    HEALTH_OFFLINE_AFTER = 2        # Consecutive failures before a Pi is marked offline
+    HEALTH_LATENCY_WINDOW = 32      # Probes kept for the rolling latency stats
+    CAPTURE_SKIP_OFFLINE = True     # Do not wait on Pis the monitor knows to be offline
+
+    # Job settings
+    JOB_WORKERS = 1                 # Stitch jobs running at once
+    JOB_QUEUE_LIMIT = 4             # Queued jobs before /stitch answers 503
+    JOB_WAIT_TIMEOUT = 120          # Seconds /stitch?wait=1 blocks before returning the job id
+    JOB_RETENTION = 300             # Seconds finished jobs and their results are kept
+    JOB_HISTORY = 32                # Finished jobs kept at most
+
+    # Shared memory frame buffers between capture and the feature worker processes
+    FRAME_BUFFERS = True            # Decode job captures into reusable shared memory slots
+    FRAME_BUFFER_SLOTS = 2          # Frame sets kept; a slot is reused once no stitch reads it
+    FRAME_BUFFER_WAIT = 1.0         # Seconds a capture waits for a free slot before using private memory
+
+    # Memory settings
+    MEMORY_BUDGET = 1024 * 2**20    # Bytes of compose working buffers shared by concurrent stitches
+    MEMORY_MIN_BAND_ROWS = 64       # Smallest horizontal band composed at once when the budget is tight
+
+    # Streaming settings
+    STREAM_ENABLED = False          # Start the background capture/stitch loop from create_app
+    STREAM_TARGET_FPS = 2.0
+    STREAM_BUFFER_SIZE = 8          # Recent panoramas kept in memory
+    STREAM_JPEG_QUALITY = 85
+    STREAM_KEEPALIVE_INTERVAL = 5   # Seconds an MJPEG viewer waits before re-checking
 
     # Output settings
+    OUTPUT_FORMAT = "jpeg"          # Default /stitch format: "jpeg", "webp" or "png"
+    OUTPUT_QUALITY = 90             # JPEG/WebP quality
+    PNG_COMPRESSION = 1             # PNG compression level, low favours speed
+    PERSIST_PANORAMAS = True        # Keep each panorama in the panorama store, see /panoramas
+    DEBUG_ARTIFACTS = False         # Render match images and write intermediate panoramas
+
+    # Logging and instrumentation
+    LOG_LEVEL = "INFO"              # Set to "DEBUG" for per-pair keypoint/match counts
+    LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+    TRACE_SPANS = False             # Include per-stage spans in /jobs/<id> (or pass ?trace=1)
     OUTPUT_DIR = "outputs"
     PANORAMA_FILENAME = "panorama_image.jpg"
     MAPPED_FILENAME = "mapped_image.jpg"
     FINAL_PANO_FILENAME = "final_pano.jpg"
 
+    # Tile pyramid served at /panoramas/<id>/tiles/<z>/<x>/<y>
+    TILES_ENABLED = True            # Register every panorama for tiling
+    TILE_SIZE = 256
+    TILE_FORMAT = "jpeg"
+    TILE_QUALITY = 80
+    TILE_PYRAMIDS_KEPT = 4          # Recent pyramids kept in memory, older ones are loaded from the store
+    TILE_CACHE_BYTES = 64 * 1024**2 # Encoded tiles kept, shared by panoramas with identical tiles
+
+    # Panorama store: files in OUTPUT_DIR indexed in SQLite
+    STORE_DB_FILE = None            # SQLite index, None = OUTPUT_DIR/panoramas.db
+    STORE_MAX_BYTES = 2 * 1024**3   # Byte budget, oldest panoramas are evicted beyond it
+    STORE_MAX_AGE = 24 * 3600       # Seconds a panorama is kept
+    STORE_EVICT_INTERVAL = 60       # Seconds between background eviction passes
+
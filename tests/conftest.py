@@ -0,0 +1,32 @@
+"""
+Fixtures shared by the test modules
+
+Run with: python -m pytest -q tests
+"""
+import os
+import sys
+import pytest
+from numpy import full, uint8
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app import jobs
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Two 120x160 frames per capture and a grey panorama per stitch"""
+    monkeypatch.setattr(Config, "EXPECTED_IMAGE_COUNT", 2)
+    monkeypatch.setattr(Config, "PERSIST_PANORAMAS", False)
+    monkeypatch.setattr(Config, "TILES_ENABLED", False)
+    monkeypatch.setattr(jobs, "needs_frame_buffers", lambda: False)
+    monkeypatch.setattr(jobs, "capture_images", lambda frame_buffers=False: {
+        "images": [full((120, 160, 3), 128, uint8)] * 2,
+        "encoded": None,
+        "frames": None,
+        "cameras": [],
+        "wall_time": 0.0,
+        "frame_skew": 0.0
+    })
+    monkeypatch.setattr(jobs, "stitch_images", lambda images, **kwargs: (full((120, 300, 3), 128, uint8), None))
@@ -0,0 +1,64 @@
+"""
+/detect against simulated Pis, see benchmarks/pi_simulator.py
+
+Run with: python -m pytest -q tests
+"""
+import os
+import sys
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app import routes
+from benchmarks.pi_simulator import start_simulator
+
+
+@pytest.fixture
+def rig(monkeypatch):
+    pis = start_simulator(4, resolution=(320, 240))
+    monkeypatch.setattr(Config, "RASPBERRY_PI_IPS", [pi.address for pi in pis])
+    monkeypatch.setattr(Config, "EXPECTED_IMAGE_COUNT", len(pis))
+    monkeypatch.setattr(Config, "CAPTURE_SOURCE", "pull")
+    monkeypatch.setattr(Config, "CAPTURE_SKIP_OFFLINE", False)
+    monkeypatch.setattr(Config, "CAPTURE_DEADLINE", 2)
+    monkeypatch.setattr(Config, "HEDGE_REQUESTS", False)
+    monkeypatch.setattr(Config, "STALE_FALLBACK", True)
+    monkeypatch.setattr(Config, "USE_CALIBRATION", False)
+    monkeypatch.setattr(Config, "FEATURE_PROCESSES", 0)
+    yield pis
+    for pi in pis:
+        pi.stop()
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(routes.bp)
+    return app.test_client()
+
+
+def test_detect_labels_stale_cameras(rig, client):
+    assert client.get("/detect").status_code == 200
+
+    # Camera 1 now fails and stands in with its last good frame
+    rig[1].failure_rate = 1.0
+    response = client.get("/detect")
+
+    assert response.status_code == 200
+    cameras = response.get_json()["cameras"]
+    assert [c["camera"] for c in cameras] == [0, 1, 2, 3]
+    assert [c["ip"] for c in cameras] == Config.RASPBERRY_PI_IPS
+    assert [c["status"] for c in cameras] == ["ok", "stale", "ok", "ok"]
+
+
+def test_detect_alignment_failure_is_json(rig, client, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("registration blew up")
+
+    monkeypatch.setattr(routes, "estimate_pairwise", fail)
+    response = client.get("/detect")
+
+    assert response.status_code == 500
+    assert response.get_json() == {"error": "Image alignment failed", "details": "registration blew up"}
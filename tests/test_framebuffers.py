@@ -0,0 +1,83 @@
+"""
+Shared memory frame slots: reuse after release and fencing of late writers
+
+Run with: python -m pytest -q tests
+"""
+import os
+import sys
+import pytest
+from numpy import full, random, uint8
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.alignment import _detect_frame_task
+from app.framebuffers import FrameBufferPool
+
+
+@pytest.fixture
+def pool():
+    pool = FrameBufferPool(slots=1)
+    yield pool
+    pool.close()
+
+
+def frame(value):
+    return full((120, 160, 3), value, uint8)
+
+
+def test_slot_is_reused_after_release(pool):
+    writer = pool.acquire(timeout=0)
+    writer.write(0, frame(10))
+    frames = writer.publish([0])
+
+    assert frames.valid
+    assert pool.acquire(timeout=0) is None  # Still being read
+
+    pool.release(frames)
+    second = pool.acquire(timeout=0)
+    assert second is not None and second.slot == frames.slot
+    assert not frames.valid
+
+    second.write(0, frame(20))
+    assert (frames.view(0) == 20).all()  # The old handle now sees the new capture's pixels
+
+
+def test_recycled_frame_set_is_not_detected(pool):
+    writer = pool.acquire(timeout=0)
+    writer.write(0, random.default_rng(0).integers(0, 256, (240, 320, 3), dtype=uint8))
+    frames = writer.publish([0])
+    assert _detect_frame_task(frames, 0, 1.0)[0] is not None
+
+    pool.release(frames)
+    pool.acquire(timeout=0)
+
+    points, features, _ = _detect_frame_task(frames, 0, 1.0)
+    assert points is None and features is None
+
+
+def test_late_write_after_publish_is_dropped(pool):
+    writer = pool.acquire(timeout=0)
+    writer.write(0, frame(10))
+    frames = writer.publish([0])
+
+    assert writer.write(0, frame(99)) is None
+    assert (frames.view(0) == 10).all()
+    with pytest.raises(RuntimeError):
+        writer.publish([0])
+
+
+def test_stale_writer_cannot_touch_the_next_capture(pool):
+    writer = pool.acquire(timeout=0)
+    writer.abort()
+    second = pool.acquire(timeout=0)
+    second.write(0, frame(20))
+
+    # The first capture's late fetch and abort arrive after its slot was reopened
+    assert writer.write(0, frame(99)) is None
+    writer.abort()
+    with pytest.raises(RuntimeError):
+        writer.publish([0])
+
+    frames = second.publish([0])
+    assert frames.valid and (frames.view(0) == 20).all()
+    pool.release(frames)
@@ -0,0 +1,88 @@
+"""
+Incremental stitching against a full compose of the same frames
+
+Run with: python -m pytest -q tests
+"""
+import os
+import sys
+import pytest
+from numpy import abs as absolute, int16, linspace, pi, random, uint8
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app.incremental import IncrementalCompositor
+from app.projection import CompiledProjection
+from app.rig import compose
+
+CAMERAS = 6
+FRAME_SHAPE = (240, 320)
+
+
+@pytest.fixture(scope="module")
+def projection():
+    yaws = linspace(0, 2 * pi, CAMERAS, endpoint=False)
+    return CompiledProjection(yaws, [FRAME_SHAPE] * CAMERAS, mode="cylindrical", canvas_size=(1024, 256))
+
+
+def frames(seed=0):
+    rng = random.default_rng(seed)
+    return [rng.integers(0, 256, FRAME_SHAPE + (3,), dtype=uint8) for _ in range(CAMERAS)]
+
+
+def max_difference(a, b):
+    return int(absolute(a.astype(int16) - b.astype(int16)).max())
+
+
+def test_first_stitch_matches_compose(projection):
+    images = frames()
+    assert max_difference(IncrementalCompositor().stitch(projection, images), compose(projection, images)) <= 1
+
+
+def test_unchanged_frames_reuse_the_cached_panorama(projection):
+    compositor = IncrementalCompositor()
+    first = compositor.stitch(projection, frames())
+
+    assert compositor.stitch(projection, frames()) is first
+
+
+def test_changed_camera_matches_a_full_rebuild(projection):
+    compositor = IncrementalCompositor()
+    images = frames()
+    first = compositor.stitch(projection, images)
+    before = first.copy()
+
+    changed = list(images)
+    changed[2] = frames(1)[2]
+    panorama = compositor.stitch(projection, changed)
+
+    assert max_difference(panorama, compose(projection, changed)) <= 1
+    # Earlier results are never written to, and cameras that did not change keep their pixels
+    assert (first == before).all()
+    x0, _, x1, _ = next(camera["roi"] for camera in projection.cameras if camera["index"] == 2)
+    outside = [c for c in range(panorama.shape[1]) if not x0 <= c < x1]
+    assert (panorama[:, outside] == before[:, outside]).all()
+
+
+def test_repeated_deltas_do_not_drift(projection, monkeypatch):
+    monkeypatch.setattr(Config, "INCREMENTAL_REBASE_EVERY", 10 ** 6)
+    compositor = IncrementalCompositor()
+    images = frames()
+    compositor.stitch(projection, images)
+
+    for seed in range(1, 11):
+        images = list(images)
+        images[seed % CAMERAS] = frames(seed)[seed % CAMERAS]
+        panorama = compositor.stitch(projection, images)
+
+    assert max_difference(panorama, compose(projection, images)) <= 1
+
+
+def test_other_geometry_rebuilds(projection):
+    compositor = IncrementalCompositor()
+    images = frames()
+    compositor.stitch(projection, images)
+
+    other = CompiledProjection(projection.yaws + 0.1, [FRAME_SHAPE] * CAMERAS, mode="cylindrical",
+                               canvas_size=(1024, 256))
+    assert max_difference(compositor.stitch(other, images), compose(other, images)) <= 1
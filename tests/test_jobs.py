@@ -0,0 +1,143 @@
+"""
+Stitch jobs with the capture and stitch stages stubbed out: coalescing, waiting and reporting
+
+Run with: python -m pytest -q tests
+"""
+import os
+import sys
+import threading
+import time
+import pytest
+from flask import Flask
+from numpy import full, uint8
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app import jobs, routes
+from app.jobs import JobManager
+from app.metrics import stage
+
+
+def test_memory_report_is_set_when_waiters_wake(pipeline, monkeypatch):
+    real_rss = jobs.rss
+    calls = []
+
+    def slow_rss():
+        # The closing measurement is slow, so a job finished before it would wake the waiter early
+        calls.append(1)
+        if len(calls) > 1:
+            time.sleep(0.2)
+        return real_rss()
+
+    monkeypatch.setattr(jobs, "rss", slow_rss)
+    job, _ = JobManager().submit()
+
+    assert job.wait(5)
+    assert job.status == "done"
+    assert set(job.metadata["memory"]) == {"rss_start", "rss_peak", "rss_end", "peak_exclusive"}
+
+
+def test_failed_job_reports_memory(pipeline, monkeypatch):
+    monkeypatch.setattr(jobs, "stitch_images", lambda images, **kwargs: (None, None))
+    job, _ = JobManager().submit()
+
+    assert job.wait(5)
+    assert job.status == "failed"
+    assert job.error == "Panorama stitching failed"
+    assert job.metadata["memory"] is not None
+
+
+def test_spans_are_collected_when_waiters_wake(pipeline, monkeypatch):
+    real_end_trace = jobs.end_trace
+
+    def slow_end_trace():
+        time.sleep(0.2)
+        return real_end_trace()
+
+    def stitch(images, **kwargs):
+        with stage("stitch"):
+            return full((120, 300, 3), 128, uint8), None
+
+    monkeypatch.setattr(jobs, "end_trace", slow_end_trace)
+    monkeypatch.setattr(jobs, "stitch_images", stitch)
+    job, _ = JobManager().submit()
+
+    assert job.wait(5)
+    assert [span["name"] for span in job.to_dict(trace=True)["trace"]] == ["stitch", "encode"]
+
+
+@pytest.fixture
+def gate(pipeline, monkeypatch):
+    """Holds every stitch until the test sets it, and counts the stitches"""
+    gate = threading.Event()
+    gate.stitches = 0
+
+    def stitch(images, **kwargs):
+        gate.stitches += 1
+        assert gate.wait(5)
+        return full((120, 300, 3), 128, uint8), None
+
+    monkeypatch.setattr(jobs, "stitch_images", stitch)
+    return gate
+
+
+def test_requests_attach_to_the_running_job(gate):
+    manager = JobManager(workers=1)
+    first, attached_first = manager.submit()
+    second, attached_second = manager.submit({"format": "png"})
+
+    assert not attached_first and attached_second
+    assert second is first and first.attached == 1
+    assert not first.wait(0.1)
+
+    gate.set()
+    assert first.wait(5) and first.status == "done"
+    assert gate.stitches == 1
+    # The attached request still gets its own encoding of the shared panorama
+    assert first.result("png")[1] == "image/png"
+
+    third, attached_third = manager.submit()
+    assert not attached_third and third is not first
+    assert third.wait(5)
+
+
+def test_debug_jobs_run_on_their_own(gate):
+    manager = JobManager(workers=2)
+    shared, _ = manager.submit()
+    debug, attached = manager.submit({"debug": True})
+
+    assert not attached and debug is not shared
+    assert manager.submit()[0] is shared
+
+    gate.set()
+    assert shared.wait(5) and debug.wait(5)
+    assert gate.stitches == 2
+
+
+def test_queue_limit(gate, monkeypatch):
+    monkeypatch.setattr(Config, "JOB_QUEUE_LIMIT", 2)
+    manager = JobManager(workers=1)
+    manager.submit({"debug": True})
+    manager.submit({"debug": True})
+
+    with pytest.raises(OverflowError):
+        manager.submit({"debug": True})
+    gate.set()
+
+
+def test_stitch_wait_returns_the_image(gate, monkeypatch):
+    manager = JobManager(workers=1)
+    monkeypatch.setattr(routes, "get_job_manager", lambda: manager)
+    app = Flask(__name__)
+    app.register_blueprint(routes.bp)
+    client = app.test_client()
+
+    queued = client.post("/stitch").get_json()
+    assert queued["status"] in ("queued", "running") and queued["status_url"] == f"/jobs/{queued['job_id']}"
+
+    gate.set()
+    response = client.post("/stitch?wait=1&format=png")
+    assert response.status_code == 200 and response.mimetype == "image/png"
+    status = client.get(f"/jobs/{queued['job_id']}").get_json()
+    assert status["status"] == "done" and status["metadata"]["memory"] is not None
@@ -0,0 +1,59 @@
+"""
+Memory budget accounting of composing and incremental stitching
+
+Run with: python -m pytest -q tests
+"""
+import os
+import sys
+import pytest
+from numpy import linspace, pi, random, uint8
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import memory
+from app.incremental import IncrementalCompositor, resident_bytes
+from app.memory import MemoryBudget, scratch_bytes
+from app.projection import CompiledProjection
+from app.rig import compose
+
+CAMERAS = 6
+FRAME_SHAPE = (240, 320)
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    budget = MemoryBudget(2 ** 30)
+    monkeypatch.setattr(memory, "_budget", budget)
+    return budget
+
+
+@pytest.fixture(scope="module")
+def projection():
+    yaws = linspace(0, 2 * pi, CAMERAS, endpoint=False)
+    return CompiledProjection(yaws, [FRAME_SHAPE] * CAMERAS, mode="cylindrical", canvas_size=(1024, 256))
+
+
+def frames(seed=0):
+    rng = random.default_rng(seed)
+    return [rng.integers(0, 256, FRAME_SHAPE + (3,), dtype=uint8) for _ in range(CAMERAS)]
+
+
+def test_scratch_buffers_stay_reserved(budget, projection):
+    compose(projection, frames())
+    held = budget.used
+
+    assert held == scratch_bytes() > 0
+    compose(projection, frames(1))
+    assert budget.used == held
+
+
+def test_incremental_reserves_retained_frames(budget, projection):
+    compositor = IncrementalCompositor()
+    compositor.stitch(projection, frames())
+
+    width, height = projection.canvas_size
+    frame_bytes = CAMERAS * FRAME_SHAPE[0] * FRAME_SHAPE[1] * 3
+    assert budget.used == resident_bytes(projection) == width * height * 3 * 5 + frame_bytes
+
+    compositor.reset()
+    assert budget.used == 0
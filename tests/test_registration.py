@@ -0,0 +1,70 @@
+"""
+Registration accuracy of every feature backend on the synthetic rig
+
+Run with: python -m pytest -q tests
+"""
+import os
+import sys
+import cv2
+import pytest
+from numpy import float32
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app.alignment import estimate_pairwise, global_transforms, last_registration_stats
+from app.features import FEATURE_BACKENDS
+from benchmarks.synthetic_rig import make_rig, homography_error
+
+MAX_ERROR = 3.0  # Pixels, as bench_pipeline --max-error
+
+
+@pytest.fixture(autouse=True)
+def threads(monkeypatch):
+    monkeypatch.setattr(Config, "FEATURE_PROCESSES", 0)
+
+
+@pytest.mark.parametrize("backend", FEATURE_BACKENDS)
+@pytest.mark.parametrize("view_size", [(640, 480), (1280, 960)])
+def test_homography_error(backend, view_size, monkeypatch):
+    monkeypatch.setattr(Config, "FEATURE_BACKEND", backend)
+    rig = make_rig(6, view_size=view_size, jitter=0.5)
+    width, height = view_size
+
+    pairs = estimate_pairwise(rig.views, encoded=rig.encoded())
+
+    assert all(pair is not None for pair in pairs)
+    errors = [homography_error(pair[0], truth, width, height) for pair, truth in zip(pairs, rig.ground_truth)]
+    assert max(errors) < MAX_ERROR, errors
+
+
+def test_too_few_inliers_is_rejected(monkeypatch):
+    monkeypatch.setattr(Config, "MIN_INLIER_COUNT", 10 ** 6)
+    rig = make_rig(3, view_size=(640, 480))
+
+    assert estimate_pairwise(rig.views, encoded=rig.encoded()) == [None, None]
+
+
+def test_registration_stats():
+    rig = make_rig(3, view_size=(640, 480))
+    estimate_pairwise(rig.views, encoded=rig.encoded())
+
+    stats = last_registration_stats()
+    assert stats["cameras"] == 3
+    assert stats["serial"] > 0 and stats["speedup"] > 0
+
+
+def test_oversized_canvas_is_scaled_to_fit(monkeypatch, caplog):
+    rig = make_rig(4, view_size=(640, 480))
+    shapes = [view.shape for view in rig.views]
+    _, (full_width, full_height) = global_transforms(rig.ground_truth, shapes)
+    monkeypatch.setattr(Config, "COMPILED_RIG_MAX_WIDTH", full_width // 2)
+
+    transforms, (width, height) = global_transforms(rig.ground_truth, shapes)
+
+    assert width <= full_width // 2 and height < full_height
+    assert "scaling it by" in caplog.text
+    for H, (view_height, view_width, _) in zip(transforms, shapes):
+        corners = float32([[0, 0], [view_width, 0], [view_width, view_height], [0, view_height]])
+        projected = cv2.perspectiveTransform(corners.reshape(-1, 1, 2), H).reshape(-1, 2)
+        assert (projected >= -1).all() and (projected <= [width + 1, height + 1]).all()
@@ -0,0 +1,89 @@
+"""
+Panorama store: byte total, replacement, eviction and import of existing files
+
+Run with: python -m pytest -q tests
+"""
+import os
+import sys
+import time
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app import store as store_module
+from app.store import PanoramaStore
+
+
+def flush():
+    """Wait for the background writer to finish every queued write"""
+    store_module._get_writer().submit(lambda: None).result()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "STORE_MAX_BYTES", 10 ** 9)
+    monkeypatch.setattr(Config, "STORE_MAX_AGE", 3600)
+    return PanoramaStore(directory=str(tmp_path))
+
+
+def add(store, panorama_id, nbytes, extension=".jpg", created_at=None):
+    store.add(panorama_id, b"x" * nbytes, "image/jpeg", extension, created_at=created_at)
+    flush()
+
+
+def test_add_indexes_and_counts_bytes(store):
+    add(store, "a", 100)
+    add(store, "b", 50)
+
+    assert store.stats()["bytes"] == 150
+    assert [entry["id"] for entry in store.list()] == ["b", "a"]
+    assert os.path.getsize(store.path(store.get("a"))) == 100
+
+
+def test_replace_swaps_bytes_and_file(store):
+    add(store, "a", 100)
+    add(store, "a", 30)
+    assert store.stats()["count"] == 1
+    assert store.stats()["bytes"] == 30
+
+    add(store, "a", 40, extension=".webp")
+    assert store.stats()["bytes"] == 40
+    assert sorted(f for f in os.listdir(store.directory) if not f.startswith("panoramas.db")) == ["a.webp"]
+
+
+def test_evict_by_age(store):
+    now = time.time()
+    add(store, "old", 100, created_at=now - 7200)
+    add(store, "new", 100, created_at=now)
+
+    assert store.evict() == 1
+    assert store.get("old") is None and store.get("new") is not None
+    assert not os.path.exists(os.path.join(store.directory, "old.jpg"))
+    assert store.stats()["bytes"] == 100
+
+
+def test_evict_oldest_beyond_byte_budget(store, monkeypatch):
+    now = time.time()
+    for i in range(4):
+        add(store, f"p{i}", 100, created_at=now - 10 + i)
+    monkeypatch.setattr(Config, "STORE_MAX_BYTES", 250)
+
+    assert store.evict() == 2
+    assert [entry["id"] for entry in store.list()] == ["p3", "p2"]
+    assert store.stats()["bytes"] == 200
+    assert store.evict() == 0
+
+
+def test_existing_panoramas_are_imported_once(tmp_path):
+    (tmp_path / "1718000000_final_panorama.jpg").write_bytes(b"x" * 64)
+    (tmp_path / Config.PANORAMA_FILENAME).write_bytes(b"debug")
+    (tmp_path / "notes.txt").write_text("not a panorama")
+
+    store = PanoramaStore(directory=str(tmp_path))
+    assert [entry["filename"] for entry in store.list()] == ["1718000000_final_panorama.jpg"]
+    assert store.stats()["bytes"] == 64
+
+    # Reopening an existing index does not scan the directory again
+    (tmp_path / "later.jpg").write_bytes(b"x" * 8)
+    assert PanoramaStore(directory=str(tmp_path)).stats()["bytes"] == 64
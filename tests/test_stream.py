@@ -0,0 +1,47 @@
+"""
+Panorama stream fed by stitch jobs, and the /stream endpoint
+
+Run with: python -m pytest -q tests
+"""
+import os
+import sys
+import cv2
+import pytest
+from flask import Flask
+from numpy import frombuffer, uint8
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app import jobs, routes
+from app.jobs import JobManager
+from app.streaming import PanoramaStream
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    stream = PanoramaStream()
+    monkeypatch.setattr(jobs, "get_stream", lambda: stream)
+    return stream
+
+
+@pytest.mark.parametrize("options", [{"format": "webp"}, {"format": "jpeg", "max_width": 100}])
+def test_coalesced_job_publishes_full_size_jpeg(pipeline, stream, monkeypatch, options):
+    monkeypatch.setattr(Config, "STREAM_ENABLED", True)
+    job, _ = JobManager().submit(options)
+    assert job.wait(5) and job.status == "done"
+
+    frame = stream.latest()
+    assert frame is not None and frame["job_id"] == job.id
+    image = cv2.imdecode(frombuffer(frame["jpeg"], uint8), cv2.IMREAD_COLOR)
+    assert frame["jpeg"][:2] == b"\xff\xd8" and image.shape == job.panorama.shape
+
+
+def test_stream_disabled_is_unavailable(monkeypatch):
+    monkeypatch.setattr(Config, "STREAM_ENABLED", False)
+    app = Flask(__name__)
+    app.register_blueprint(routes.bp)
+
+    response = app.test_client().get("/stream")
+    assert response.status_code == 503
+    assert response.get_json()["error"] == "Streaming is disabled"
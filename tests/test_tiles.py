@@ -0,0 +1,84 @@
+"""
+Tile pyramid geometry, content ETags and 304 answers of the tile endpoint
+
+Run with: python -m pytest -q tests
+"""
+import os
+import sys
+import pytest
+from flask import Flask
+from numpy import random, uint8
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app import routes
+from app.tiles import TileCache, TilePyramid
+
+
+def panorama(seed=0):
+    return random.default_rng(seed).integers(0, 256, (300, 1000, 3), dtype=uint8)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = TileCache()
+    monkeypatch.setattr(routes, "get_tile_cache", lambda: cache)
+    return cache
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(routes.bp)
+    return app.test_client()
+
+
+def test_pyramid_levels_and_tiles():
+    pyramid = TilePyramid(panorama(), tile_size=256)
+
+    assert pyramid.max_level == 10
+    assert pyramid.level_size(10) == (1000, 300)
+    assert pyramid.level_size(9) == (500, 150)
+    assert pyramid.level_size(0) == (1, 1)
+    assert pyramid.level(9).shape == (150, 500, 3)
+
+    assert pyramid.tile(10, 3, 1).shape == (44, 232, 3)  # Edge tiles are cropped
+    assert pyramid.tile(10, 4, 0) is None
+    assert pyramid.tile(11, 0, 0) is None
+    assert pyramid.tile(-1, 0, 0) is None
+
+
+def test_etags_follow_tile_content(cache):
+    first = panorama()
+    second = first.copy()
+    second[:100, :100] = 0  # Only tile (0, 0) of the full level changes
+
+    a, b = cache.add("a", first), cache.add("b", second)
+    assert cache.tile(a, 10, 1, 0)[2] == cache.tile(b, 10, 1, 0)[2]
+    assert cache.tile(a, 10, 1, 0)[0] is cache.tile(b, 10, 1, 0)[0]  # Encoded once
+    assert cache.tile(a, 10, 0, 0)[2] != cache.tile(b, 10, 0, 0)[2]
+    assert cache.tile(a, 10, 0, 0) == cache.tile(a, 10, 0, 0)
+
+
+def test_unchanged_tile_answers_304(cache, client):
+    first = panorama()
+    cache.add("a", first)
+    response = client.get("/panoramas/latest/tiles/10/1/0")
+    assert response.status_code == 200 and response.mimetype == "image/jpeg"
+    etag = response.headers["ETag"]
+
+    changed = first.copy()
+    changed[:100, :100] = 0
+    cache.add("b", changed)
+    assert client.get("/panoramas/latest/tiles/10/1/0", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/panoramas/latest/tiles/10/0/0", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_descriptor_and_unknown_tiles(cache, client, monkeypatch):
+    monkeypatch.setattr(Config, "TILE_SIZE", 256)
+    cache.add("a", panorama())
+
+    descriptor = client.get("/panoramas/a/tiles").get_json()
+    assert descriptor["width"] == 1000 and descriptor["height"] == 300 and descriptor["max_level"] == 10
+    assert client.get("/panoramas/a/tiles/10/9/9").status_code == 404